@@ -1,6 +1,6 @@
 
 from django.contrib import admin
-from .models import User, Profile
+from .models import User, Profile, OutboxEmail
 
 @admin.register(User)
 class UserAdmin(admin.ModelAdmin):
@@ -8,6 +8,12 @@ class UserAdmin(admin.ModelAdmin):
     
 @admin.register(Profile) 
 class ProfileAdmin(admin.ModelAdmin):
-    list_display = ['full_name', 'blood_group', 'age', 'is_available_for_donation', 'last_donation_date']
+    list_display = ['full_name', 'blood_group', 'age', 'is_available_for_donation', 'last_donation_date', 'next_eligible_date']
     list_filter = ['blood_group', 'is_available_for_donation']
-    search_fields = ['full_name', 'user__email']
\ No newline at end of file
+    search_fields = ['full_name', 'user__email']
+
+@admin.register(OutboxEmail)
+class OutboxEmailAdmin(admin.ModelAdmin):
+    list_display = ['subject', 'recipient', 'status', 'attempts', 'next_attempt_at', 'sent_at']
+    list_filter = ['status']
+    search_fields = ['recipient', 'subject']
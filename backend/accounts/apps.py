@@ -1,6 +1,16 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class AccountsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'accounts'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        post_migrate.connect(self._ensure_search_index, sender=self)
+
+    def _ensure_search_index(self, using, **kwargs):
+        from django.db import connections
+        from .search import ensure_address_index
+        ensure_address_index(connections[using])
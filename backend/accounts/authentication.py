@@ -0,0 +1,103 @@
+"""
+Stateless JWT authentication.
+
+simplejwt's JWTAuthentication loads the user row on every request. The
+tokens issued at login carry the user's id, username, staff flags and roles
+as signed claims, so StatelessJWTAuthentication builds the user from those
+and a view only reaches the database for its own data. Views that really
+need the row (email, date_joined, ...) call get_full_user().
+
+The trade-off: a deactivated user keeps access until their access token
+expires (ACCESS_TOKEN_LIFETIME).
+"""
+import threading
+import time
+from collections import OrderedDict
+from django.utils.functional import cached_property
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+from .models import User
+from .utils import get_group_names, get_roles_version, remember_group_names
+
+# Full rows are kept per process for a few seconds, enough to absorb bursts
+FULL_USER_CACHE_SECONDS = 30
+FULL_USER_CACHE_SIZE = 1024
+
+_FULL_USER_FIELDS = tuple(field.attname for field in User._meta.concrete_fields)
+_full_user_rows = OrderedDict()
+_full_user_lock = threading.Lock()
+
+
+class ClaimsUser(TokenUser):
+    """A user built from token claims, with the integer pk the ORM expects"""
+
+    @cached_property
+    def id(self):
+        return int(self.token[api_settings.USER_ID_CLAIM])
+
+
+class StatelessJWTAuthentication(JWTAuthentication):
+    """JWT authentication that trusts the token's claims instead of loading the user"""
+
+    def get_user(self, validated_token):
+        if api_settings.USER_ID_CLAIM not in validated_token:
+            raise InvalidToken('Token contained no recognizable user identification')
+
+        user = ClaimsUser(validated_token)
+
+        # Roles in the token are only used while they are still current
+        roles = validated_token.get('roles')
+        if roles is not None and validated_token.get('roles_version') == get_roles_version(user.pk):
+            remember_group_names(user, roles)
+
+        return user
+
+
+def add_token_claims(token, user):
+    """Embed the claims StatelessJWTAuthentication reads back"""
+    # Version first, so the roles can only be newer than the version they carry
+    token['roles_version'] = get_roles_version(user.pk)
+    token['roles'] = list(get_group_names(user))
+    token['username'] = user.username
+    token['is_staff'] = user.is_staff
+    token['is_superuser'] = user.is_superuser
+    return token
+
+
+def get_full_user(user):
+    """The User row behind ``request.user``, from a short-lived in-process cache"""
+    if isinstance(user, User):
+        return user
+
+    now = time.monotonic()
+    with _full_user_lock:
+        entry = _full_user_rows.get(user.pk)
+        if entry is not None and entry[0] > now:
+            _full_user_rows.move_to_end(user.pk)
+            row = entry[1]
+        else:
+            row = None
+
+    if row is None:
+        row = User.objects.filter(pk=user.pk).values_list(*_FULL_USER_FIELDS).first()
+        if row is None:
+            raise AuthenticationFailed('User not found', code='user_not_found')
+        with _full_user_lock:
+            _full_user_rows[user.pk] = (now + FULL_USER_CACHE_SECONDS, row)
+            _full_user_rows.move_to_end(user.pk)
+            while len(_full_user_rows) > FULL_USER_CACHE_SIZE:
+                _full_user_rows.popitem(last=False)
+
+    # A fresh instance every time, so callers never share mutable state
+    full_user = User.from_db('default', _FULL_USER_FIELDS, row)
+    if not full_user.is_active:
+        raise AuthenticationFailed('User is inactive', code='user_inactive')
+    return full_user
+
+
+def forget_full_user(user_id):
+    with _full_user_lock:
+        _full_user_rows.pop(user_id, None)
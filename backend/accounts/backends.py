@@ -4,23 +4,24 @@ from django.contrib.auth import get_user_model
 User = get_user_model()
 
 class EmailOrUsernameModelBackend(ModelBackend):
+    """Email or username login, one lookup and one password hash per attempt"""
+
     def authenticate(self, request, username=None, password=None, **kwargs):
         if username is None:
+            username = kwargs.get(User.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+
+        # Emails contain "@", usernames never reach the email column
+        lookup = {'email': username} if "@" in username else {'username': username}
+        try:
+            user = User.objects.get(**lookup)
+        except User.DoesNotExist:
+            # Hash anyway so unknown accounts take as long as wrong passwords
+            User().set_password(password)
             return None
-            
-        # Try to find user by email first
-        if "@" in username:
-            try:
-                user = User.objects.get(email=username)
-            except User.DoesNotExist:
-                return None
-        else:
-            try:
-                user = User.objects.get(username=username)
-            except User.DoesNotExist:
-                return None
-        
+
         # Check password
         if user.check_password(password) and self.user_can_authenticate(user):
             return user
-        return None
\ No newline at end of file
+        return None
@@ -0,0 +1,25 @@
+"""Small helpers shared by the benchmark management commands"""
+import math
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(timings_ms):
+    """p50/p95/p99/mean/max of a list of millisecond timings"""
+    values = sorted(timings_ms)
+    if not values:
+        return {}
+    return {
+        'count': len(values),
+        'p50_ms': round(percentile(values, 50), 3),
+        'p95_ms': round(percentile(values, 95), 3),
+        'p99_ms': round(percentile(values, 99), 3),
+        'mean_ms': round(sum(values) / len(values), 3),
+        'max_ms': round(values[-1], 3),
+    }
@@ -0,0 +1,124 @@
+"""
+Refresh tokens with an in-memory Bloom filter in front of the blacklist.
+
+Almost every refresh token that comes in is not blacklisted, yet simplejwt
+checks the blacklist table for each one. BlacklistFilter keeps a Bloom
+filter of blacklisted jtis per process: a miss means "definitely not
+blacklisted" and skips the query, a hit falls through to the usual database
+check. The filter is built from the table on first use, tokens blacklisted
+in this process are added straight away, and rows written by other processes
+are picked up by an incremental sync at most BLACKLIST_SYNC_SECONDS later.
+"""
+import hashlib
+import math
+import threading
+import time
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from rest_framework_simplejwt.tokens import RefreshToken
+
+BLACKLIST_SYNC_SECONDS = 2
+BLACKLIST_FALSE_POSITIVE_RATE = 0.001
+BLACKLIST_MIN_CAPACITY = 10_000
+
+# Rows can commit out of id order, so each sync re-reads a few below the watermark
+_SYNC_OVERLAP = 500
+
+
+class BloomFilter:
+    """A fixed-size Bloom filter over strings"""
+
+    def __init__(self, capacity, false_positive_rate=BLACKLIST_FALSE_POSITIVE_RATE):
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(false_positive_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, value):
+        # Double hashing: k positions from two 64-bit halves of one digest
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hash_count))
+
+    def add(self, value):
+        # Re-adding a value leaves the bits alone, so only count new ones
+        if value in self:
+            return
+        for position in self._positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, value):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+
+class BlacklistFilter:
+    """The per-process Bloom filter of blacklisted jtis, kept in step with the table"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._filter = None
+        self._watermark = 0
+        self._synced_at = 0.0
+
+    def might_contain(self, jti):
+        self._sync()
+        return jti in self._filter
+
+    def add(self, jti):
+        self._sync()
+        with self._lock:
+            self._filter.add(jti)
+
+    def reset(self):
+        """Forget everything, the next check rebuilds from the table"""
+        with self._lock:
+            self._filter = None
+
+    def _sync(self):
+        if self._filter is not None and time.monotonic() - self._synced_at < BLACKLIST_SYNC_SECONDS:
+            return
+        with self._lock:
+            if self._filter is None:
+                self._rebuild()
+            elif time.monotonic() - self._synced_at >= BLACKLIST_SYNC_SECONDS:
+                self._load(BlacklistedToken.objects.filter(id__gt=self._watermark - _SYNC_OVERLAP))
+                # Grow once it fills up, which also drops jtis pruned since the last build
+                if self._filter.count > self._filter.capacity:
+                    self._rebuild()
+            self._synced_at = time.monotonic()
+
+    def _rebuild(self):
+        capacity = max(BLACKLIST_MIN_CAPACITY, 2 * BlacklistedToken.objects.count())
+        self._filter = BloomFilter(capacity)
+        self._watermark = 0
+        self._load(BlacklistedToken.objects.all())
+
+    def _load(self, queryset):
+        rows = queryset.order_by('id').values_list('id', 'token__jti')
+        for blacklisted_id, jti in rows.iterator(chunk_size=5000):
+            self._filter.add(jti)
+            self._watermark = max(self._watermark, blacklisted_id)
+
+
+blacklist_filter = BlacklistFilter()
+
+
+class FilteredRefreshToken(RefreshToken):
+    """RefreshToken that only asks the database about jtis the Bloom filter might hold"""
+
+    def check_blacklist(self):
+        if blacklist_filter.might_contain(self.payload[api_settings.JTI_CLAIM]):
+            super().check_blacklist()
+
+    def blacklist(self):
+        result = super().blacklist()
+        blacklist_filter.add(self.payload[api_settings.JTI_CLAIM])
+        return result
+
+
+class FilteredTokenRefreshSerializer(TokenRefreshSerializer):
+    token_class = FilteredRefreshToken
@@ -0,0 +1,64 @@
+from django.db.models import Case, When, Value, IntegerField
+from .models import Profile
+
+BLOOD_GROUPS = tuple(group for group, _ in Profile.BLOOD_GROUP_CHOICES)
+
+_ANTIGENS = {
+    'O': frozenset(),
+    'A': frozenset('A'),
+    'B': frozenset('B'),
+    'AB': frozenset('AB'),
+}
+
+
+def _can_donate(donor_group, recipient_group):
+    """ABO/Rh red cell compatibility"""
+    donor_abo, donor_rh = donor_group[:-1], donor_group[-1]
+    recipient_abo, recipient_rh = recipient_group[:-1], recipient_group[-1]
+    abo_ok = _ANTIGENS[donor_abo] <= _ANTIGENS[recipient_abo]
+    rh_ok = donor_rh == '-' or recipient_rh == '+'
+    return abo_ok and rh_ok
+
+
+# Groups each donor group can give to, e.g. O- -> all eight
+RECIPIENTS_FOR_DONOR = {
+    donor: tuple(recipient for recipient in BLOOD_GROUPS if _can_donate(donor, recipient))
+    for donor in BLOOD_GROUPS
+}
+
+# Compatible donor groups per recipient, most preferred first: the exact
+# match, then the least versatile groups, so universal O- donors come last
+DONORS_FOR_RECIPIENT = {
+    recipient: tuple(sorted(
+        (donor for donor in BLOOD_GROUPS if _can_donate(donor, recipient)),
+        key=lambda donor: (donor != recipient, len(RECIPIENTS_FOR_DONOR[donor]), BLOOD_GROUPS.index(donor)),
+    ))
+    for recipient in BLOOD_GROUPS
+}
+
+# Ready-made ORDER BY expressions, one per recipient group
+_MATCH_RANK = {
+    recipient: Case(
+        *[When(blood_group=donor, then=Value(rank)) for rank, donor in enumerate(donors)],
+        default=Value(len(donors)),
+        output_field=IntegerField(),
+    )
+    for recipient, donors in DONORS_FOR_RECIPIENT.items()
+}
+
+
+def normalize_blood_group(value):
+    """Clean up a blood group from a query string ('+' often arrives as a space)"""
+    if not value:
+        return None
+    value = value.strip().upper()
+    if value.endswith(('-', '+')):
+        return value
+    return value + '+' if value in _ANTIGENS else value
+
+
+def compatible_donors(queryset, recipient_group):
+    """Restrict a Profile queryset to donors who can give to ``recipient_group``"""
+    return queryset.filter(
+        blood_group__in=DONORS_FOR_RECIPIENT[recipient_group]
+    ).annotate(match_rank=_MATCH_RANK[recipient_group]).order_by('match_rank', 'id')
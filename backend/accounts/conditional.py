@@ -0,0 +1,118 @@
+"""
+Conditional GET (ETag / Last-Modified) for endpoints the frontend polls.
+
+Validators are worked out before anything is serialized: from the loaded rows
+for single objects and list pages, and from one aggregate query (row count
+plus the newest ``updated_at``) for unpaginated lists. When the client's copy is still current the view
+answers ``304 Not Modified`` with headers only.
+
+Every write path stamps ``updated_at``, including the queryset ``update()``
+calls in donations.py, so a newer timestamp or a changed count is what tells
+a list apart. Bodies also carry ``days_remaining``, so the date is part of
+every validator too.
+"""
+import hashlib
+from datetime import date
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+
+def make_etag(*parts):
+    """Strong ETag from anything with a stable repr()"""
+    return '"%s"' % hashlib.md5(repr(parts).encode(), usedforsecurity=False).hexdigest()
+
+
+def not_modified(request, etag, last_modified=None):
+    """The 304 response if the client's validators still match, else None"""
+    response = get_conditional_response(
+        request,
+        etag=etag,
+        last_modified=int(last_modified.timestamp()) if last_modified else None,
+    )
+    if response is not None:
+        set_validators(response, etag, last_modified)
+    return response
+
+
+def set_validators(response, etag, last_modified=None):
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    # Bodies differ per user, and clients must ask before reusing them
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ['Authorization'])
+    return response
+
+
+def queryset_version(queryset, fields=('updated_at',)):
+    """Row count and newest timestamps of ``fields``, in one query"""
+    aggregates = {f'max_{i}': Max(field) for i, field in enumerate(fields)}
+    state = queryset.order_by().aggregate(count=Count('pk'), **aggregates)
+    return (state['count'],) + tuple(state[f'max_{i}'] for i in range(len(fields)))
+
+
+class ConditionalGetMixin:
+    """
+    ETag support for ModelViewSet list and retrieve.
+
+    ``version_fields`` are the timestamps a serialized row depends on: its own
+    ``updated_at`` and those of any related rows whose fields it includes.
+    """
+    version_fields = ('updated_at',)
+
+    def get_object_version(self, instance):
+        if isinstance(instance, dict):
+            # values() rows carry the lookups themselves
+            return tuple(instance[field] for field in self.version_fields)
+        version = []
+        for field in self.version_fields:
+            value = instance
+            for name in field.split('__'):
+                value = getattr(value, name, None)
+            version.append(value)
+        return tuple(version)
+
+    def get_list_queryset(self):
+        return self.filter_queryset(self.get_queryset())
+
+    def render_rows(self, rows):
+        return self.get_serializer(rows, many=True).data
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.get_list_queryset()
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            # A page is only a few rows, already loaded, so they are the validator
+            version = [
+                (obj['id'] if isinstance(obj, dict) else obj.pk,) + self.get_object_version(obj) for obj in page
+            ], self.paginator.get_next_link()
+        else:
+            version = queryset_version(queryset, self.version_fields)
+        # Lists get no Last-Modified: a deleted row leaves the newest timestamp as it was
+        etag = make_etag('list', request.get_full_path(), request.user.pk, date.today(), version)
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+
+        if page is not None:
+            response = self.get_paginated_response(self.render_rows(page))
+        else:
+            response = Response(self.render_rows(queryset))
+        return set_validators(response, etag)
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        version = self.get_object_version(instance)
+        etag = make_etag(
+            'detail', type(instance).__name__, instance.pk, request.get_full_path(), request.user.pk,
+            date.today(), version,
+        )
+        last_modified = max((value for value in version if value), default=None)
+        response = not_modified(request, etag, last_modified)
+        if response is not None:
+            return response
+        serializer = self.get_serializer(instance)
+        return set_validators(Response(serializer.data), etag, last_modified)
+
@@ -0,0 +1,233 @@
+"""
+Pledging units of a blood request.
+
+Donors answering the same broadcast used to race: each read the request as
+pending, inserted a donation and saved it as accepted. Every change to
+``units_pledged`` now happens in a single conditional UPDATE, so the database
+decides who gets the remaining units. Any number of donors can pledge at
+once until the request is full and it can never be over-allocated.
+
+The batch transitions below do the same work for many rows with a fixed
+number of set-based UPDATEs. Callers pass rows they loaded with
+select_for_update() inside the surrounding transaction.
+"""
+from collections import defaultdict
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+from .models import Profile, BloodRequest, DonationHistory
+from .stats import invalidate_global_stats
+from .donor_cache import invalidate_donor_groups
+
+# Donations that still count towards a request
+LIVE_DONATIONS = ~Q(status='canceled')
+
+
+class PledgeError(Exception):
+    """A pledge that cannot be made, the message is meant for the donor"""
+
+
+def pledge_units(blood_request, donor_id, units=1):
+    """
+    Pledge ``units`` of ``blood_request`` and record the donor's pending donation.
+
+    The request stays pending until it is fully pledged, then becomes
+    accepted. Raises PledgeError if it is no longer pending, has fewer than
+    ``units`` left, or the donor already has a live donation for it.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        # Old column values on the right-hand side, so the status flips on the filling pledge
+        claimed = BloodRequest.objects.filter(
+            pk=blood_request.pk,
+            status='pending',
+            units_pledged__lte=F('units_needed') - units,
+        ).update(
+            units_pledged=F('units_pledged') + units,
+            status=Case(
+                When(units_pledged__gte=F('units_needed') - units, then=Value('accepted')),
+                default=Value('pending'),
+            ),
+            updated_at=now,
+        )
+        if not claimed:
+            current = (
+                BloodRequest.objects.filter(pk=blood_request.pk)
+                .values('status', 'units_needed', 'units_pledged')
+                .first()
+            )
+            if current is None or current['status'] != 'pending':
+                raise PledgeError('This request is no longer available')
+            remaining = current['units_needed'] - current['units_pledged']
+            raise PledgeError(f'Only {remaining} unit(s) are still needed for this request')
+
+        # Queryset updates skip the post_save signal that clears the dashboard numbers
+        transaction.on_commit(invalidate_global_stats)
+        try:
+            with transaction.atomic():
+                return DonationHistory.objects.create(
+                    donor_id=donor_id,
+                    recipient_id=blood_request.requester_id,
+                    blood_request_id=blood_request.pk,
+                    units_donated=units,
+                    status='pending',
+                )
+        except IntegrityError:
+            # Raising rolls the pledge back with it
+            raise PledgeError('You have already accepted this request')
+
+
+def release_units(donation):
+    """
+    Cancel a live donation and hand its units back to the request, which
+    goes back to pending unless it was canceled. Returns False if the
+    donation was already canceled.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        canceled = DonationHistory.objects.filter(LIVE_DONATIONS, pk=donation.pk).update(
+            status='canceled',
+            updated_at=now,
+        )
+        if not canceled:
+            return False
+        BloodRequest.objects.filter(pk=donation.blood_request_id).update(
+            units_pledged=Greatest(F('units_pledged') - donation.units_donated, 0),
+            status=Case(When(status='canceled', then=F('status')), default=Value('pending')),
+            updated_at=now,
+        )
+        transaction.on_commit(invalidate_global_stats)
+    donation.status = 'canceled'
+    return True
+
+
+def _live_units():
+    """Units of the outer request's live donations, for Subquery()"""
+    return (
+        DonationHistory.objects.filter(LIVE_DONATIONS, blood_request=OuterRef('pk'))
+        .values('blood_request')
+        .annotate(total=Sum('units_donated'))
+        .values('total')
+    )
+
+
+def _fulfilled(queryset):
+    """Open requests whose confirmed donations cover every unit"""
+    confirmed = (
+        DonationHistory.objects.filter(blood_request=OuterRef('pk'), status='confirmed')
+        .values('blood_request')
+        .annotate(total=Sum('units_donated'))
+        .values('total')
+    )
+    return queryset.filter(
+        status__in=['pending', 'accepted'],
+        units_needed__lte=Coalesce(Subquery(confirmed), 0),
+    )
+
+
+def complete_if_fulfilled(blood_request_id):
+    """Mark the request completed once confirmed donations cover every unit"""
+    completed = _fulfilled(BloodRequest.objects.filter(pk=blood_request_id)).update(
+        status='completed', updated_at=timezone.now()
+    )
+    if completed:
+        transaction.on_commit(invalidate_global_stats)
+    return completed
+
+
+def complete_fulfilled(blood_request_ids):
+    """complete_if_fulfilled for many requests, returns the ones it completed"""
+    completed = list(_fulfilled(BloodRequest.objects.filter(pk__in=blood_request_ids)).select_for_update())
+    if completed:
+        BloodRequest.objects.filter(pk__in=[r.pk for r in completed]).update(
+            status='completed', updated_at=timezone.now()
+        )
+        for blood_request in completed:
+            blood_request.status = 'completed'
+        transaction.on_commit(invalidate_global_stats)
+    return completed
+
+
+def cancel_requests(blood_requests):
+    """
+    Cancel open requests and their pending donations, two UPDATEs for any
+    number. ``units_pledged`` drops to the confirmed units the requests still hold.
+    """
+    ids = [r.pk for r in blood_requests]
+    if not ids:
+        return
+    now = timezone.now()
+    DonationHistory.objects.filter(blood_request_id__in=ids, status='pending').update(status='canceled', updated_at=now)
+    BloodRequest.objects.filter(pk__in=ids).exclude(status='completed').update(
+        status='canceled', units_pledged=Coalesce(Subquery(_live_units()), 0), updated_at=now,
+    )
+    for blood_request in blood_requests:
+        blood_request.status = 'canceled'
+    transaction.on_commit(invalidate_global_stats)
+
+
+def confirm_donations(donations):
+    """
+    Confirm pending donations, completing fulfilled requests and starting the
+    donors' waiting period as confirm_donation does. Returns the completed requests.
+    """
+    if not donations:
+        return []
+    now = timezone.now()
+    today = timezone.localdate()
+    DonationHistory.objects.filter(pk__in=[d.pk for d in donations], status='pending').update(
+        status='confirmed', donation_date=now, updated_at=now,
+    )
+    for donation in donations:
+        donation.status = 'confirmed'
+        donation.donation_date = now
+    completed = complete_fulfilled({d.blood_request_id for d in donations})
+
+    # Derived next_eligible_date is set here too, update() skips Profile.save()
+    donor_profiles = Profile.objects.filter(user_id__in={d.donor_id for d in donations})
+    groups = set(donor_profiles.order_by().values_list('blood_group', flat=True).distinct())
+    donor_profiles.update(
+        last_donation_date=today,
+        next_eligible_date=Profile.next_eligible_after(today),
+        is_available_for_donation=False,
+        updated_at=now,
+    )
+    invalidate_donor_groups(groups)
+    transaction.on_commit(invalidate_global_stats)
+    return completed
+
+
+def release_donations(donations):
+    """
+    release_units for many live donations: one UPDATE cancels them, one more
+    hands every request its units back. Returns the requests now pending.
+    """
+    if not donations:
+        return []
+    now = timezone.now()
+    DonationHistory.objects.filter(LIVE_DONATIONS, pk__in=[d.pk for d in donations]).update(
+        status='canceled', updated_at=now,
+    )
+    released = defaultdict(int)
+    for donation in donations:
+        donation.status = 'canceled'
+        released[donation.blood_request_id] += donation.units_donated
+    BloodRequest.objects.filter(pk__in=released).update(
+        units_pledged=Greatest(
+            F('units_pledged') - Case(*[When(pk=pk, then=Value(units)) for pk, units in released.items()], default=Value(0)),
+            0,
+        ),
+        status=Case(When(status='canceled', then=F('status')), default=Value('pending')),
+        updated_at=now,
+    )
+    transaction.on_commit(invalidate_global_stats)
+    return list(BloodRequest.objects.filter(pk__in=released, status='pending'))
+
+
+def recalculate_units_pledged(queryset=None):
+    """Recompute ``units_pledged`` from the live donations (repairs drift after manual edits)"""
+    queryset = BloodRequest.objects.all() if queryset is None else queryset
+    updated = queryset.update(units_pledged=Coalesce(Subquery(_live_units()), 0))
+    transaction.on_commit(invalidate_global_stats)
+    return updated
@@ -0,0 +1,87 @@
+"""
+Response cache for the public available_donors endpoint.
+
+Each entry is keyed by the normalized filters and today's date (eligibility
+changes at midnight), and stores the generation of every blood group the
+filters can return next to the donor list. Profile saves and deletes, and
+bulk writes, bump the generations of the groups they touched, so only lists
+that could contain those donors are rebuilt; the rest keep being served
+without a query.
+
+When an entry is out of date one caller rebuilds it while the others keep
+getting the previous list for those few milliseconds, so a burst of
+anonymous traffic right after a change still reaches the database once.
+"""
+import hashlib
+import uuid
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from .compatibility import BLOOD_GROUPS, DONORS_FOR_RECIPIENT
+from .search import address_tokens
+
+DONOR_GENERATION_KEY = 'accounts:donors:generation:{blood_group}'
+DONOR_RESPONSE_KEY = 'accounts:donors:response:{digest}'
+DONOR_RESPONSE_TIMEOUT = 600
+# How long other callers serve the previous list while one rebuilds it
+DONOR_REBUILD_LOCK_TIMEOUT = 10
+
+
+def donor_groups(blood_group=None, compatible_with=None):
+    """Blood groups a filtered donor list can contain"""
+    groups = (blood_group,) if blood_group else BLOOD_GROUPS
+    if compatible_with:
+        groups = tuple(group for group in groups if group in DONORS_FOR_RECIPIENT.get(compatible_with, ()))
+    return groups
+
+
+def get_generations(groups):
+    """Current generation per group, created on first use"""
+    keys = [DONOR_GENERATION_KEY.format(blood_group=group) for group in groups]
+    found = cache.get_many(keys)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        # Random, so entries from before a cache flush never match
+        for key in missing:
+            cache.add(key, uuid.uuid4().hex, None)
+        found.update(cache.get_many(missing))
+    return tuple(found.get(key) for key in keys)
+
+
+def bump_donor_generations(groups=BLOOD_GROUPS):
+    cache.set_many({
+        DONOR_GENERATION_KEY.format(blood_group=group): uuid.uuid4().hex
+        for group in set(groups) if group
+    }, None)
+
+
+def invalidate_donor_groups(groups=BLOOD_GROUPS):
+    """Bump once the surrounding transaction commits, so no reader caches the old rows under the new generation"""
+    groups = set(groups)
+    transaction.on_commit(lambda: bump_donor_generations(groups))
+
+
+def get_available_donors(build, blood_group=None, compatible_with=None, location=None):
+    """
+    ``build()``'s result for these (already normalized) filters, from the
+    cache while no donor it could include has changed.
+    """
+    location = ' '.join(address_tokens(location)) if location else None
+    params = (timezone.localdate().isoformat(), blood_group, compatible_with, location)
+    key = DONOR_RESPONSE_KEY.format(digest=hashlib.md5(repr(params).encode(), usedforsecurity=False).hexdigest())
+    generations = get_generations(donor_groups(blood_group, compatible_with))
+
+    entry = cache.get(key)
+    if entry is not None and entry[0] == generations:
+        return entry[1]
+
+    lock_key = f'{key}:lock'
+    if entry is not None and not cache.add(lock_key, 1, DONOR_REBUILD_LOCK_TIMEOUT):
+        return entry[1]
+    try:
+        donors = build()
+        cache.set(key, (generations, donors), DONOR_RESPONSE_TIMEOUT)
+    finally:
+        if entry is not None:
+            cache.delete(lock_key)
+    return donors
@@ -0,0 +1,101 @@
+"""
+Real-time blood request events, pushed to dashboards over Server-Sent Events.
+
+View actions publish request.created / accepted / canceled / completed /
+reopened events once their transaction commits. The broker fans them out to
+subscribers, each an asyncio queue read by one open event stream, so an idle
+dashboard costs a parked coroutine and no database queries.
+
+LocalBroker only reaches streams served by the same process. Point
+settings.EVENTS_BROKER at another class with the same publish() / subscribe()
+interface (Redis pub/sub, say) to fan out across workers.
+"""
+import asyncio
+import threading
+from functools import lru_cache
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+DEFAULT_BROKER = 'accounts.events.LocalBroker'
+
+# Events a slow client has not read yet; beyond this new ones are dropped for it
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+class Subscription:
+    """One subscriber's queue, filled from any thread and read on its event loop"""
+
+    def __init__(self, broker, loop):
+        self.broker = broker
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+
+    def deliver(self, event):
+        # Called on the subscriber's loop
+        if not self.queue.full():
+            self.queue.put_nowait(event)
+
+    async def get(self):
+        return await self.queue.get()
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class LocalBroker:
+    """In-process pub/sub, publishers may run in any thread"""
+
+    def __init__(self):
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self):
+        """Must be called from the event loop that will read the subscription"""
+        subscription = Subscription(self, asyncio.get_running_loop())
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def publish(self, event):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, event)
+            except RuntimeError:
+                # The subscriber's loop is gone
+                self.unsubscribe(subscription)
+
+
+@lru_cache(maxsize=None)
+def get_broker():
+    return import_string(getattr(settings, 'EVENTS_BROKER', DEFAULT_BROKER))()
+
+
+def request_event(kind, blood_request):
+    """The event for a change to ``blood_request``, built without a query"""
+    return {
+        'type': f'request.{kind}',
+        'request': {
+            'id': blood_request.id,
+            'requester_id': blood_request.requester_id,
+            'blood_group': blood_request.blood_group,
+            'urgency': blood_request.urgency,
+            'status': blood_request.status,
+            'units_needed': blood_request.units_needed,
+            'units_pledged': blood_request.units_pledged,
+            'hospital_name': blood_request.hospital_name,
+            'needed_by_date': blood_request.needed_by_date.isoformat() if blood_request.needed_by_date else None,
+        },
+    }
+
+
+def publish_request_event(kind, blood_request):
+    """Publish once the surrounding transaction commits, never for rolled back changes"""
+    event = request_event(kind, blood_request)
+    transaction.on_commit(lambda: get_broker().publish(event))
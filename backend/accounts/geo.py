@@ -0,0 +1,126 @@
+import csv
+import math
+import re
+from functools import lru_cache
+from pathlib import Path
+
+GAZETTEER_PATH = Path(__file__).resolve().parent / 'data' / 'gazetteer.csv'
+
+# Grid cells are GRID_CELL_DEGREES on a side (~5.5 km north-south)
+GRID_CELL_DEGREES = 0.05
+_GRID_COLUMNS = int(round(360 / GRID_CELL_DEGREES))
+
+EARTH_RADIUS_KM = 6371.0088
+_KM_PER_DEGREE = 111.32
+
+# Longest place name (in words) looked up in the gazetteer
+_MAX_NAME_WORDS = 3
+
+
+def _words(text):
+    return re.findall(r'[a-z]+', text.lower())
+
+
+@lru_cache(maxsize=1)
+def load_gazetteer():
+    """Place name -> (latitude, longitude), read once from the local CSV"""
+    places = {}
+    with open(GAZETTEER_PATH, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            key = ' '.join(_words(row['name']))
+            places[key] = (float(row['latitude']), float(row['longitude']))
+    return places
+
+
+def geocode(address):
+    """
+    Resolve a free-text address to coordinates using the local gazetteer.
+
+    The longest matching place name wins, and between names of equal length
+    the earliest one, since addresses here run from specific to general
+    ("House 12, Mirpur-10, Dhaka" resolves to Mirpur). Returns None when
+    nothing matches.
+    """
+    if not address:
+        return None
+    places = load_gazetteer()
+    words = _words(address)
+    for size in range(_MAX_NAME_WORDS, 0, -1):
+        for start in range(len(words) - size + 1):
+            location = places.get(' '.join(words[start:start + size]))
+            if location:
+                return location
+    return None
+
+
+def _cell_coords(latitude, longitude):
+    row = int(math.floor((latitude + 90) / GRID_CELL_DEGREES))
+    col = int(math.floor((longitude + 180) / GRID_CELL_DEGREES)) % _GRID_COLUMNS
+    return row, col
+
+
+def grid_cell(latitude, longitude):
+    """Integer id of the grid cell containing a point"""
+    if latitude is None or longitude is None:
+        return None
+    row, col = _cell_coords(latitude, longitude)
+    return row * _GRID_COLUMNS + col
+
+
+def ring_cells(latitude, longitude, ring):
+    """Cell ids exactly ``ring`` cells away (Chebyshev) from the point's cell"""
+    row, col = _cell_coords(latitude, longitude)
+    if ring == 0:
+        return [row * _GRID_COLUMNS + col]
+    cells = []
+    for d_row in range(-ring, ring + 1):
+        step = 1 if abs(d_row) == ring else 2 * ring
+        for d_col in range(-ring, ring + 1, step):
+            cells.append((row + d_row) * _GRID_COLUMNS + (col + d_col) % _GRID_COLUMNS)
+    return cells
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def _min_cell_width_km(latitude, ring):
+    """Narrowest cell side within ``ring`` cells of ``latitude``"""
+    widest_latitude = min(89.0, abs(latitude) + (ring + 1) * GRID_CELL_DEGREES)
+    return GRID_CELL_DEGREES * _KM_PER_DEGREE * math.cos(math.radians(widest_latitude))
+
+
+def nearest(queryset, latitude, longitude, k, fields, max_distance_km=100):
+    """
+    The ``k`` rows of ``queryset`` closest to a point, nearest first.
+
+    Rows are fetched ring by ring around the point's grid cell with an
+    indexed ``grid_cell IN (...)`` filter and only those candidates get an
+    exact haversine distance. Searching stops once the k-th candidate is
+    closer than anything an unvisited ring could hold. Each returned dict
+    has the requested ``fields`` plus ``distance_km``.
+    """
+    fields = tuple(fields) + ('latitude', 'longitude')
+    candidates = []
+    ring = 0
+    while True:
+        rows = queryset.filter(grid_cell__in=ring_cells(latitude, longitude, ring)).values(*fields)
+        for row in rows:
+            row['distance_km'] = haversine_km(latitude, longitude, row['latitude'], row['longitude'])
+            candidates.append(row)
+        candidates.sort(key=lambda row: row['distance_km'])
+
+        # Anything outside the rings searched so far is at least this far away
+        searched_km = ring * _min_cell_width_km(latitude, ring)
+        if len(candidates) >= k and candidates[k - 1]['distance_km'] <= searched_km:
+            break
+        if searched_km >= max_distance_km:
+            break
+        ring += 1
+
+    return [row for row in candidates[:k] if row['distance_km'] <= max_distance_km]
@@ -0,0 +1,216 @@
+"""
+Bulk import of donors and blood requests from CSV or JSON Lines files.
+
+Rows are read lazily and handled a chunk at a time: validated with the same
+serializers the API uses, checked for uniqueness with one query per chunk,
+then written with bulk_create inside a transaction per chunk. Memory use
+depends on the chunk size, not the file size.
+"""
+import csv
+import json
+import re
+from itertools import islice
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from rest_framework import serializers
+from rest_framework.validators import UniqueValidator
+from .models import User, Profile, BloodRequest
+from .donor_cache import invalidate_donor_groups
+from .serializers import UserRegisterSerializer, ProfileSerializer, BloodRequestSerializer
+
+ROLE_GROUPS = {'admin': 'Admin', 'donor': 'Donor', 'recipient': 'Recipient'}
+
+
+def read_rows(path, file_format=None):
+    """
+    ``(line_number, row)`` pairs from a CSV or JSONL file, read one row at a
+    time. The file is opened right away, so a missing one raises OSError here
+    rather than on the first row.
+    """
+    file_format = file_format or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+    return _iter_rows(open(path, newline='', encoding='utf-8'), file_format)
+
+
+def _iter_rows(f, file_format):
+    with f:
+        if file_format == 'csv':
+            reader = csv.DictReader(f)
+            for row in reader:
+                # Empty cells mean "not given", so model defaults apply
+                yield reader.line_num, {key: value for key, value in row.items() if value not in ('', None)}
+        else:
+            for line_number, line in enumerate(f, start=1):
+                if line.strip():
+                    try:
+                        yield line_number, json.loads(line)
+                    except json.JSONDecodeError as e:
+                        yield line_number, {'__error__': f'Invalid JSON: {e}'}
+
+
+def chunked(rows, size):
+    rows = iter(rows)
+    while chunk := list(islice(rows, size)):
+        yield chunk
+
+
+def _without_unique_validators(serializer):
+    # Uniqueness is checked once per chunk instead of with a query per row
+    for field in serializer.fields.values():
+        field.validators = [v for v in field.validators if not isinstance(v, UniqueValidator)]
+    return serializer
+
+
+class ImportUserSerializer(UserRegisterSerializer):
+    # Imported donors usually have no password yet, they get an unusable one
+    password = serializers.CharField(write_only=True, min_length=6, required=False)
+
+
+def _validate(serializer, row):
+    if '__error__' in row:
+        return None, {'row': [row['__error__']]}
+    try:
+        return serializer.run_validation(row), None
+    except serializers.ValidationError as e:
+        return None, e.detail
+
+
+def _parse_roles(value):
+    if isinstance(value, str):
+        value = re.split(r'[;,|\s]+', value.strip())
+    return [role.lower() for role in value if role]
+
+
+class DonorImporter:
+    """Creates users, their profiles and role memberships"""
+
+    def __init__(self, default_roles=('donor',), is_active=True):
+        self.default_roles = list(default_roles)
+        self.is_active = is_active
+        self.user_serializer = _without_unique_validators(ImportUserSerializer())
+        self.profile_serializer = _without_unique_validators(ProfileSerializer())
+        self.group_ids = dict(Group.objects.filter(name__in=ROLE_GROUPS.values()).values_list('name', 'id'))
+        self.unusable_password = make_password(None)
+
+    def import_chunk(self, chunk):
+        """Returns ``(created, failures)``, failures being ``(line_number, errors)``"""
+        failures = []
+        valid = []
+        for line_number, row in chunk:
+            row = dict(row)
+            row.setdefault('roles', self.default_roles)
+            row['roles'] = _parse_roles(row['roles'])
+            user_data, user_errors = _validate(self.user_serializer, row)
+            profile_data, profile_errors = _validate(self.profile_serializer, row)
+            if user_errors or profile_errors:
+                failures.append((line_number, {**(user_errors or {}), **(profile_errors or {})}))
+            else:
+                valid.append((line_number, user_data, profile_data))
+
+        valid, duplicates = self._drop_duplicates(valid)
+        failures.extend(duplicates)
+        if not valid:
+            return 0, failures
+
+        try:
+            with transaction.atomic():
+                self._create(valid)
+        except IntegrityError as e:
+            # Lost a race with another writer; report the chunk rather than half of it
+            failures.extend((line_number, {'row': [f'Not imported: {e}']}) for line_number, _, _ in valid)
+            return 0, failures
+        return len(valid), failures
+
+    def _drop_duplicates(self, valid):
+        usernames = {user_data['username'] for _, user_data, _ in valid}
+        emails = {user_data['email'] for _, user_data, _ in valid}
+        taken = User.objects.filter(Q(username__in=usernames) | Q(email__in=emails)).values_list('username', 'email')
+        taken_usernames = {username for username, _ in taken}
+        taken_emails = {email for _, email in taken}
+
+        kept, failures = [], []
+        for line_number, user_data, profile_data in valid:
+            errors = {}
+            if user_data['username'] in taken_usernames:
+                errors['username'] = ['A user with that username already exists.']
+            if user_data['email'] in taken_emails:
+                errors['email'] = ['A user with that email already exists.']
+            if errors:
+                failures.append((line_number, errors))
+                continue
+            # Later rows with the same username or email in this chunk are duplicates too
+            taken_usernames.add(user_data['username'])
+            taken_emails.add(user_data['email'])
+            kept.append((line_number, user_data, profile_data))
+        return kept, failures
+
+    def _create(self, valid):
+        users = User.objects.bulk_create([
+            User(
+                username=user_data['username'],
+                email=user_data['email'],
+                password=make_password(user_data['password']) if 'password' in user_data else self.unusable_password,
+                is_active=self.is_active,
+            )
+            for _, user_data, _ in valid
+        ])
+
+        profiles = []
+        memberships = []
+        membership = User.groups.through
+        for user, (_, _, profile_data) in zip(users, valid):
+            profile_data = dict(profile_data)
+            for role in profile_data.pop('roles'):
+                group_id = self.group_ids.get(ROLE_GROUPS.get(role))
+                if group_id:
+                    memberships.append(membership(user_id=user.id, group_id=group_id))
+            profile = Profile(user_id=user.id, **profile_data)
+            profile.update_derived_fields()
+            profiles.append(profile)
+
+        Profile.objects.bulk_create(profiles)
+        membership.objects.bulk_create(memberships)
+        # bulk_create sends no signals
+        invalidate_donor_groups({profile.blood_group for profile in profiles})
+
+
+class BloodRequestImporter:
+    """Creates blood requests for requesters given by username or email"""
+
+    def __init__(self, default_requester=None):
+        self.default_requester = default_requester
+        self.serializer = BloodRequestSerializer()
+
+    def import_chunk(self, chunk):
+        failures = []
+        valid = []
+        for line_number, row in chunk:
+            data, errors = _validate(self.serializer, row)
+            requester = row.get('requester') or self.default_requester
+            if not requester and not errors:
+                errors = {**(errors or {}), 'requester': ['This field is required.']}
+            if errors:
+                failures.append((line_number, errors))
+            else:
+                valid.append((line_number, requester, data))
+
+        names = {requester for _, requester, _ in valid}
+        requester_ids = {}
+        for user_id, username, email in User.objects.filter(
+            Q(username__in=names) | Q(email__in=names)
+        ).values_list('id', 'username', 'email'):
+            requester_ids[username] = requester_ids[email] = user_id
+
+        requests = []
+        for line_number, requester, data in valid:
+            if requester not in requester_ids:
+                failures.append((line_number, {'requester': [f'Unknown user {requester!r}']}))
+                continue
+            blood_request = BloodRequest(requester_id=requester_ids[requester], **data)
+            blood_request.update_derived_fields()
+            requests.append(blood_request)
+
+        with transaction.atomic():
+            BloodRequest.objects.bulk_create(requests)
+        return len(requests), failures
@@ -0,0 +1,177 @@
+import json
+import random
+import threading
+from collections import Counter, defaultdict
+from time import perf_counter
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client
+from accounts.benchmarks import summarize
+from accounts.compatibility import BLOOD_GROUPS
+from accounts.metrics import QueryTimer
+from accounts.models import User, BloodRequest, DonationHistory
+from accounts.seeding import seed_donors, seed_requests, seed_donations
+
+PREFIX = 'bench-api-'
+PASSWORD = 'bench-api-password'
+
+
+class Command(BaseCommand):
+    help = 'Drive the real API routes from concurrent clients and report latency, throughput and queries as JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=8, help='Concurrent clients, each logs in as its own user')
+        parser.add_argument('--iterations', type=int, default=20, help='Rounds of the endpoint mix per client')
+        parser.add_argument('--donors', type=int, default=1000, help='Donors to seed')
+        parser.add_argument('--requesters', type=int, default=100, help='Requesters to seed, clients log in as these')
+        parser.add_argument('--requests', type=int, default=2000, help='Blood requests to seed')
+        parser.add_argument('--donations', type=int, default=2000, help='Donations to seed')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed for the data and the clients')
+        parser.add_argument('--host', default='localhost', help='Host header to send, must be in ALLOWED_HOSTS')
+        parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded rows')
+
+    def handle(self, *args, **options):
+        if connection.vendor == 'sqlite' and connection.settings_dict['NAME'] in ('', ':memory:'):
+            raise CommandError('Needs a file or server database, client threads cannot share an in-memory one')
+        if options['clients'] > options['requesters']:
+            raise CommandError('--clients cannot exceed --requesters, each client logs in as a requester')
+        if User.objects.filter(username__startswith=PREFIX).exists():
+            raise CommandError(f'Users named {PREFIX}* are left from a --keep run, delete them first')
+
+        rng = random.Random(options['seed'])
+        self.stdout.write('Seeding...')
+        donor_ids = seed_donors(options['donors'], prefix=PREFIX, rng=rng, password=PASSWORD)
+        requester_ids = seed_donors(
+            options['requesters'], prefix=f'{PREFIX}r-', rng=rng, password=PASSWORD, roles=('Donor', 'Recipient'),
+        )
+        request_ids = seed_requests(requester_ids, options['requests'], rng=rng)
+        seed_donations(donor_ids + requester_ids, request_ids, options['donations'], rng=rng)
+
+        try:
+            plans = self.plan(requester_ids[:options['clients']], request_ids)
+            results, elapsed = self.run(plans, options)
+        finally:
+            if not options['keep']:
+                User.objects.filter(username__startswith=PREFIX).delete()
+
+        if not results['login']['status'][200]:
+            codes = ', '.join(f'{code} x{n}' for code, n in sorted(results['login']['status'].items()))
+            raise CommandError(
+                f'No client could log in ({codes or "no responses"}), check that --host {options["host"]} '
+                'is in ALLOWED_HOSTS and the login throttle rates'
+            )
+
+        report = self.report(results, elapsed, options)
+        output = json.dumps(report, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+            self.stdout.write(self.style.SUCCESS(f"Report written to {options['output']}"))
+        else:
+            self.stdout.write(output)
+
+    def plan(self, client_ids, request_ids):
+        """Per client: login email, requests it may accept, donations it may confirm"""
+        emails = dict(User.objects.filter(id__in=client_ids).values_list('id', 'email'))
+        pending = list(BloodRequest.objects.filter(
+            id__gte=min(request_ids), id__lte=max(request_ids), status='pending',
+        ).values_list('id', 'requester_id'))
+        to_confirm = defaultdict(list)
+        for donation_id, recipient_id in DonationHistory.objects.filter(
+            recipient_id__in=client_ids, status='pending',
+        ).values_list('id', 'recipient_id'):
+            to_confirm[recipient_id].append(donation_id)
+        return [
+            {
+                'email': emails[user_id],
+                'accept': [pk for pk, requester_id in pending if requester_id != user_id],
+                'confirm': to_confirm[user_id],
+            }
+            for user_id in client_ids
+        ]
+
+    def run(self, plans, options):
+        barrier = threading.Barrier(len(plans))
+        lock = threading.Lock()
+        results = defaultdict(lambda: {'ms': [], 'queries': [], 'status': Counter()})
+
+        def worker(index, plan):
+            rng = random.Random(options['seed'] + index)
+            # Own address per client, as real clients have, so the per-IP login throttle does not trip
+            client = Client(HTTP_HOST=options['host'], REMOTE_ADDR=f'10.{index // 65536}.{index // 256 % 256}.{index % 256}')
+            local = defaultdict(lambda: {'ms': [], 'queries': [], 'status': Counter()})
+
+            def call(name, method, path, data=None):
+                timer = QueryTimer()
+                started = perf_counter()
+                with connection.execute_wrapper(timer):
+                    response = getattr(client, method)(path, data, content_type='application/json')
+                sample = local[name]
+                sample['ms'].append((perf_counter() - started) * 1000)
+                sample['queries'].append(timer.count)
+                sample['status'][response.status_code] += 1
+                return response
+
+            try:
+                barrier.wait()
+                response = call('login', 'post', '/api/accounts/login/', {'email': plan['email'], 'password': PASSWORD})
+                if response.status_code != 200:
+                    return
+                client.defaults['HTTP_AUTHORIZATION'] = f"Bearer {response.json()['access']}"
+
+                accept = list(plan['accept'])
+                rng.shuffle(accept)
+                confirm = list(plan['confirm'])
+                for _ in range(options['iterations']):
+                    call('dashboard_stats', 'get', '/api/accounts/dashboard-stats/')
+                    call('available_donors', 'get', f'/api/accounts/available-donors/?blood_group={rng.choice(BLOOD_GROUPS)}')
+                    call('blood_requests_list', 'get', '/api/accounts/blood-requests/?status=pending&page_size=50')
+                    if accept:
+                        call('accept_request', 'post', f'/api/accounts/blood-requests/{accept.pop()}/accept_request/')
+                    if confirm:
+                        call('confirm_donation', 'post', f'/api/accounts/donation-history/{confirm.pop()}/confirm_donation/')
+            finally:
+                connections.close_all()
+                with lock:
+                    for name, sample in local.items():
+                        results[name]['ms'].extend(sample['ms'])
+                        results[name]['queries'].extend(sample['queries'])
+                        results[name]['status'].update(sample['status'])
+
+        threads = [threading.Thread(target=worker, args=(i, plan)) for i, plan in enumerate(plans)]
+        started = perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results, perf_counter() - started
+
+    def report(self, results, elapsed, options):
+        endpoints = {}
+        for name, sample in sorted(results.items()):
+            count = len(sample['ms'])
+            endpoints[name] = {
+                'requests': count,
+                'throughput_rps': round(count / elapsed, 1),
+                'latency': summarize(sample['ms']),
+                'queries_per_request': {
+                    'mean': round(sum(sample['queries']) / count, 2),
+                    'max': max(sample['queries']),
+                },
+                # Business rejections (4xx on accept) are expected, 5xx are not
+                'status': {str(code): n for code, n in sorted(sample['status'].items())},
+                'server_errors': sum(n for code, n in sample['status'].items() if code >= 500),
+            }
+        total = sum(endpoint['requests'] for endpoint in endpoints.values())
+        return {
+            'database': connection.vendor,
+            'config': {
+                key: options[key]
+                for key in ('clients', 'iterations', 'donors', 'requesters', 'requests', 'donations', 'seed')
+            },
+            'elapsed_s': round(elapsed, 3),
+            'requests': total,
+            'throughput_rps': round(total / elapsed, 1),
+            'endpoints': endpoints,
+        }
@@ -0,0 +1,121 @@
+import json
+import random
+import threading
+from datetime import timedelta
+from time import perf_counter
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, OperationalError
+from django.db.models import Sum
+from django.utils import timezone
+from accounts.benchmarks import summarize
+from accounts.donations import PledgeError, pledge_units
+from accounts.models import User, BloodRequest, DonationHistory
+from accounts.seeding import seed_donors
+
+PREFIX = 'bench-accept-'
+
+
+class Command(BaseCommand):
+    help = 'Fire many simultaneous accepts at one request and check it is never over-allocated'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--donors', type=int, default=500, help='Donors, each accepts once')
+        parser.add_argument('--units', type=int, default=100, help='Units needed by the request')
+        parser.add_argument('--threads', type=int, default=50, help='Concurrent workers, each with its own connection')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed')
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded rows')
+
+    def handle(self, *args, **options):
+        if connection.vendor == 'sqlite' and connection.settings_dict['NAME'] in ('', ':memory:'):
+            raise CommandError('Needs a file or server database, worker threads cannot share an in-memory one')
+
+        # Workers use their own connections, so the data has to be committed
+        self.stdout.write(f"Seeding {options['donors']} donors...")
+        donor_ids = seed_donors(options['donors'] + 1, prefix=PREFIX, rng=random.Random(options['seed']))
+        requester_id = donor_ids.pop()
+        blood_request = BloodRequest.objects.create(
+            requester_id=requester_id,
+            patient_name='Benchmark patient',
+            blood_group='O+',
+            units_needed=options['units'],
+            urgency='critical',
+            hospital_name='Dhaka Medical College Hospital',
+            hospital_address='Bakshibazar, Dhaka',
+            contact_phone='01700000000',
+            needed_by_date=timezone.now() + timedelta(days=1),
+        )
+
+        try:
+            results = self.run_accepts(blood_request, donor_ids, options['threads'])
+            report = self.verify(blood_request, results)
+        finally:
+            if not options['keep']:
+                User.objects.filter(username__startswith=PREFIX).delete()
+
+        self.stdout.write(json.dumps(report, indent=2))
+        if report['over_allocated']:
+            raise CommandError('Request was over-allocated')
+
+    def run_accepts(self, blood_request, donor_ids, thread_count):
+        shares = [donor_ids[i::thread_count] for i in range(thread_count)]
+        barrier = threading.Barrier(thread_count)
+        lock = threading.Lock()
+        results = {'accepted': 0, 'rejected': 0, 'errors': 0, 'timings_ms': []}
+
+        def worker(share):
+            accepted = rejected = errors = 0
+            timings = []
+            try:
+                barrier.wait()
+                for donor_id in share:
+                    started = perf_counter()
+                    try:
+                        pledge_units(blood_request, donor_id, 1)
+                        accepted += 1
+                    except PledgeError:
+                        rejected += 1
+                    except OperationalError:
+                        # e.g. SQLite "database is locked" after the busy timeout
+                        errors += 1
+                    timings.append((perf_counter() - started) * 1000)
+            finally:
+                connections.close_all()
+            with lock:
+                results['accepted'] += accepted
+                results['rejected'] += rejected
+                results['errors'] += errors
+                results['timings_ms'].extend(timings)
+
+        threads = [threading.Thread(target=worker, args=(share,)) for share in shares]
+        started = perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        results['elapsed_s'] = perf_counter() - started
+        return results
+
+    def verify(self, blood_request, results):
+        blood_request.refresh_from_db()
+        donated = DonationHistory.objects.filter(blood_request=blood_request).exclude(status='canceled').aggregate(
+            units=Sum('units_donated')
+        )['units'] or 0
+        attempts = results['accepted'] + results['rejected'] + results['errors']
+        return {
+            'database': connection.vendor,
+            'attempts': attempts,
+            'accepted': results['accepted'],
+            'rejected': results['rejected'],
+            'errors': results['errors'],
+            'accepts_per_second': round(attempts / results['elapsed_s'], 1),
+            'latency': summarize(results['timings_ms']),
+            'units_needed': blood_request.units_needed,
+            'units_pledged': blood_request.units_pledged,
+            'units_in_donations': donated,
+            'status': blood_request.status,
+            'over_allocated': (
+                blood_request.units_pledged > blood_request.units_needed
+                or donated != blood_request.units_pledged
+                or results['accepted'] != blood_request.units_pledged
+            ),
+        }
@@ -0,0 +1,88 @@
+import heapq
+import json
+import random
+from time import perf_counter
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from accounts.benchmarks import summarize
+from accounts.compatibility import BLOOD_GROUPS, DONORS_FOR_RECIPIENT
+from accounts.geo import nearest, haversine_km
+from accounts.models import Profile
+from accounts.seeding import seed_donors, random_place
+
+
+class Command(BaseCommand):
+    help = 'Seed donors and time the grid-indexed nearest-donor search against a full scan'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--donors', type=int, default=1_000_000, help='Donors to seed')
+        parser.add_argument('--queries', type=int, default=200, help='Grid searches to time')
+        parser.add_argument('--scan-queries', type=int, default=3, help='Full-scan searches to time')
+        parser.add_argument('-k', type=int, default=10, help='Donors per search')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed')
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded rows instead of rolling back')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        k = options['k']
+
+        with transaction.atomic():
+            self.stdout.write(f"Seeding {options['donors']} donors...")
+            started = perf_counter()
+            seed_donors(options['donors'], prefix='bench-geo-', rng=rng, log=self.stdout.write)
+            self.stdout.write(f'Seeded in {perf_counter() - started:.1f}s')
+
+            searches = []
+            for _ in range(max(options['queries'], options['scan_queries'])):
+                _, (latitude, longitude) = random_place(rng)
+                searches.append((
+                    latitude + rng.gauss(0, 0.03),
+                    longitude + rng.gauss(0, 0.03),
+                    rng.choice(BLOOD_GROUPS),
+                ))
+
+            grid_ms, grid_queries = [], []
+            for latitude, longitude, recipient in searches[:options['queries']]:
+                with CaptureQueriesContext(connection) as queries:
+                    started = perf_counter()
+                    self._grid_search(latitude, longitude, recipient, k)
+                    grid_ms.append((perf_counter() - started) * 1000)
+                grid_queries.append(len(queries))
+
+            scan_ms, mismatches = [], 0
+            for latitude, longitude, recipient in searches[:options['scan_queries']]:
+                started = perf_counter()
+                expected = self._full_scan(latitude, longitude, recipient, k)
+                scan_ms.append((perf_counter() - started) * 1000)
+                found = [round(row['distance_km'], 6) for row in self._grid_search(latitude, longitude, recipient, k)]
+                if found != [round(distance, 6) for distance in expected]:
+                    mismatches += 1
+
+            if not options['keep']:
+                transaction.set_rollback(True)
+
+        self.stdout.write(json.dumps({
+            'donors': options['donors'],
+            'k': k,
+            'grid_search': {
+                **summarize(grid_ms),
+                'queries_per_search': round(sum(grid_queries) / len(grid_queries), 2) if grid_queries else None,
+            },
+            'full_scan': summarize(scan_ms),
+            'mismatches': mismatches,
+        }, indent=2))
+
+    def _queryset(self, recipient):
+        return Profile.objects.filter(
+            is_available_for_donation=True,
+            blood_group__in=DONORS_FOR_RECIPIENT[recipient],
+        )
+
+    def _grid_search(self, latitude, longitude, recipient, k):
+        return nearest(self._queryset(recipient), latitude, longitude, k, ('id',))
+
+    def _full_scan(self, latitude, longitude, recipient, k):
+        rows = self._queryset(recipient).exclude(latitude=None).values_list('latitude', 'longitude')
+        distances = (haversine_km(latitude, longitude, lat, lon) for lat, lon in rows.iterator(chunk_size=10000))
+        return [d for d in heapq.nsmallest(k, distances) if d <= 100]
@@ -0,0 +1,59 @@
+import json
+import sys
+from time import perf_counter
+from django.core.management.base import BaseCommand, CommandError
+from accounts.importing import DonorImporter, BloodRequestImporter, read_rows, chunked
+from accounts.stats import invalidate_global_stats
+
+
+class Command(BaseCommand):
+    help = 'Stream donors (users, profiles, roles) or blood requests from a CSV or JSONL file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=['donors', 'requests'], help='What the file holds')
+        parser.add_argument('path', help='CSV (with a header row) or JSONL file')
+        parser.add_argument('--input-format', choices=['csv', 'jsonl'], help='Defaults to the file extension')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Rows validated and written per transaction')
+        parser.add_argument('--roles', default='donor', help='Roles for donor rows without a roles column, e.g. "donor;recipient"')
+        parser.add_argument('--inactive', action='store_true', help='Create donor accounts inactive')
+        parser.add_argument('--requester', help='Username or email for request rows without a requester column')
+        parser.add_argument('--errors', help='Write failed rows as JSONL to this file instead of stderr')
+
+    def handle(self, *args, **options):
+        if options['kind'] == 'donors':
+            importer = DonorImporter(
+                default_roles=options['roles'].replace(',', ';').split(';'),
+                is_active=not options['inactive'],
+            )
+        else:
+            importer = BloodRequestImporter(default_requester=options['requester'])
+
+        try:
+            rows = read_rows(options['path'], options['input_format'])
+            errors_out = open(options['errors'], 'w', encoding='utf-8') if options['errors'] else None
+        except OSError as e:
+            raise CommandError(str(e))
+
+        created = failed = 0
+        started = perf_counter()
+        try:
+            for chunk in chunked(rows, options['chunk_size']):
+                chunk_created, failures = importer.import_chunk(chunk)
+                created += chunk_created
+                failed += len(failures)
+                for line_number, errors in failures:
+                    record = json.dumps({'line': line_number, 'errors': errors}, default=str)
+                    (errors_out or sys.stderr).write(record + '\n')
+                elapsed = perf_counter() - started
+                self.stdout.write(f'  {created} created, {failed} failed ({created / elapsed:.0f} rows/s)')
+        finally:
+            if errors_out:
+                errors_out.close()
+
+        if created:
+            invalidate_global_stats()
+        elapsed = perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {created} {options["kind"]} in {elapsed:.1f}s '
+            f'({created / elapsed if elapsed else 0:.0f} rows/s), {failed} failed'
+        ))
@@ -0,0 +1,141 @@
+import random
+from statistics import median
+from time import perf_counter
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Q
+from django.test.utils import CaptureQueriesContext
+from accounts.compatibility import DONORS_FOR_RECIPIENT
+from accounts.models import Profile, BloodRequest, DonationHistory
+from accounts.pagination import TriagePagination
+from accounts.seeding import seed_donors, seed_requests, seed_donations
+from accounts.stats import get_user_stats
+
+
+def hot_queries(user, blood_request):
+    """The queries behind the busiest endpoints, by name"""
+    requests = BloodRequest.objects.select_related('requester__profile').order_by('-created_at', '-id')
+    return {
+        'requests_list': lambda: list(requests[:50]),
+        'requests_by_status': lambda: list(requests.filter(status='pending')[:50]),
+        'requests_by_group': lambda: list(requests.filter(blood_group='A+', status='pending')[:50]),
+        'requests_by_urgency': lambda: list(requests.filter(urgency='critical')[:50]),
+        'my_requests': lambda: list(requests.filter(requester=user)[:50]),
+        'dashboard_user_stats': lambda: get_user_stats(user),
+        'dashboard_available_donors': lambda: Profile.objects.eligible().count(),
+        'dashboard_urgent_requests': lambda: BloodRequest.objects.filter(
+            status='pending', urgency__in=['high', 'critical']
+        ).count(),
+        'dashboard_recent_requests': lambda: list(requests.filter(status='pending')[:5]),
+        'triage_queue': lambda: list(
+            requests.filter(status='pending').order_by(*TriagePagination.ordering)[:25]
+        ),
+        'donation_history_list': lambda: list(
+            DonationHistory.objects.filter(Q(donor=user) | Q(recipient=user))
+            .select_related('donor__profile', 'recipient__profile', 'blood_request')
+            .order_by('-created_at', '-id')[:50]
+        ),
+        'available_donors': lambda: list(
+            Profile.objects.eligible().filter(blood_group='O-')
+            .values('id', 'full_name')[:500]
+        ),
+        'compatible_donors': lambda: list(
+            Profile.objects.eligible().filter(blood_group__in=DONORS_FOR_RECIPIENT['A-'])
+            .values('id', 'full_name')[:500]
+        ),
+        'cancel_donation_others': lambda: DonationHistory.objects.filter(
+            blood_request=blood_request, status__in=['pending', 'confirmed']
+        ).exclude(id=0).exists(),
+    }
+
+
+class Command(BaseCommand):
+    help = 'Seed data and print query plans and timings for the hot queries with and without the indexes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--donors', type=int, default=50_000, help='Donors to seed')
+        parser.add_argument('--requests', type=int, default=100_000, help='Blood requests to seed')
+        parser.add_argument('--donations', type=int, default=100_000, help='Donations to seed')
+        parser.add_argument('--repeat', type=int, default=5, help='Timed runs per query')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+
+        # Everything, including the dropped indexes, is rolled back at the end
+        with transaction.atomic():
+            self.stdout.write('Seeding...')
+            donor_ids = seed_donors(options['donors'], prefix='bench-idx-', rng=rng)
+            requesters = donor_ids[:max(1, len(donor_ids) // 10)]
+            request_ids = seed_requests(requesters, options['requests'], rng=rng)
+            seed_donations(donor_ids, request_ids, options['donations'], rng=rng)
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+            user = Profile.objects.get(user_id=requesters[0]).user
+            blood_request = BloodRequest.objects.get(id=request_ids[0])
+            queries = hot_queries(user, blood_request)
+
+            with_indexes = self.run_queries(queries, options['repeat'], 'with indexes')
+            self.drop_indexes()
+            without_indexes = self.run_queries(queries, options['repeat'], 'without indexes')
+
+            transaction.set_rollback(True)
+
+        self.report(with_indexes, without_indexes)
+
+    def drop_indexes(self):
+        with connection.cursor() as cursor:
+            for model in (Profile, BloodRequest, DonationHistory):
+                for index in model._meta.indexes:
+                    cursor.execute(f'DROP INDEX {connection.ops.quote_name(index.name)}')
+
+    def run_queries(self, queries, repeat, label):
+        results = {}
+        for name, run in queries.items():
+            with CaptureQueriesContext(connection) as captured:
+                run()
+            timings = []
+            for _ in range(repeat):
+                started = perf_counter()
+                run()
+                timings.append((perf_counter() - started) * 1000)
+            results[name] = {
+                'ms': median(timings),
+                'plans': [self.explain(query['sql'], label) for query in captured],
+            }
+        return results
+
+    def explain(self, sql, label):
+        # The label keeps sqlite3's statement cache from returning the plan
+        # it prepared before the indexes were dropped
+        with connection.cursor() as cursor:
+            cursor.execute(f'{connection.ops.explain_query_prefix()} /* {label} */ {sql}')
+            rows = cursor.fetchall()
+        # SQLite rows are (id, parent, notused, detail), PostgreSQL rows are single strings
+        return [row[-1] for row in rows]
+
+    def report(self, after, before):
+        table_scans = []
+        for name in after:
+            self.stdout.write(self.style.MIGRATE_HEADING(f'\n{name}'))
+            self.stdout.write(f"  without indexes: {before[name]['ms']:8.2f} ms")
+            for plan in before[name]['plans']:
+                self.stdout.write('    ' + '\n    '.join(plan))
+            self.stdout.write(f"  with indexes:    {after[name]['ms']:8.2f} ms")
+            for plan in after[name]['plans']:
+                self.stdout.write('    ' + '\n    '.join(plan))
+                table_scans.extend(f'{name}: {line}' for line in plan if self.is_table_scan(line))
+
+        if table_scans:
+            self.stdout.write(self.style.WARNING('\nQueries still scanning a whole table:'))
+            for line in table_scans:
+                self.stdout.write(f'  {line}')
+        else:
+            self.stdout.write(self.style.SUCCESS('\nNo hot query falls back to a table scan'))
+
+    def is_table_scan(self, line):
+        line = line.strip()
+        if connection.vendor == 'sqlite':
+            return line.startswith('SCAN ') and ' USING ' not in line
+        return 'Seq Scan' in line
@@ -0,0 +1,35 @@
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from accounts.exporting import EXPORTS, RENDERERS, EXPORT_CHUNK_SIZE, export_filters, stream_export
+
+
+class Command(BaseCommand):
+    help = 'Stream donation history or blood requests to CSV or NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=list(EXPORTS), help='What to export')
+        parser.add_argument('--output-format', choices=list(RENDERERS), default='csv')
+        parser.add_argument('--output', help='File to write, stdout by default')
+        parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE, help='Rows fetched per round trip')
+        parser.add_argument('--status', help='Only rows with this status')
+        parser.add_argument('--since', help='Only rows created on or after this day (YYYY-MM-DD)')
+        parser.add_argument('--until', help='Only rows created on or before this day (YYYY-MM-DD)')
+
+    def handle(self, *args, **options):
+        try:
+            filters = export_filters(options['kind'], options['status'], options['since'], options['until'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        chunks = stream_export(options['kind'], options['output_format'], options['chunk_size'], filters)
+        if not options['output']:
+            for chunk in chunks:
+                sys.stdout.write(chunk)
+            return
+
+        try:
+            with open(options['output'], 'w', newline='', encoding='utf-8') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+        except OSError as e:
+            raise CommandError(str(e))
+        self.stderr.write(self.style.SUCCESS(f"Exported {options['kind']} to {options['output']}"))
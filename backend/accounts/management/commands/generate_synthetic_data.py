@@ -0,0 +1,73 @@
+import random
+from time import perf_counter
+from django.core.management.base import BaseCommand, CommandError
+from accounts.models import User
+from accounts.seeding import seed_donors, seed_requests, seed_donations
+from accounts.stats import invalidate_global_stats
+
+
+class Command(BaseCommand):
+    help = 'Bulk insert donors, requesters, blood requests and donation histories at production scale'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--donors', type=int, default=10_000, help='Users with a donor profile')
+        parser.add_argument('--requesters', type=int, default=2_000, help='Users who are both donors and recipients')
+        parser.add_argument('--requests', type=int, default=20_000, help='Blood requests, from random requesters')
+        parser.add_argument(
+            '--donations', type=int, default=30_000,
+            help='Donation history rows, about as many as the requests can consistently hold'
+        )
+        parser.add_argument('--available-ratio', type=float, default=0.85, help='Share of donors currently available')
+        parser.add_argument('--password', help='Password for every generated user (default: unusable, no logins)')
+        parser.add_argument('--prefix', default='synth-', help='Username / email prefix of the generated users')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per INSERT')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed, the same seed gives the same data')
+        parser.add_argument('--clear', action='store_true', help='Delete users with this prefix (and their rows) first')
+
+    def handle(self, *args, **options):
+        if options['requesters'] < 1 and options['requests']:
+            raise CommandError('Blood requests need at least one requester')
+        if options['donations'] and not (options['requests'] and options['donors'] + options['requesters']):
+            raise CommandError('Donations need blood requests and donors')
+
+        prefix = options['prefix']
+        if options['clear']:
+            deleted, _ = User.objects.filter(username__startswith=prefix).delete()
+            self.stdout.write(f'Deleted {deleted} rows from a previous run')
+        if User.objects.filter(username__startswith=prefix).exists():
+            raise CommandError(f'Users named {prefix}* already exist, use --clear or another --prefix')
+
+        rng = random.Random(options['seed'])
+        common = {
+            'batch_size': options['batch_size'],
+            'rng': rng,
+            'log': self.stdout.write,
+        }
+        seeded = {
+            'password': options['password'],
+            'available_ratio': options['available_ratio'],
+        }
+        started = perf_counter()
+
+        self.stdout.write(f"Seeding {options['donors']} donors...")
+        donor_ids = seed_donors(options['donors'], prefix=prefix, **seeded, **common)
+        self.stdout.write(f"Seeding {options['requesters']} requesters...")
+        requester_ids = seed_donors(
+            options['requesters'], prefix=f'{prefix}r-', roles=('Donor', 'Recipient'), **seeded, **common
+        )
+
+        request_ids = []
+        donations = 0
+        if options['requests']:
+            self.stdout.write(f"Seeding {options['requests']} blood requests...")
+            request_ids = seed_requests(requester_ids, options['requests'], **common)
+        if options['donations']:
+            self.stdout.write(f"Seeding {options['donations']} donations...")
+            donations = seed_donations(donor_ids + requester_ids, request_ids, options['donations'], **common)
+
+        # bulk_create skipped the signals that clear the dashboard numbers
+        invalidate_global_stats()
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated {len(donor_ids) + len(requester_ids)} users, {len(request_ids)} requests and '
+            f'{donations} donations in {perf_counter() - started:.1f}s'
+        ))
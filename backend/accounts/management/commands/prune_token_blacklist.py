@@ -0,0 +1,36 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+
+class Command(BaseCommand):
+    help = 'Delete expired outstanding and blacklisted refresh tokens in small chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Tokens deleted per transaction')
+        parser.add_argument('--sleep', type=float, default=0.0, help='Seconds to pause between chunks')
+
+    def handle(self, *args, **options):
+        # An expired token can no longer be used, blacklisted or not
+        cutoff = timezone.now()
+        expired = OutstandingToken.objects.filter(expires_at__lte=cutoff).order_by('id')
+        outstanding_deleted = blacklisted_deleted = 0
+
+        while True:
+            # Short transactions, so logins and refreshes are never blocked for long
+            with transaction.atomic():
+                ids = list(expired.values_list('id', flat=True)[:options['chunk_size']])
+                if not ids:
+                    break
+                blacklisted_deleted += BlacklistedToken.objects.filter(token_id__in=ids).delete()[0]
+                outstanding_deleted += OutstandingToken.objects.filter(id__in=ids).delete()[0]
+
+            self.stdout.write(f'  {outstanding_deleted} outstanding tokens deleted')
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Pruned {outstanding_deleted} expired tokens ({blacklisted_deleted} blacklisted)'
+        ))
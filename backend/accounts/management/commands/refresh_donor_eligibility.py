@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F
+from django.utils import timezone
+from accounts.donor_cache import bump_donor_generations
+from accounts.models import Profile
+from accounts.stats import invalidate_global_stats
+
+
+class Command(BaseCommand):
+    help = 'Make donors available again once their post-donation waiting period is over (run daily)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only count the donors that would be re-enabled')
+
+    def handle(self, *args, **options):
+        # Profiles edited after their eligibility date were switched off by
+        # the donor, not by a donation, so they are left alone
+        expired = Profile.objects.filter(
+            is_available_for_donation=False,
+            next_eligible_date__lte=timezone.localdate(),
+            updated_at__date__lt=F('next_eligible_date'),
+        )
+
+        if options['dry_run']:
+            self.stdout.write(f'{expired.count()} donors would be re-enabled')
+            return
+
+        # Only the cached donor lists of these groups go stale
+        groups = set(expired.order_by().values_list('blood_group', flat=True).distinct())
+        
+        # One set-based UPDATE through profile_eligibility_idx, no per-row saves
+        updated = expired.update(is_available_for_donation=True, updated_at=timezone.now())
+        if updated:
+            invalidate_global_stats()
+            bump_donor_generations(groups)
+        self.stdout.write(self.style.SUCCESS(f'Re-enabled {updated} donors'))
@@ -0,0 +1,37 @@
+import time
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand
+from accounts.outbox import deliver_batch, MAX_ATTEMPTS
+
+
+class Command(BaseCommand):
+    help = 'Send queued outbox emails in batches over one reused SMTP connection'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='Emails claimed per batch')
+        parser.add_argument('--interval', type=float, default=5.0, help='Seconds to sleep when the queue is empty')
+        parser.add_argument('--max-attempts', type=int, default=MAX_ATTEMPTS, help='Attempts before an email is marked failed')
+        parser.add_argument('--once', action='store_true', help='Drain what is due now and exit')
+
+    def handle(self, *args, **options):
+        connection = get_connection()
+        try:
+            while True:
+                sent, failed = deliver_batch(
+                    batch_size=options['batch_size'],
+                    max_attempts=options['max_attempts'],
+                    connection=connection,
+                )
+                if sent or failed:
+                    self.stdout.write(f'Sent {sent}, failed {failed}')
+                    continue
+
+                if options['once']:
+                    break
+                # Do not hold an idle SMTP connection open between bursts
+                connection.close()
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            connection.close()
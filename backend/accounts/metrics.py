@@ -0,0 +1,277 @@
+"""
+Per-endpoint request metrics in Prometheus text format.
+
+MetricsMiddleware records, for each resolved URL name and method, wall
+time, database time, query count and response size into fixed-bucket
+histograms. Memory is bounded by routes x methods x buckets, not by traffic.
+Queries are counted with a connection execute_wrapper, so DEBUG can stay off.
+
+With several worker processes, set ``METRICS_DIR``: each process snapshots
+its histograms to ``metrics-<pid>.json`` there every few seconds and
+``/metrics`` merges every file. A restarted worker that gets the same pid
+picks up the old file's totals, so counters never go backwards.
+"""
+import atexit
+import bisect
+import json
+import os
+import threading
+from contextlib import ExitStack
+from time import monotonic, perf_counter
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+PREFIX = 'bloodbank'
+
+# name -> (help, upper bucket bounds)
+HISTOGRAMS = {
+    'http_request_duration_seconds': (
+        'Wall time from the first middleware to the response',
+        (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+    ),
+    'http_request_db_seconds': (
+        'Time spent executing SQL per request',
+        (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5),
+    ),
+    'http_request_queries': (
+        'SQL queries per request',
+        (0, 1, 2, 3, 5, 10, 20, 50, 100, 500),
+    ),
+    'http_response_bytes': (
+        'Response body size, streaming responses are not counted',
+        (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216),
+    ),
+}
+
+FLUSH_SECONDS = 5
+
+
+class Registry:
+    """Histograms keyed by (route, method), safe to update from any thread"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # "route method" -> metric -> [count per bucket..., +Inf bucket, sum]
+        self._series = {}
+
+    def observe(self, route, method, values):
+        key = f'{route} {method}'
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {
+                    name: [0] * (len(buckets) + 1) + [0.0] for name, (_, buckets) in HISTOGRAMS.items()
+                }
+            for name, value in values.items():
+                counts = series[name]
+                # First bucket whose upper bound is >= value, len(buckets) is +Inf
+                counts[bisect.bisect_left(HISTOGRAMS[name][1], value)] += 1
+                counts[-1] += value
+
+    def snapshot(self):
+        with self._lock:
+            return {key: {name: list(counts) for name, counts in series.items()} for key, series in self._series.items()}
+
+    def load(self, data):
+        """Add a snapshot's totals, used to carry on from a previous process's file"""
+        with self._lock:
+            merge(self._series, data)
+
+
+def merge(into, data):
+    for key, series in data.items():
+        target = into.setdefault(key, {})
+        for name, counts in series.items():
+            if name not in HISTOGRAMS:
+                continue
+            if name not in target:
+                target[name] = list(counts)
+            elif len(target[name]) == len(counts):
+                target[name] = [a + b for a, b in zip(target[name], counts)]
+    return into
+
+
+registry = Registry()
+
+
+def _metrics_dir():
+    return getattr(settings, 'METRICS_DIR', None)
+
+
+class _Writer:
+    """Snapshots this process's registry to its file in METRICS_DIR"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._last = 0.0
+        self._started = False
+
+    def path(self, directory):
+        return os.path.join(directory, f'metrics-{os.getpid()}.json')
+
+    def maybe_flush(self):
+        if monotonic() - self._last >= FLUSH_SECONDS:
+            self.flush()
+
+    def flush(self):
+        directory = _metrics_dir()
+        if not directory:
+            return
+        with self._lock:
+            path = self.path(directory)
+            if not self._started:
+                # Same pid as a worker that is gone: continue from its totals
+                self._started = True
+                os.makedirs(directory, exist_ok=True)
+                try:
+                    with open(path) as f:
+                        registry.load(json.load(f))
+                except (OSError, ValueError):
+                    pass
+                atexit.register(self.flush)
+            tmp = f'{path}.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(registry.snapshot(), f)
+            os.replace(tmp, path)
+            self._last = monotonic()
+
+
+writer = _Writer()
+
+
+def collect():
+    """Every process's histograms merged, this one's up to date"""
+    directory = _metrics_dir()
+    if not directory:
+        return registry.snapshot()
+    writer.flush()
+    merged = {}
+    for name in os.listdir(directory):
+        if name.startswith('metrics-') and name.endswith('.json'):
+            try:
+                with open(os.path.join(directory, name)) as f:
+                    merge(merged, json.load(f))
+            except (OSError, ValueError):
+                # Deleted or being replaced under us
+                continue
+    return merged
+
+
+def _number(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_prometheus(data):
+    lines = []
+    for name, (help_text, buckets) in HISTOGRAMS.items():
+        metric = f'{PREFIX}_{name}'
+        lines.append(f'# HELP {metric} {help_text}')
+        lines.append(f'# TYPE {metric} histogram')
+        for key in sorted(data):
+            counts = data[key].get(name)
+            if not counts:
+                continue
+            route, method = key.rsplit(' ', 1)
+            labels = f'route="{_label(route)}",method="{_label(method)}"'
+            cumulative = 0
+            for bound, count in zip((*buckets, '+Inf'), counts):
+                cumulative += count
+                lines.append(f'{metric}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{metric}_sum{{{labels}}} {_number(counts[-1])}')
+            lines.append(f'{metric}_count{{{labels}}} {cumulative}')
+    return '\n'.join(lines) + '\n'
+
+
+class QueryTimer:
+    """execute_wrapper counting queries and the time spent running them"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += perf_counter() - started
+            self.count += 1
+
+
+METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+
+def _route(request):
+    match = getattr(request, 'resolver_match', None)
+    # Unmatched paths share one series, scanners cannot grow the registry
+    return match.view_name if match and match.view_name else 'unmatched'
+
+
+def _response_bytes(response):
+    return None if response.streaming else len(response.content)
+
+
+def _wrap_connections(stack, timer):
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(timer))
+
+
+def _is_async_view(request):
+    match = getattr(request, 'resolver_match', None)
+    return match is not None and iscoroutinefunction(match.func)
+
+
+class MetricsMiddleware:
+    """Put first in MIDDLEWARE so the timings cover the rest of the stack"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started = perf_counter()
+        timer = QueryTimer()
+        with ExitStack() as stack:
+            _wrap_connections(stack, timer)
+            response = self.get_response(request)
+        self.record(request, response, perf_counter() - started, timer)
+        return response
+
+    async def __acall__(self, request):
+        started = perf_counter()
+        timer = QueryTimer()
+        stack = ExitStack()
+        # Sync views run in the request's thread-sensitive worker thread, the
+        # same one these calls run in, so the wrapper sees their connections
+        await sync_to_async(_wrap_connections)(stack, timer)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        if _is_async_view(request):
+            # Async views query from threads of their own choosing, a count would be partial
+            timer = None
+        self.record(request, response, perf_counter() - started, timer)
+        return response
+
+    def record(self, request, response, elapsed, timer):
+        values = {'http_request_duration_seconds': elapsed}
+        if timer is not None:
+            values['http_request_db_seconds'] = timer.seconds
+            values['http_request_queries'] = timer.count
+        size = _response_bytes(response)
+        if size is not None:
+            values['http_response_bytes'] = size
+        method = request.method if request.method in METHODS else 'other'
+        registry.observe(_route(request), method, values)
+        writer.maybe_flush()
@@ -0,0 +1,22 @@
+from django.db import migrations
+
+
+def install(apps, schema_editor):
+    from accounts.search import install_address_index
+    install_address_index(schema_editor.connection)
+
+
+def uninstall(apps, schema_editor):
+    from accounts.search import uninstall_address_index
+    uninstall_address_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_bloodrequest_donationhistory'),
+    ]
+
+    operations = [
+        migrations.RunPython(install, uninstall),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.2.5 on 2026-10-18 19:40
+
+from django.db import migrations, models
+
+
+def _backfill(model, address_field, fields):
+    from accounts.geo import geocode, grid_cell
+
+    batch = []
+    for obj in model.objects.only('id', address_field).iterator(chunk_size=2000):
+        location = geocode(getattr(obj, address_field))
+        if not location:
+            continue
+        obj.latitude, obj.longitude = location
+        if 'grid_cell' in fields:
+            obj.grid_cell = grid_cell(*location)
+        batch.append(obj)
+        if len(batch) >= 2000:
+            model.objects.bulk_update(batch, fields)
+            batch = []
+    model.objects.bulk_update(batch, fields)
+
+
+def backfill_locations(apps, schema_editor):
+    _backfill(apps.get_model('accounts', 'Profile'), 'address', ['latitude', 'longitude', 'grid_cell'])
+    _backfill(apps.get_model('accounts', 'BloodRequest'), 'hospital_address', ['latitude', 'longitude'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_profile_address_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bloodrequest',
+            name='latitude',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='bloodrequest',
+            name='longitude',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='grid_cell',
+            field=models.BigIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='latitude',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='longitude',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='profile',
+            index=models.Index(condition=models.Q(('is_available_for_donation', True)), fields=['grid_cell', 'blood_group'], name='profile_available_cell_idx'),
+        ),
+        migrations.RunPython(backfill_locations, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.2.5 on 2026-10-18 19:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_geolocation'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bloodrequest',
+            index=models.Index(fields=['created_at', 'id'], name='bloodreq_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bloodrequest',
+            index=models.Index(fields=['status', 'created_at', 'id'], name='bloodreq_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bloodrequest',
+            index=models.Index(fields=['blood_group', 'status', 'created_at', 'id'], name='bloodreq_group_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bloodrequest',
+            index=models.Index(fields=['urgency', 'created_at', 'id'], name='bloodreq_urgency_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bloodrequest',
+            index=models.Index(fields=['requester', 'created_at', 'id'], name='bloodreq_requester_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bloodrequest',
+            index=models.Index(fields=['requester', 'status'], name='bloodreq_requester_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bloodrequest',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['created_at', 'id'], name='bloodreq_pending_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bloodrequest',
+            index=models.Index(condition=models.Q(('status', 'pending'), ('urgency__in', ['high', 'critical'])), fields=['urgency', 'status'], name='bloodreq_urgent_pending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='donationhistory',
+            index=models.Index(fields=['donor', 'created_at', 'id'], name='donation_donor_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='donationhistory',
+            index=models.Index(fields=['recipient', 'created_at', 'id'], name='donation_recipient_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='donationhistory',
+            index=models.Index(fields=['donor', 'status'], name='donation_donor_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='donationhistory',
+            index=models.Index(fields=['blood_request', 'status'], name='donation_request_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='profile',
+            index=models.Index(fields=['is_available_for_donation', 'blood_group'], name='profile_available_group_idx'),
+        ),
+    ]
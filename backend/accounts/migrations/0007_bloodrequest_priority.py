@@ -0,0 +1,38 @@
+# Generated by Django 5.2.5 on 2026-10-18 19:47
+
+from django.db import migrations, models
+
+
+def backfill_priority(apps, schema_editor):
+    BloodRequest = apps.get_model('accounts', 'BloodRequest')
+    BloodRequest.objects.update(priority=models.Case(
+        models.When(urgency='low', then=models.Value(1)),
+        models.When(urgency='medium', then=models.Value(2)),
+        models.When(urgency='high', then=models.Value(3)),
+        models.When(urgency='critical', then=models.Value(4)),
+        default=models.Value(0),
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0006_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='bloodrequest',
+            options={'ordering': ['-priority', '-created_at']},
+        ),
+        migrations.AddField(
+            model_name='bloodrequest',
+            name='priority',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='bloodrequest',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['-priority', 'needed_by_date', 'created_at', 'id'], name='bloodreq_triage_idx'),
+        ),
+        migrations.RunPython(backfill_priority, migrations.RunPython.noop),
+    ]
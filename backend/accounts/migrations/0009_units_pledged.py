@@ -0,0 +1,51 @@
+# Generated by Django 5.2.5 on 2026-10-18 19:54
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def cancel_duplicate_donations(apps, schema_editor):
+    # Racing accepts left some donors with several live donations for one
+    # request; keep the first and cancel the rest so the constraint applies
+    DonationHistory = apps.get_model('accounts', 'DonationHistory')
+    first_ids = (
+        DonationHistory.objects.exclude(status='canceled')
+        .values('donor', 'blood_request')
+        .annotate(first_id=models.Min('id'))
+        .values('first_id')
+    )
+    DonationHistory.objects.exclude(status='canceled').exclude(id__in=first_ids).update(status='canceled')
+
+
+def backfill_units_pledged(apps, schema_editor):
+    BloodRequest = apps.get_model('accounts', 'BloodRequest')
+    DonationHistory = apps.get_model('accounts', 'DonationHistory')
+    pledged = (
+        DonationHistory.objects.filter(blood_request=models.OuterRef('pk'))
+        .exclude(status='canceled')
+        .values('blood_request')
+        .annotate(total=models.Sum('units_donated'))
+        .values('total')
+    )
+    BloodRequest.objects.update(units_pledged=Coalesce(models.Subquery(pledged), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0008_outboxemail'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bloodrequest',
+            name='units_pledged',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(cancel_duplicate_donations, migrations.RunPython.noop),
+        migrations.RunPython(backfill_units_pledged, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='donationhistory',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'canceled'), _negated=True), fields=('donor', 'blood_request'), name='donation_one_active_per_donor'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.5 on 2026-10-18 19:57
+
+from datetime import timedelta
+from django.db import migrations, models
+
+
+def backfill_next_eligible_date(apps, schema_editor):
+    Profile = apps.get_model('accounts', 'Profile')
+    batch = []
+    profiles = Profile.objects.exclude(last_donation_date=None).only('id', 'last_donation_date')
+    for profile in profiles.iterator(chunk_size=2000):
+        profile.next_eligible_date = profile.last_donation_date + timedelta(days=56)
+        batch.append(profile)
+        if len(batch) >= 2000:
+            Profile.objects.bulk_update(batch, ['next_eligible_date'])
+            batch = []
+    Profile.objects.bulk_update(batch, ['next_eligible_date'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0009_units_pledged'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='next_eligible_date',
+            field=models.DateField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='profile',
+            index=models.Index(fields=['is_available_for_donation', 'next_eligible_date'], name='profile_eligibility_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='profile',
+            index=models.Index(condition=models.Q(('is_available_for_donation', False)), fields=['next_eligible_date'], name='profile_cooldown_idx'),
+        ),
+        migrations.RunPython(backfill_next_eligible_date, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.5 on 2026-10-18 20:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0010_profile_next_eligible_date'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='donationhistory',
+            name='donation_donor_status_idx',
+        ),
+        migrations.AlterField(
+            model_name='donationhistory',
+            name='blood_request',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='donations', to='accounts.bloodrequest'),
+        ),
+        migrations.AlterField(
+            model_name='donationhistory',
+            name='donor',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='donations_given', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='donationhistory',
+            name='recipient',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='donations_received', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
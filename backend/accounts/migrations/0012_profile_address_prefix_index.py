@@ -0,0 +1,19 @@
+from django.db import migrations
+
+
+def install(apps, schema_editor):
+    # PostgreSQL swaps the trigram index for the tsvector one, SQLite already has its FTS table
+    if schema_editor.connection.vendor == 'postgresql':
+        from accounts.search import install_address_index
+        install_address_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0011_donation_fk_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(install, migrations.RunPython.noop),
+    ]
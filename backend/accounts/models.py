@@ -1,6 +1,8 @@
+from datetime import timedelta
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 from django.utils import timezone
+from .geo import geocode, grid_cell
 
 # User model extending AbstractUser
 class User(AbstractUser):
@@ -12,6 +14,23 @@ class User(AbstractUser):
     def __str__(self):
         return self.email
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Usernames are shown in the cached public donor lists
+        instance._loaded_username = instance.__dict__.get('username')
+        return instance
+    
+
+class ProfileQuerySet(models.QuerySet):
+    def eligible(self, today=None):
+        """Donors who are available and past their post-donation waiting period"""
+        today = today or timezone.localdate()
+        return self.filter(
+            models.Q(next_eligible_date__isnull=True) | models.Q(next_eligible_date__lte=today),
+            is_available_for_donation=True,
+        )
+
 
 # User Profile model to store additional information
 class Profile(models.Model):
@@ -26,24 +45,85 @@ class Profile(models.Model):
         ('AB-', 'AB-'),
     ]
     
+    # Minimum gap between two whole blood donations
+    DONATION_INTERVAL = timedelta(days=56)
+    
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
     full_name = models.CharField(max_length=100)
     age = models.PositiveIntegerField()
     address = models.TextField()
     blood_group = models.CharField(max_length=3, choices=BLOOD_GROUP_CHOICES)
     last_donation_date = models.DateField(null=True, blank=True)
+    # last_donation_date + DONATION_INTERVAL, None if they never donated
+    next_eligible_date = models.DateField(null=True, blank=True, editable=False)
     is_available_for_donation = models.BooleanField(default=True)
     phone_number = models.CharField(max_length=15, blank=True)
+    # Filled from the local gazetteer, see accounts/geo.py
+    latitude = models.FloatField(null=True, blank=True, editable=False)
+    longitude = models.FloatField(null=True, blank=True, editable=False)
+    grid_cell = models.BigIntegerField(null=True, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = ProfileQuerySet.as_manager()
+    
+    DERIVED_FIELDS = ('latitude', 'longitude', 'grid_cell', 'next_eligible_date')
     
     def __str__(self):
         return f"{self.full_name} ({self.blood_group})"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Group as loaded, a change has to refresh both groups' cached donor lists
+        instance._loaded_blood_group = instance.__dict__.get('blood_group')
+        return instance
+    
+    @classmethod
+    def next_eligible_after(cls, last_donation_date):
+        return last_donation_date + cls.DONATION_INTERVAL if last_donation_date else None
+    
+    def is_eligible(self, today=None):
+        today = today or timezone.localdate()
+        return self.is_available_for_donation and (
+            self.next_eligible_date is None or self.next_eligible_date <= today
+        )
+    
+    def update_derived_fields(self):
+        """Recompute stored values derived from other columns (bulk writes call this directly)"""
+        location = geocode(self.address)
+        self.latitude, self.longitude = location if location else (None, None)
+        self.grid_cell = grid_cell(self.latitude, self.longitude)
+        self.next_eligible_date = self.next_eligible_after(self.last_donation_date)
+    
+    def save(self, *args, **kwargs):
+        self.update_derived_fields()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, *self.DERIVED_FIELDS}
+        super().save(*args, **kwargs)
+    
     class Meta:
         verbose_name = "User Profile"
         verbose_name_plural = "User Profiles"
+        indexes = [
+            # available_donors and the dashboard donor count
+            models.Index(fields=['is_available_for_donation', 'blood_group'], name='profile_available_group_idx'),
+            # Nearest-donor search probes available donors cell by cell
+            models.Index(
+                fields=['grid_cell', 'blood_group'],
+                condition=models.Q(is_available_for_donation=True),
+                name='profile_available_cell_idx',
+            ),
+            # Eligibility checks against today (Profile.objects.eligible()), covers the donor count
+            models.Index(fields=['is_available_for_donation', 'next_eligible_date'], name='profile_eligibility_idx'),
+            # Donors waiting out their interval, for refresh_donor_eligibility
+            models.Index(
+                fields=['next_eligible_date'],
+                condition=models.Q(is_available_for_donation=False),
+                name='profile_cooldown_idx',
+            ),
+        ]
 
 
 
@@ -56,6 +136,14 @@ class BloodRequest(models.Model):
         ('critical', 'Critical'),
     ]
     
+    # Integer rank of each urgency, stored in ``priority`` so it sorts correctly
+    URGENCY_PRIORITY = {
+        'low': 1,
+        'medium': 2,
+        'high': 3,
+        'critical': 4,
+    }
+    
     STATUS_CHOICES = [
         ('pending', 'Pending'),
         ('accepted', 'Accepted'),
@@ -67,6 +155,8 @@ class BloodRequest(models.Model):
     patient_name = models.CharField(max_length=100)
     blood_group = models.CharField(max_length=3, choices=Profile.BLOOD_GROUP_CHOICES)
     units_needed = models.PositiveIntegerField(default=1)
+    # Units promised by active donations, only ever changed by conditional UPDATEs (accounts.donations)
+    units_pledged = models.PositiveIntegerField(default=0, editable=False)
     urgency = models.CharField(max_length=10, choices=URGENCY_CHOICES)
     hospital_name = models.CharField(max_length=200)
     hospital_address = models.TextField()
@@ -74,14 +164,61 @@ class BloodRequest(models.Model):
     needed_by_date = models.DateTimeField()
     additional_notes = models.TextField(blank=True)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    priority = models.PositiveSmallIntegerField(default=0, editable=False)
+    # Hospital location, filled from the local gazetteer
+    latitude = models.FloatField(null=True, blank=True, editable=False)
+    longitude = models.FloatField(null=True, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    DERIVED_FIELDS = ('priority', 'latitude', 'longitude')
+    
     def __str__(self):
         return f"{self.patient_name} needs {self.blood_group} - {self.urgency} urgency"
     
+    def update_derived_fields(self):
+        """Recompute stored values derived from other columns (bulk writes call this directly)"""
+        self.priority = self.URGENCY_PRIORITY.get(self.urgency, 0)
+        location = geocode(self.hospital_address)
+        self.latitude, self.longitude = location if location else (None, None)
+    
+    def save(self, *args, **kwargs):
+        self.update_derived_fields()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, *self.DERIVED_FIELDS}
+        super().save(*args, **kwargs)
+    
     class Meta:
-        ordering = ['-urgency', '-created_at']
+        ordering = ['-priority', '-created_at']
+        indexes = [
+            # Request list filters, newest first. Ascending so a backward scan
+            # serves ORDER BY created_at DESC, id DESC without a sort.
+            models.Index(fields=['created_at', 'id'], name='bloodreq_created_idx'),
+            models.Index(fields=['status', 'created_at', 'id'], name='bloodreq_status_created_idx'),
+            models.Index(fields=['blood_group', 'status', 'created_at', 'id'], name='bloodreq_group_status_idx'),
+            models.Index(fields=['urgency', 'created_at', 'id'], name='bloodreq_urgency_created_idx'),
+            # my_requests, and the per-user dashboard counters
+            models.Index(fields=['requester', 'created_at', 'id'], name='bloodreq_requester_created_idx'),
+            models.Index(fields=['requester', 'status'], name='bloodreq_requester_status_idx'),
+            # Dashboard recent pending requests and urgent count
+            models.Index(
+                fields=['created_at', 'id'],
+                condition=models.Q(status='pending'),
+                name='bloodreq_pending_created_idx',
+            ),
+            models.Index(
+                fields=['urgency', 'status'],
+                condition=models.Q(status='pending', urgency__in=['high', 'critical']),
+                name='bloodreq_urgent_pending_idx',
+            ),
+            # Triage queue: pending requests, most urgent, soonest needed, oldest first
+            models.Index(
+                fields=['-priority', 'needed_by_date', 'created_at', 'id'],
+                condition=models.Q(status='pending'),
+                name='bloodreq_triage_idx',
+            ),
+        ]
 
 class DonationHistory(models.Model):
     STATUS_CHOICES = [
@@ -91,9 +228,10 @@ class DonationHistory(models.Model):
         ('canceled', 'Canceled'),
     ]
     
-    donor = models.ForeignKey(User, on_delete=models.CASCADE, related_name='donations_given')
-    recipient = models.ForeignKey(User, on_delete=models.CASCADE, related_name='donations_received')
-    blood_request = models.ForeignKey(BloodRequest, on_delete=models.CASCADE, related_name='donations')
+    # No single-column FK indexes, the composite indexes below lead with each of these
+    donor = models.ForeignKey(User, on_delete=models.CASCADE, related_name='donations_given', db_index=False)
+    recipient = models.ForeignKey(User, on_delete=models.CASCADE, related_name='donations_received', db_index=False)
+    blood_request = models.ForeignKey(BloodRequest, on_delete=models.CASCADE, related_name='donations', db_index=False)
     units_donated = models.PositiveIntegerField(default=1)
     donation_date = models.DateTimeField(null=True, blank=True)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
@@ -107,4 +245,56 @@ class DonationHistory(models.Model):
     class Meta:
         ordering = ['-created_at']
         verbose_name = "Donation History"
-        verbose_name_plural = "Donation Histories"
\ No newline at end of file
+        verbose_name_plural = "Donation Histories"
+        indexes = [
+            # Donation history list, newest first: each side of donor OR recipient
+            # (a MULTI-INDEX OR, sorted after), the ?role= lists straight off the
+            # index, and the per-user dashboard counters
+            models.Index(fields=['donor', 'created_at', 'id'], name='donation_donor_created_idx'),
+            models.Index(fields=['recipient', 'created_at', 'id'], name='donation_recipient_created_idx'),
+            # Other active donations for a request (cancel_donation, cancel_request)
+            models.Index(fields=['blood_request', 'status'], name='donation_request_status_idx'),
+        ]
+        constraints = [
+            # A donor holds at most one live (not canceled) donation per request
+            models.UniqueConstraint(
+                fields=['donor', 'blood_request'],
+                condition=~models.Q(status='canceled'),
+                name='donation_one_active_per_donor',
+            ),
+        ]
+
+class OutboxEmail(models.Model):
+    """Email queued in the same transaction as the change that triggered it"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+    
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=254, blank=True)
+    recipient = models.EmailField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    
+    def __str__(self):
+        return f"{self.subject} → {self.recipient} ({self.status})"
+    
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = "Outbox Email"
+        verbose_name_plural = "Outbox Emails"
+        indexes = [
+            # The worker only ever looks at pending rows that are due
+            models.Index(
+                fields=['next_attempt_at', 'id'],
+                condition=models.Q(status='pending'),
+                name='outbox_pending_due_idx',
+            ),
+        ]
@@ -0,0 +1,102 @@
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+from .models import OutboxEmail
+
+logger = logging.getLogger(__name__)
+
+# Retry after 30s, 1m, 2m, ... capped at an hour, then give up
+RETRY_BASE_SECONDS = 30
+RETRY_MAX_SECONDS = 3600
+MAX_ATTEMPTS = 8
+
+# How long a claimed row stays invisible to other workers
+CLAIM_LEASE = timedelta(minutes=5)
+
+
+def queue_email(subject, message, recipient, from_email=None):
+    """
+    Queue an email for the outbox worker.
+
+    Call this inside the transaction that makes the change, so the email is
+    only ever sent for committed data and a slow or failing SMTP server
+    never holds up the request.
+    """
+    return OutboxEmail.objects.create(
+        subject=subject,
+        body=message,
+        from_email=from_email or settings.EMAIL_HOST_USER,
+        recipient=recipient,
+    )
+
+
+def retry_delay(attempts):
+    return timedelta(seconds=min(RETRY_BASE_SECONDS * 2 ** (attempts - 1), RETRY_MAX_SECONDS))
+
+
+def claim_batch(batch_size):
+    """Lock a batch of due emails and push them out of other workers' view"""
+    now = timezone.now()
+    with transaction.atomic():
+        emails = list(
+            OutboxEmail.objects.select_for_update(skip_locked=True)
+            .filter(status='pending', next_attempt_at__lte=now)
+            .order_by('next_attempt_at', 'id')[:batch_size]
+        )
+        if emails:
+            OutboxEmail.objects.filter(id__in=[email.id for email in emails]).update(
+                next_attempt_at=now + CLAIM_LEASE
+            )
+    return emails
+
+
+def deliver_batch(batch_size=100, max_attempts=MAX_ATTEMPTS, connection=None):
+    """
+    Send one batch of due emails over a single SMTP connection.
+
+    Returns ``(sent, failed)`` counts; ``0, 0`` means the queue is drained.
+    """
+    emails = claim_batch(batch_size)
+    if not emails:
+        return 0, 0
+
+    owns_connection = connection is None
+    connection = connection or get_connection()
+    sent = failed = 0
+    try:
+        for email in emails:
+            message = EmailMessage(
+                subject=email.subject,
+                body=email.body,
+                from_email=email.from_email or None,
+                to=[email.recipient],
+                connection=connection,
+            )
+            email.attempts += 1
+            try:
+                # No-op while the connection is up, reconnects after a failure
+                connection.open()
+                message.send()
+            except Exception as exc:
+                failed += 1
+                email.last_error = f'{type(exc).__name__}: {exc}'
+                if email.attempts >= max_attempts:
+                    email.status = 'failed'
+                    logger.error('Giving up on outbox email %s after %s attempts', email.id, email.attempts)
+                else:
+                    email.next_attempt_at = timezone.now() + retry_delay(email.attempts)
+                connection.close()
+            else:
+                sent += 1
+                email.status = 'sent'
+                email.sent_at = timezone.now()
+                email.last_error = ''
+            email.save(update_fields=['status', 'attempts', 'next_attempt_at', 'last_error', 'sent_at'])
+    finally:
+        if owns_connection:
+            connection.close()
+
+    return sent, failed
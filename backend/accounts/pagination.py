@@ -0,0 +1,134 @@
+import base64
+import binascii
+import json
+from datetime import date, datetime
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Opt-in keyset (cursor) pagination.
+
+    Pages are selected with a WHERE clause on the ordering columns instead of
+    an OFFSET, so each page costs the same however deep the client goes and
+    no COUNT(*) is issued. Requests that send neither ``cursor`` nor
+    ``page_size`` are left unpaginated so existing clients keep working.
+    """
+    # The last field must be unique so the cursor position is unambiguous
+    ordering = ('-created_at', '-id')
+    page_size = 50
+    max_page_size = 500
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    always_paginate = False
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        params = request.query_params
+        if not self.always_paginate and not (
+            self.cursor_query_param in params or self.page_size_query_param in params
+        ):
+            return None
+
+        self.request = request
+        self.page_size = self.get_page_size(request)
+
+        queryset = queryset.order_by(*self.ordering)
+        cursor = params.get(self.cursor_query_param)
+        if cursor:
+            position = self.decode_cursor(cursor, queryset.model)
+            queryset = queryset.filter(self.get_keyset_filter(position))
+
+        # Fetch one extra row to find out whether there is a next page
+        rows = list(queryset[:self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        self.next_position = self.get_position(rows[-1]) if self.has_next else None
+        return rows
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if size <= 0:
+            return self.page_size
+        return min(size, self.max_page_size)
+
+    def get_keyset_filter(self, position):
+        """Build ``(a, b, c) < (x, y, z)`` with per-column sort direction"""
+        condition = Q()
+        equal = Q()
+        for ordering, value in zip(self.ordering, position):
+            name = ordering.lstrip('-')
+            lookup = 'lt' if ordering.startswith('-') else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        # Redundant bound on the leading column so the index can seek to it
+        first = self.ordering[0]
+        bound = 'lte' if first.startswith('-') else 'gte'
+        return Q(**{f'{first.lstrip("-")}__{bound}': position[0]}) & condition
+
+    def get_position(self, row):
+        return [self._get_value(row, ordering.lstrip('-')) for ordering in self.ordering]
+
+    def _get_value(self, row, name):
+        if isinstance(row, dict):
+            return row[name]
+        return getattr(row, name)
+
+    def encode_cursor(self, position):
+        values = [
+            value.isoformat() if isinstance(value, (date, datetime)) else value
+            for value in position
+        ]
+        encoded = base64.urlsafe_b64encode(json.dumps(values, separators=(',', ':')).encode())
+        return encoded.decode('ascii')
+
+    def decode_cursor(self, cursor, model):
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+            if not isinstance(values, list) or len(values) != len(self.ordering):
+                raise ValueError
+            return [
+                model._meta.get_field(ordering.lstrip('-')).to_python(value)
+                for ordering, value in zip(self.ordering, values)
+            ]
+        except (TypeError, ValueError, binascii.Error, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(url, self.page_size_query_param, self.page_size)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_position))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class TriagePagination(KeysetPagination):
+    """Pending requests, most urgent first, then soonest needed, then oldest"""
+    ordering = ('-priority', 'needed_by_date', 'created_at', 'id')
+    page_size = 25
+    always_paginate = True
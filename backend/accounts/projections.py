@@ -0,0 +1,161 @@
+"""
+Sparse fieldsets and values()-based rendering for list endpoints.
+
+``?fields=id,patient_name,status`` trims a response to those fields, both
+in the serializer and in the SELECT. List rows skip the serializer entirely:
+a Projection reads plain ``values()`` dicts and renders each field the way
+the serializer would, with choice labels and date math precomputed, so no
+model instances or per-row field lookups are involved. Output is identical
+to the serializer's, key order included.
+"""
+from datetime import date, datetime
+from operator import itemgetter
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+from .models import BloodRequest
+
+
+class Column:
+    """How one output field is read: the values() lookups it needs and a render function"""
+
+    def __init__(self, *lookups, render=None, prepare=None):
+        self.lookups = lookups
+        self.render = render or itemgetter(lookups[0])
+        self._prepare = prepare
+
+    def prepare(self):
+        """The row -> value function for one response"""
+        return self._prepare() if self._prepare else self.render
+
+
+def value(lookup):
+    return Column(lookup)
+
+
+def display(lookup, choices):
+    """Same as get_FOO_display(), from a dict built once"""
+    labels = dict(choices)
+    return Column(lookup, render=lambda row: labels.get(row[lookup], row[lookup]))
+
+
+def timestamp(lookup):
+    """Formatted like the serializer's DateTimeField (timezone, format setting and all)"""
+    def prepare():
+        field = serializers.DateTimeField()
+        # Look the active timezone up once per response instead of once per value
+        field.timezone = field.default_timezone()
+        to_representation = field.to_representation
+
+        def render(row):
+            value = row[lookup]
+            return None if value is None else to_representation(value)
+        return render
+    return Column(lookup, prepare=prepare)
+
+
+class Projection:
+    """The columns of a serializer's output, in its field order"""
+
+    def __init__(self, columns):
+        self.columns = columns
+        self.field_names = tuple(columns)
+
+    def lookups(self, fields=None, extra=()):
+        """values() lookups for ``fields`` (all when None), plus ``extra``"""
+        lookups = dict.fromkeys(extra)
+        for name in fields or self.field_names:
+            lookups.update(dict.fromkeys(self.columns[name].lookups))
+        return tuple(lookups)
+
+    def render(self, rows, fields=None):
+        renderers = [(name, self.columns[name].prepare()) for name in fields or self.field_names]
+        return [{name: render(row) for name, render in renderers} for row in rows]
+
+
+def _requester_name(row):
+    # get_display_name(): profile name, the username when there is no profile
+    name = row['requester__profile__full_name']
+    return row['requester__username'] if name is None else name
+
+
+def _days_remaining(row):
+    needed_by = row['needed_by_date']
+    if needed_by is None:
+        return None
+    # Same arithmetic as BloodRequestSerializer.get_days_remaining
+    needed_date = needed_by.date() if isinstance(needed_by, datetime) else needed_by
+    return (needed_date - date.today()).days
+
+
+# Mirrors BloodRequestSerializer.Meta.fields
+BLOOD_REQUEST_PROJECTION = Projection({
+    'id': value('id'),
+    'requester': value('requester'),
+    'requester_name': Column('requester__profile__full_name', 'requester__username', render=_requester_name),
+    'requester_username': value('requester__username'),
+    'patient_name': value('patient_name'),
+    'blood_group': value('blood_group'),
+    'units_needed': value('units_needed'),
+    'units_pledged': value('units_pledged'),
+    'urgency': value('urgency'),
+    'urgency_display': display('urgency', BloodRequest.URGENCY_CHOICES),
+    'hospital_name': value('hospital_name'),
+    'hospital_address': value('hospital_address'),
+    'contact_phone': value('contact_phone'),
+    'needed_by_date': timestamp('needed_by_date'),
+    'status': value('status'),
+    'status_display': display('status', BloodRequest.STATUS_CHOICES),
+    'additional_notes': value('additional_notes'),
+    'created_at': timestamp('created_at'),
+    'updated_at': timestamp('updated_at'),
+    'days_remaining': Column('needed_by_date', render=_days_remaining),
+})
+
+
+class SparseFieldsMixin:
+    """
+    ``?fields=`` on GET for a ModelViewSet, and list rows rendered by
+    ``projection`` from values() when one is set.
+    """
+    fields_query_param = 'fields'
+    projection = None
+
+    def get_requested_fields(self):
+        """Requested field names in output order, None for all of them"""
+        if not hasattr(self, '_requested_fields'):
+            self._requested_fields = None
+            raw = self.request.query_params.get(self.fields_query_param) if self.request.method == 'GET' else None
+            if raw:
+                available = self.projection.field_names if self.projection else tuple(self.get_serializer_class()().fields)
+                names = {name.strip() for name in raw.split(',') if name.strip()}
+                unknown = names.difference(available)
+                if unknown:
+                    raise ValidationError({self.fields_query_param: [f"Unknown fields: {', '.join(sorted(unknown))}"]})
+                self._requested_fields = tuple(name for name in available if name in names) or None
+        return self._requested_fields
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        fields = self.get_requested_fields()
+        if fields:
+            target = serializer.child if isinstance(serializer, serializers.ListSerializer) else serializer
+            for name in set(target.fields).difference(fields):
+                target.fields.pop(name)
+        return serializer
+
+    def project(self, queryset, extra=()):
+        """``queryset`` as values() dicts with just what the requested fields need"""
+        return queryset.values(*self.projection.lookups(self.get_requested_fields(), extra))
+
+    def get_list_queryset(self):
+        queryset = super().get_list_queryset()
+        if self.projection is None:
+            return queryset
+        # Cursor columns and ETag timestamps ride along without being rendered
+        ordering = [name.lstrip('-') for name in getattr(self.paginator, 'ordering', ())]
+        return self.project(queryset, extra=(*ordering, *getattr(self, 'version_fields', ())))
+
+    def render_rows(self, rows):
+        if self.projection is None:
+            return super().render_rows(rows)
+        return self.projection.render(rows, self.get_requested_fields())
@@ -0,0 +1,153 @@
+import re
+from django.db import connection
+from django.db.models import BooleanField, Q
+from django.db.models.expressions import RawSQL
+
+ADDRESS_FTS_TABLE = 'accounts_profile_address_fts'
+
+# SQLite: external-content FTS5 table over accounts_profile.address, kept in
+# sync by triggers so ORM saves, queryset.update() and raw SQL all reach it
+_SQLITE_INSTALL = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {ADDRESS_FTS_TABLE} USING fts5(
+        address,
+        content='accounts_profile',
+        content_rowid='id',
+        prefix='2 3',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {ADDRESS_FTS_TABLE}_ai AFTER INSERT ON accounts_profile BEGIN
+        INSERT INTO {ADDRESS_FTS_TABLE}(rowid, address) VALUES (new.id, new.address);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {ADDRESS_FTS_TABLE}_ad AFTER DELETE ON accounts_profile BEGIN
+        INSERT INTO {ADDRESS_FTS_TABLE}({ADDRESS_FTS_TABLE}, rowid, address) VALUES ('delete', old.id, old.address);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {ADDRESS_FTS_TABLE}_au AFTER UPDATE OF address ON accounts_profile BEGIN
+        INSERT INTO {ADDRESS_FTS_TABLE}({ADDRESS_FTS_TABLE}, rowid, address) VALUES ('delete', old.id, old.address);
+        INSERT INTO {ADDRESS_FTS_TABLE}(rowid, address) VALUES (new.id, new.address);
+    END
+    """,
+]
+
+_SQLITE_UNINSTALL = [
+    f"DROP TRIGGER IF EXISTS {ADDRESS_FTS_TABLE}_ai",
+    f"DROP TRIGGER IF EXISTS {ADDRESS_FTS_TABLE}_ad",
+    f"DROP TRIGGER IF EXISTS {ADDRESS_FTS_TABLE}_au",
+    f"DROP TABLE IF EXISTS {ADDRESS_FTS_TABLE}",
+]
+
+# PostgreSQL: GIN index over the expression search_address matches against.
+# 'simple' keeps every word as typed, lowercased, with no stemming or stop words
+_POSTGRES_TSVECTOR = "to_tsvector('simple', COALESCE({column}, ''))"
+
+_POSTGRES_INSTALL = [
+    # Replaced by the tsvector index, its substring matches disagreed with SQLite
+    "DROP INDEX IF EXISTS accounts_profile_address_trgm",
+    f"""
+    CREATE INDEX IF NOT EXISTS accounts_profile_address_tsv
+    ON accounts_profile USING gin (({_POSTGRES_TSVECTOR.format(column='"address"')}))
+    """,
+]
+
+_POSTGRES_UNINSTALL = [
+    "DROP INDEX IF EXISTS accounts_profile_address_trgm",
+    "DROP INDEX IF EXISTS accounts_profile_address_tsv",
+]
+
+
+def install_address_index(using_connection=None, rebuild=True):
+    """Create the address text index for the current database vendor"""
+    conn = using_connection or connection
+    if conn.vendor == 'sqlite':
+        with conn.cursor() as cursor:
+            for sql in _SQLITE_INSTALL:
+                cursor.execute(sql)
+            if rebuild:
+                cursor.execute(f"INSERT INTO {ADDRESS_FTS_TABLE}({ADDRESS_FTS_TABLE}) VALUES ('rebuild')")
+    elif conn.vendor == 'postgresql':
+        with conn.cursor() as cursor:
+            for sql in _POSTGRES_INSTALL:
+                cursor.execute(sql)
+
+
+def uninstall_address_index(using_connection=None):
+    conn = using_connection or connection
+    statements = {'sqlite': _SQLITE_UNINSTALL, 'postgresql': _POSTGRES_UNINSTALL}.get(conn.vendor, [])
+    with conn.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+
+
+def ensure_address_index(using_connection=None):
+    """
+    Re-create the SQLite triggers if a table rebuild dropped them.
+
+    Django rebuilds SQLite tables for many schema changes, and dropping the
+    old table takes its triggers with it, so this runs after every migrate.
+    """
+    conn = using_connection or connection
+    if conn.vendor != 'sqlite':
+        return
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT COUNT(*) FROM sqlite_master WHERE name IN (%s, %s, %s, %s)",
+            [ADDRESS_FTS_TABLE] + [f'{ADDRESS_FTS_TABLE}_{suffix}' for suffix in ('ai', 'ad', 'au')],
+        )
+        if cursor.fetchone()[0] < 4:
+            install_address_index(conn, rebuild=True)
+
+
+def address_tokens(location):
+    """The lowercase words of a location query, all that search_address looks at"""
+    return re.findall(r'\w+', location.lower())
+
+
+def search_address(queryset, location):
+    """
+    Filter a Profile queryset to addresses with a word starting with every
+    word of ``location``: "mirp dhak" finds "Mirpur, Dhaka", "ana" does not
+    find "Banani". Every backend matches this way. SQLite alone also folds
+    diacritics.
+    """
+    tokens = address_tokens(location)
+    if not tokens:
+        return queryset
+
+    vendor = connection.vendor
+    if vendor == 'sqlite':
+        match = ' '.join(f'"{token}"*' for token in tokens)
+        return queryset.filter(id__in=RawSQL(
+            f'SELECT rowid FROM {ADDRESS_FTS_TABLE} WHERE {ADDRESS_FTS_TABLE} MATCH %s',
+            (match,),
+        ))
+
+    if vendor == 'postgresql':
+        # Same expression as the index, so the planner can use it
+        tsvector = _POSTGRES_TSVECTOR.format(column='"accounts_profile"."address"')
+        return queryset.filter(RawSQL(
+            f"{tsvector} @@ to_tsquery('simple', %s)",
+            (postgres_prefix_query(tokens),),
+            output_field=BooleanField(),
+        ))
+
+    # Other backends scan
+    return queryset.filter(word_prefix_condition(tokens))
+
+
+def postgres_prefix_query(tokens):
+    """A to_tsquery() string matching words that start with every token"""
+    return ' & '.join(f"'{token}':*" for token in tokens)
+
+
+def word_prefix_condition(tokens):
+    """Q matching addresses with a word starting with every token, without an index"""
+    condition = Q()
+    for token in tokens:
+        condition &= Q(address__iregex=rf'(^|\W){re.escape(token)}')
+    return condition
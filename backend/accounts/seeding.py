@@ -0,0 +1,217 @@
+"""
+Bulk synthetic data used by the benchmark commands.
+
+Everything is written with bulk_create in batches, so seeding a million
+donors costs a few thousand INSERT statements rather than millions of
+saves. Derived columns that Profile.save() would normally fill are set
+directly.
+"""
+import random
+from datetime import timedelta
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group
+from django.utils import timezone
+from .donations import recalculate_units_pledged
+from .donor_cache import invalidate_donor_groups
+from .geo import load_gazetteer, grid_cell
+from .models import User, Profile, BloodRequest, DonationHistory
+
+# Rough blood group distribution in Bangladesh, in percent
+BLOOD_GROUP_WEIGHTS = {
+    'B+': 31, 'O+': 29, 'A+': 26, 'AB+': 9,
+    'O-': 1.5, 'A-': 1.5, 'B-': 1.5, 'AB-': 0.5,
+}
+
+URGENCY_WEIGHTS = {'low': 20, 'medium': 40, 'high': 30, 'critical': 10}
+REQUEST_STATUS_WEIGHTS = {'pending': 40, 'accepted': 15, 'completed': 35, 'canceled': 10}
+# Share of an accepted request's pledges already confirmed, and the chance of each extra released pledge
+CONFIRMED_RATIO = 0.7
+RELEASED_RATIO = 0.15
+
+
+def _pick(rng, weights):
+    return rng.choices(list(weights), list(weights.values()))[0]
+
+
+def _batches(total, batch_size):
+    for start in range(0, total, batch_size):
+        yield start, min(batch_size, total - start)
+
+
+def random_place(rng):
+    """A random gazetteer place with its coordinates"""
+    places = load_gazetteer()
+    name = rng.choice(sorted(places))
+    return name.title(), places[name]
+
+
+def seed_donors(count, prefix='seed', batch_size=5000, rng=None, available_ratio=0.85, log=None,
+                password=None, roles=('Donor',)):
+    """
+    Insert ``count`` active users with donor profiles, spread around the
+    gazetteer places. Returns the ids of the created users.
+
+    Without ``password`` the users get an unusable one and cannot log in.
+    """
+    rng = rng or random.Random()
+    password = make_password(password)  # hashed once, shared by every seeded user
+    groups = list(BLOOD_GROUP_WEIGHTS)
+    weights = list(BLOOD_GROUP_WEIGHTS.values())
+    role_group_ids = list(Group.objects.filter(name__in=roles).values_list('id', flat=True))
+    membership = User.groups.through
+    today = timezone.localdate()
+    user_ids = []
+
+    for start, size in _batches(count, batch_size):
+        users = User.objects.bulk_create([
+            User(
+                username=f'{prefix}{n}',
+                email=f'{prefix}{n}@example.com',
+                password=password,
+                is_active=True,
+            )
+            for n in range(start, start + size)
+        ])
+
+        profiles = []
+        for user in users:
+            available = rng.random() < available_ratio
+            # Unavailable donors gave blood recently, some available ones a while ago
+            if not available:
+                last_donation_date = today - timedelta(days=rng.randint(1, 55))
+            elif rng.random() < 0.4:
+                last_donation_date = today - timedelta(days=rng.randint(56, 720))
+            else:
+                last_donation_date = None
+            place, (latitude, longitude) = random_place(rng)
+            latitude += rng.gauss(0, 0.03)
+            longitude += rng.gauss(0, 0.03)
+            profiles.append(Profile(
+                user=user,
+                full_name=f'Donor {user.username}',
+                age=rng.randint(18, 60),
+                address=f'House {rng.randint(1, 200)}, {place}',
+                blood_group=rng.choices(groups, weights)[0],
+                is_available_for_donation=available,
+                last_donation_date=last_donation_date,
+                next_eligible_date=Profile.next_eligible_after(last_donation_date),
+                latitude=latitude,
+                longitude=longitude,
+                grid_cell=grid_cell(latitude, longitude),
+            ))
+        Profile.objects.bulk_create(profiles)
+        # bulk_create sends no signals
+        invalidate_donor_groups({profile.blood_group for profile in profiles})
+
+        membership.objects.bulk_create([
+            membership(user_id=user.id, group_id=group_id) for user in users for group_id in role_group_ids
+        ])
+
+        user_ids.extend(user.id for user in users)
+        if log:
+            log(f'  {start + size}/{count} donors')
+
+    return user_ids
+
+
+def seed_requests(requester_ids, count, batch_size=5000, rng=None, log=None):
+    """Insert ``count`` blood requests from random requesters. Returns their ids."""
+    rng = rng or random.Random()
+    now = timezone.now()
+    request_ids = []
+
+    for start, size in _batches(count, batch_size):
+        requests = []
+        for _ in range(size):
+            place, _location = random_place(rng)
+            blood_request = BloodRequest(
+                requester_id=rng.choice(requester_ids),
+                patient_name=f'Patient {rng.randint(1, 10**6)}',
+                blood_group=_pick(rng, BLOOD_GROUP_WEIGHTS),
+                units_needed=rng.randint(1, 4),
+                urgency=_pick(rng, URGENCY_WEIGHTS),
+                hospital_name=f'{place} General Hospital',
+                hospital_address=f'Hospital Road, {place}',
+                contact_phone='01700000000',
+                needed_by_date=now + timedelta(days=rng.randint(0, 30)),
+                status=_pick(rng, REQUEST_STATUS_WEIGHTS),
+            )
+            blood_request.update_derived_fields()
+            requests.append(blood_request)
+        request_ids.extend(obj.id for obj in BloodRequest.objects.bulk_create(requests))
+        if log:
+            log(f'  {start + size}/{count} blood requests')
+
+    return request_ids
+
+
+def _donation_statuses(rng, status, units_needed):
+    """
+    Statuses of one-unit donations a request in ``status`` can have, as the
+    API would have left them: pending requests have free units, accepted ones
+    are fully pledged but not fully confirmed, completed ones fully confirmed
+    and canceled ones had their pledges canceled with them.
+    """
+    if status == 'completed':
+        statuses = ['confirmed'] * units_needed
+    elif status == 'accepted':
+        statuses = ['confirmed' if rng.random() < CONFIRMED_RATIO else 'pending' for _ in range(units_needed)]
+        # Fully confirmed would have completed it
+        statuses[rng.randrange(units_needed)] = 'pending'
+    elif status == 'pending':
+        statuses = ['pending'] * rng.randint(0, units_needed - 1)
+    else:
+        statuses = ['canceled'] * rng.randint(0, units_needed)
+    # Pledges donors took back
+    while rng.random() < RELEASED_RATIO:
+        statuses.append('canceled')
+    return statuses
+
+
+def seed_donations(donor_ids, request_ids, count, batch_size=5000, rng=None, log=None):
+    """
+    Insert donation history rows consistent with their requests, see
+    _donation_statuses. Accepted and completed requests always get their
+    donations, the rest are filled until about ``count`` rows exist. Donors
+    never give to their own request. Returns the number of rows inserted.
+    """
+    rng = rng or random.Random()
+    requests = list(
+        BloodRequest.objects.filter(id__gte=min(request_ids), id__lte=max(request_ids))
+        .values_list('id', 'requester_id', 'status', 'units_needed')
+    )
+    rng.shuffle(requests)
+    # Requests whose status needs donations first, so a small count cannot leave them empty
+    requests.sort(key=lambda r: r[2] not in ('accepted', 'completed'))
+
+    created = 0
+    batch = []
+    for request_id, requester_id, status, units_needed in requests:
+        if created + len(batch) >= count and status not in ('accepted', 'completed'):
+            break
+        statuses = _donation_statuses(rng, status, units_needed)
+        donors = [d for d in rng.sample(donor_ids, min(len(statuses) + 1, len(donor_ids))) if d != requester_id]
+        now = timezone.now()
+        batch.extend(
+            DonationHistory(
+                donor_id=donor_id,
+                recipient_id=requester_id,
+                blood_request_id=request_id,
+                status=donation_status,
+                donation_date=now if donation_status == 'confirmed' else None,
+            )
+            for donor_id, donation_status in zip(donors, statuses)
+        )
+        if len(batch) >= batch_size:
+            DonationHistory.objects.bulk_create(batch)
+            created += len(batch)
+            batch = []
+            if log:
+                log(f'  {created} donations')
+    DonationHistory.objects.bulk_create(batch)
+    created += len(batch)
+
+    recalculate_units_pledged(
+        BloodRequest.objects.filter(id__gte=min(request_ids), id__lte=max(request_ids))
+    )
+    return created
@@ -8,9 +8,20 @@ from django.contrib.auth.models import User
 from django.contrib.auth.models import Group
 from .models import Profile, User
 from .utils import assign_user_roles, get_user_roles
+from .authentication import add_token_claims
+from .blacklist import FilteredRefreshToken
 
 User = get_user_model()
 
+
+def get_display_name(user):
+    """Profile name, falling back to the username when there is no profile"""
+    try:
+        return user.profile.full_name
+    except Profile.DoesNotExist:
+        return user.username
+
+
 class UserRegisterSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, min_length=6)
 
@@ -75,8 +86,8 @@ class CustomTokenObtainPairSerializer(serializers.Serializer):
         if not user.is_active:
             raise serializers.ValidationError({"non_field_errors": ["Account not verified. Please check your email."]})
         
-        # Return the tokens and user data
-        refresh = RefreshToken.for_user(user)
+        # Return the tokens and user data; the claims let requests skip the user lookup
+        refresh = add_token_claims(FilteredRefreshToken.for_user(user), user)
         return {
             "refresh": str(refresh),
             "access": str(refresh.access_token),
@@ -114,7 +125,7 @@ class ProfileSerializer(serializers.ModelSerializer):
         model = Profile
         fields = [
             'id', 'user', 'full_name', 'age', 'address', 
-            'phone_number', 'blood_group', 'last_donation_date', 
+            'phone_number', 'blood_group', 'last_donation_date', 'next_eligible_date',
             'is_available_for_donation', 'created_at', 'updated_at',
             'roles'
         ]
@@ -188,20 +199,22 @@ class BloodRequestSerializer(serializers.ModelSerializer):
         model = BloodRequest
         fields = [
             'id', 'requester', 'requester_name', 'requester_username',
-            'patient_name', 'blood_group', 'units_needed', 'urgency', 
+            'patient_name', 'blood_group', 'units_needed', 'units_pledged', 'urgency', 
             'urgency_display', 'hospital_name', 'hospital_address', 
             'contact_phone', 'needed_by_date', 'status', 'status_display',
             'additional_notes', 'created_at', 'updated_at', 'days_remaining'
         ]
-        read_only_fields = ['requester', 'created_at', 'updated_at']
+        read_only_fields = [
+            'requester', 'created_at', 'updated_at',
+            # Only perform_update, pledge_units, cancel_requests and complete_if_fulfilled
+            # move it, they keep it in step with units_pledged and the donations
+            'status',
+        ]
     
     # Safety check
     def get_requester_name(self, obj):
         """Safely get requester name"""
-        try:
-            return obj.requester.profile.full_name
-        except:
-            return obj.requester.username 
+        return get_display_name(obj.requester)
         
     def get_days_remaining(self, obj):
         """Calculate days remaining until needed_by_date"""
@@ -230,15 +243,17 @@ class BloodRequestSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("Units needed must be greater than 0")
         if value > 10:
             raise serializers.ValidationError("Units needed cannot exceed 10")
+        if self.instance is not None and value < self.instance.units_pledged:
+            raise serializers.ValidationError("Units needed cannot be less than the units already pledged")
         return value
 
 class DonationHistorySerializer(serializers.ModelSerializer):
     """Serializer for DonationHistory model"""
-    donor_name = serializers.CharField(source='donor.profile.full_name', read_only=True)
+    donor_name = serializers.SerializerMethodField()
     donor_username = serializers.CharField(source='donor.username', read_only=True)
     donor_blood_group = serializers.CharField(source='donor.profile.blood_group', read_only=True)
     
-    recipient_name = serializers.CharField(source='recipient.profile.full_name', read_only=True)
+    recipient_name = serializers.SerializerMethodField()
     recipient_username = serializers.CharField(source='recipient.username', read_only=True)
     
     # Blood request details
@@ -261,12 +276,21 @@ class DonationHistorySerializer(serializers.ModelSerializer):
         ]
         read_only_fields = [
             'donor', 'recipient', 'blood_request', 'created_at', 'updated_at',
-            'donation_date'  # Set automatically when confirmed
+            'donation_date',  # Set automatically when confirmed
+            # Only accept_request, confirm_donation and cancel_donation move these,
+            # they keep the request's units_pledged and status in step
+            'units_donated', 'status',
         ]
+    
+    def get_donor_name(self, obj):
+        return get_display_name(obj.donor)
+    
+    def get_recipient_name(self, obj):
+        return get_display_name(obj.recipient)
 
 class SimpleBloodRequestSerializer(serializers.ModelSerializer):
     """Simplified serializer for blood requests (for dropdowns, etc.)"""
-    requester_name = serializers.CharField(source='requester.profile.full_name', read_only=True)
+    requester_name = serializers.SerializerMethodField()
     urgency_display = serializers.CharField(source='get_urgency_display', read_only=True)
     
     class Meta:
@@ -276,6 +300,9 @@ class SimpleBloodRequestSerializer(serializers.ModelSerializer):
             'urgency', 'urgency_display', 'requester_name',
             'needed_by_date', 'status'
         ]
+    
+    def get_requester_name(self, obj):
+        return get_display_name(obj.requester)
 
 class SimpleDonorSerializer(serializers.ModelSerializer):
     """Simplified serializer for donor profiles"""
@@ -0,0 +1,52 @@
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+from .models import User, Profile, BloodRequest
+from .stats import invalidate_global_stats
+from .donor_cache import invalidate_donor_groups
+from .utils import bump_roles_version
+from .authentication import forget_full_user
+
+
+@receiver([post_save, post_delete], sender=Profile)
+@receiver([post_save, post_delete], sender=BloodRequest)
+def clear_dashboard_cache(sender, **kwargs):
+    """Global dashboard numbers depend on every profile and request"""
+    invalidate_global_stats()
+
+
+@receiver([post_save, post_delete], sender=Profile)
+def clear_donor_cache(sender, instance, **kwargs):
+    """Only the donor lists that could show this profile, before or after the change"""
+    invalidate_donor_groups({instance.blood_group, getattr(instance, '_loaded_blood_group', None)})
+    instance._loaded_blood_group = instance.blood_group
+
+
+@receiver([post_save, post_delete], sender=User)
+def clear_full_user_cache(sender, instance, **kwargs):
+    forget_full_user(instance.pk)
+
+
+@receiver(post_save, sender=User)
+def clear_donor_cache_on_rename(sender, instance, created, **kwargs):
+    # Rare (admin only), and the user's group is not at hand, so every list goes
+    loaded = getattr(instance, '_loaded_username', None)
+    if not created and loaded is not None and loaded != instance.username:
+        invalidate_donor_groups()
+    instance._loaded_username = instance.username
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def clear_role_cache(sender, instance, action, reverse, pk_set, **kwargs):
+    """Group changes made outside assign_user_roles (admin, shell) invalidate roles too"""
+    if not reverse:
+        if action.startswith('post_'):
+            bump_roles_version(instance.pk)
+    elif action == 'pre_clear':
+        # group.user_set.clear() gives no pk_set, so remember who was in it
+        instance._cleared_user_ids = list(instance.user_set.values_list('id', flat=True))
+    elif action == 'post_clear':
+        for user_id in instance.__dict__.pop('_cleared_user_ids', []):
+            bump_roles_version(user_id)
+    elif action.startswith('post_'):
+        for user_id in pk_set:
+            bump_roles_version(user_id)
@@ -0,0 +1,48 @@
+from django.core.cache import cache
+from django.db.models import Count, Q
+from .models import Profile, BloodRequest, DonationHistory
+from .serializers import BloodRequestSerializer
+
+# Shared by every dashboard, cleared by the Profile / BloodRequest signals
+GLOBAL_STATS_CACHE_KEY = 'accounts:dashboard:global_stats'
+GLOBAL_STATS_TIMEOUT = 300
+
+
+def get_user_stats(user):
+    """Per-user request and donation counters in one query per table"""
+    stats = BloodRequest.objects.filter(requester_id=user.pk).aggregate(
+        total_requests=Count('id'),
+        pending_requests=Count('id', filter=Q(status='pending')),
+        completed_requests=Count('id', filter=Q(status='completed')),
+    )
+    stats.update(DonationHistory.objects.filter(donor_id=user.pk).aggregate(
+        total_donations=Count('id'),
+        pending_donations=Count('id', filter=Q(status='pending')),
+        completed_donations=Count('id', filter=Q(status='confirmed')),
+    ))
+    return stats
+
+
+def get_global_stats():
+    """Global counters and recent pending requests, served from the cache"""
+    global_stats = cache.get(GLOBAL_STATS_CACHE_KEY)
+    if global_stats is None:
+        recent_requests = (
+            BloodRequest.objects.filter(status='pending')
+            .select_related('requester__profile')
+            .order_by('-created_at')[:5]
+        )
+        global_stats = {
+            'available_donors_count': Profile.objects.eligible().count(),
+            'urgent_requests_count': BloodRequest.objects.filter(
+                status='pending',
+                urgency__in=['high', 'critical']
+            ).count(),
+            'recent_requests': BloodRequestSerializer(recent_requests, many=True).data,
+        }
+        cache.set(GLOBAL_STATS_CACHE_KEY, global_stats, GLOBAL_STATS_TIMEOUT)
+    return global_stats
+
+
+def invalidate_global_stats():
+    cache.delete(GLOBAL_STATS_CACHE_KEY)
@@ -1,3 +1,1301 @@
-from django.test import TestCase
+import asyncio
+import csv
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from io import StringIO
+from unittest import mock
+from datetime import timedelta
+from django.contrib.auth.models import Group
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail.backends.locmem import EmailBackend
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.db.models import Count, F, Q, Sum
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from .authentication import add_token_claims, forget_full_user
+from .blacklist import BloomFilter, FilteredRefreshToken, blacklist_filter
+from .compatibility import BLOOD_GROUPS, DONORS_FOR_RECIPIENT, RECIPIENTS_FOR_DONOR, normalize_blood_group
+from .donations import recalculate_units_pledged
+from .events import LocalBroker, get_broker, publish_request_event
+from .metrics import registry
+from .models import User, Profile, BloodRequest, DonationHistory, OutboxEmail
+from .outbox import CLAIM_LEASE, claim_batch, deliver_batch, queue_email
+from .search import address_tokens, postgres_prefix_query, search_address, word_prefix_condition
+from .seeding import seed_donors, seed_requests, seed_donations
+from .utils import LOCAL_ROLES_CACHE_TIMEOUT, assign_user_roles, setup_user_groups
 
-# Create your tests here.
+# Related rows seeded per run, a route's query count must not change between them
+SIZES = (1, 10, 100)
+
+API = '/api/accounts'
+
+
+def make_user(name, roles=('donor',), blood_group='O+'):
+    """An active user with a profile in the given roles"""
+    user = User.objects.create(username=name, email=f'{name}@example.com')
+    Profile.objects.create(user=user, full_name=name.title(), age=30, address='Mirpur, Dhaka', blood_group=blood_group)
+    assign_user_roles(user, roles)
+    return user
+
+
+def make_request(requester, units_needed=1, blood_group='O+', **fields):
+    return BloodRequest.objects.create(
+        requester=requester,
+        patient_name='Patient',
+        blood_group=blood_group,
+        units_needed=units_needed,
+        urgency='high',
+        hospital_name='Dhaka Medical College Hospital',
+        hospital_address='Secretariat Road, Dhaka',
+        contact_phone='01700000000',
+        needed_by_date=timezone.now() + timedelta(days=2),
+        **fields,
+    )
+
+
+def api_client(user):
+    """Authenticated like a real client, with an access token from login"""
+    token = add_token_claims(FilteredRefreshToken.for_user(user), user).access_token
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+    return client
+
+
+class AccountsTestCase(TestCase):
+    """Role groups in place and an empty cache (throttles, roles, donor and dashboard caches)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        setup_user_groups()
+
+    def setUp(self):
+        cache.clear()
+
+
+class World:
+    """
+    One requester with ``size`` blood requests, each pledged by its own donor,
+    plus a spare donor with nothing pledged and a user without a profile.
+    """
+
+    def __init__(self, size):
+        rng = random.Random(size)
+        prefix = f'budget-{size}-'
+        self.size = size
+        self.requester_id, = seed_donors(1, prefix=f'{prefix}r-', rng=rng, available_ratio=1, roles=('Donor', 'Recipient'))
+        self.donor_ids = seed_donors(size, prefix=f'{prefix}d-', rng=rng, available_ratio=1)
+        self.spare_id, = seed_donors(1, prefix=f'{prefix}s-', rng=rng, available_ratio=1)
+        self.newcomer_id = User.objects.create(username=f'{prefix}n', email=f'{prefix}n@example.com').pk
+
+        now = timezone.now()
+        requests = []
+        for n in range(size):
+            blood_request = BloodRequest(
+                requester_id=self.requester_id,
+                patient_name=f'Patient {n}',
+                blood_group='O+',
+                units_needed=2,
+                urgency='high',
+                hospital_name='Dhaka Medical College Hospital',
+                hospital_address='Secretariat Road, Dhaka',
+                contact_phone='01700000000',
+                needed_by_date=now + timedelta(days=n % 30 + 1),
+            )
+            blood_request.update_derived_fields()
+            requests.append(blood_request)
+        self.request_ids = [br.id for br in BloodRequest.objects.bulk_create(requests)]
+
+        donations = DonationHistory.objects.bulk_create([
+            DonationHistory(donor_id=donor_id, recipient_id=self.requester_id, blood_request_id=request_id)
+            for donor_id, request_id in zip(self.donor_ids, self.request_ids)
+        ])
+        self.donation_ids = [donation.id for donation in donations]
+        recalculate_units_pledged(BloodRequest.objects.filter(id__in=self.request_ids))
+
+    def client(self, user_id):
+        return api_client(User.objects.get(pk=user_id))
+
+    def login(self):
+        # Tokens are issued after the cache is cleared, so their role claims are current
+        self.requester = self.client(self.requester_id)
+        self.donor = self.client(self.donor_ids[0])
+        self.spare = self.client(self.spare_id)
+        self.newcomer = self.client(self.newcomer_id)
+        self.anonymous = APIClient()
+
+
+class QueryBudgetTests(AccountsTestCase):
+    """
+    Every API route runs a fixed number of queries, whatever the amount of
+    related data, and no more than its budget. Each call starts from an
+    empty cache, so the budgets are for the cold path.
+    """
+
+    def assertQueryBudget(self, budget, call, status=200):
+        runs = []
+        for size in SIZES:
+            world = World(size)
+            cache.clear()
+            for user_id in (world.requester_id, world.donor_ids[0], world.spare_id, world.newcomer_id):
+                forget_full_user(user_id)
+            world.login()
+
+            with CaptureQueriesContext(connection) as queries:
+                with self.captureOnCommitCallbacks(execute=True):
+                    response = call(world)
+            self.assertEqual(
+                response.status_code, status,
+                f'size {size}: {response.status_code} {getattr(response, "data", response.content)}'
+            )
+            runs.append((size, queries.captured_queries))
+
+        counts = {size: len(queries) for size, queries in runs}
+        if len(set(counts.values())) > 1 or max(counts.values()) > budget:
+            size, queries = max(runs, key=lambda run: len(run[1]))
+            sql = '\n'.join(f'{n}. {query["sql"]}' for n, query in enumerate(queries, 1))
+            self.fail(f'Queries per size {counts}, budget {budget}. The {size} row run:\n{sql}')
+
+    # Users and profiles
+
+    def test_current_user(self):
+        self.assertQueryBudget(1, lambda w: w.requester.get(f'{API}/me/'))
+
+    def test_profile_get(self):
+        self.assertQueryBudget(1, lambda w: w.requester.get(f'{API}/profile/'))
+
+    def test_profile_create(self):
+        self.assertQueryBudget(8, lambda w: w.newcomer.post(f'{API}/profile/', {
+            'full_name': 'New Donor', 'age': 30, 'address': 'House 1, Mirpur', 'blood_group': 'A+',
+            'roles': ['donor'],
+        }, format='json'), status=201)
+
+    def test_profile_update(self):
+        self.assertQueryBudget(2, lambda w: w.requester.put(
+            f'{API}/profile/', {'phone_number': '01711111111'}, format='json'
+        ))
+
+    # Blood requests
+
+    # Unpaginated lists: the rows plus the aggregate behind their ETag
+    def test_blood_request_list(self):
+        self.assertQueryBudget(2, lambda w: w.requester.get(f'{API}/blood-requests/'))
+
+    def test_blood_request_list_page(self):
+        self.assertQueryBudget(1, lambda w: w.requester.get(f'{API}/blood-requests/?status=pending&page_size=5'))
+
+    def test_blood_request_list_fields(self):
+        self.assertQueryBudget(2, lambda w: w.requester.get(f'{API}/blood-requests/?my_requests=1&fields=id,status'))
+
+    def test_blood_request_retrieve(self):
+        self.assertQueryBudget(1, lambda w: w.requester.get(f'{API}/blood-requests/{w.request_ids[0]}/'))
+
+    def test_blood_request_create(self):
+        self.assertQueryBudget(3, lambda w: w.requester.post(f'{API}/blood-requests/', {
+            'patient_name': 'Patient', 'blood_group': 'B+', 'units_needed': 1, 'urgency': 'critical',
+            'hospital_name': 'Dhaka Medical', 'hospital_address': 'Dhaka Medical, Dhaka',
+            'contact_phone': '01700000000', 'needed_by_date': (timezone.now() + timedelta(days=1)).isoformat(),
+        }, format='json'), status=201)
+
+    def test_blood_request_update(self):
+        self.assertQueryBudget(4, lambda w: w.requester.patch(
+            f'{API}/blood-requests/{w.request_ids[0]}/', {'additional_notes': 'Ward 3'}, format='json'
+        ))
+
+    def test_blood_request_delete(self):
+        self.assertQueryBudget(3, lambda w: w.requester.delete(f'{API}/blood-requests/{w.request_ids[0]}/'), status=204)
+
+    def test_accept_request(self):
+        self.assertQueryBudget(9, lambda w: w.spare.post(f'{API}/blood-requests/{w.request_ids[0]}/accept_request/'))
+
+    def test_cancel_request(self):
+        self.assertQueryBudget(5, lambda w: w.requester.post(f'{API}/blood-requests/{w.request_ids[0]}/cancel_request/'))
+
+    def test_batch_create_requests(self):
+        # A fixed batch: bulk_create splits INSERTs at the backend's parameter limit,
+        # so the batch length itself is not something the count can be constant in
+        def call(w):
+            item = {
+                'patient_name': 'Patient', 'blood_group': 'AB+', 'units_needed': 1, 'urgency': 'low',
+                'hospital_name': 'Dhaka Medical', 'hospital_address': 'Dhaka Medical, Dhaka',
+                'contact_phone': '01700000000', 'needed_by_date': (timezone.now() + timedelta(days=3)).isoformat(),
+            }
+            return w.requester.post(f'{API}/blood-requests/batch_create/', {'requests': [item] * 20}, format='json')
+        self.assertQueryBudget(3, call, status=201)
+
+    def test_batch_cancel_requests(self):
+        self.assertQueryBudget(5, lambda w: w.requester.post(
+            f'{API}/blood-requests/batch_cancel/', {'ids': w.request_ids}, format='json'
+        ))
+
+    def test_triage(self):
+        self.assertQueryBudget(1, lambda w: w.requester.get(f'{API}/blood-requests/triage/'))
+
+    def test_matching_donors(self):
+        self.assertQueryBudget(2, lambda w: w.requester.get(f'{API}/blood-requests/{w.request_ids[0]}/matching_donors/'))
+
+    def test_nearest_donors(self):
+        # One query per ring, so sparse data takes more of them. Asking for more donors
+        # than there are walks every ring out to max_distance_km, the worst case.
+        self.assertQueryBudget(22, lambda w: w.requester.get(
+            f'{API}/blood-requests/{w.request_ids[0]}/nearest_donors/?k=100'
+        ))
+
+    # Donation history
+
+    def test_donation_list(self):
+        self.assertQueryBudget(2, lambda w: w.requester.get(f'{API}/donation-history/'))
+
+    def test_donation_list_page(self):
+        self.assertQueryBudget(1, lambda w: w.requester.get(f'{API}/donation-history/?role=recipient&page_size=5'))
+
+    def test_donation_retrieve(self):
+        self.assertQueryBudget(1, lambda w: w.requester.get(f'{API}/donation-history/{w.donation_ids[0]}/'))
+
+    def test_donation_update(self):
+        self.assertQueryBudget(2, lambda w: w.donor.patch(
+            f'{API}/donation-history/{w.donation_ids[0]}/', {'units_donated': 1}, format='json'
+        ))
+
+    def test_confirm_donation(self):
+        self.assertQueryBudget(6, lambda w: w.requester.post(f'{API}/donation-history/{w.donation_ids[0]}/confirm_donation/'))
+
+    def test_cancel_donation(self):
+        self.assertQueryBudget(6, lambda w: w.donor.post(f'{API}/donation-history/{w.donation_ids[0]}/cancel_donation/'))
+
+    def test_batch_confirm_donations(self):
+        self.assertQueryBudget(7, lambda w: w.requester.post(
+            f'{API}/donation-history/batch_confirm/', {'ids': w.donation_ids}, format='json'
+        ))
+
+    def test_batch_cancel_donations(self):
+        self.assertQueryBudget(6, lambda w: w.requester.post(
+            f'{API}/donation-history/batch_cancel/', {'ids': w.donation_ids}, format='json'
+        ))
+
+    # Dashboard and public search
+
+    def test_dashboard_stats(self):
+        self.assertQueryBudget(6, lambda w: w.requester.get(f'{API}/dashboard-stats/'))
+
+    def test_available_donors(self):
+        self.assertQueryBudget(1, lambda w: w.anonymous.get(f'{API}/available-donors/'))
+
+    def test_available_donors_filtered(self):
+        self.assertQueryBudget(1, lambda w: w.anonymous.get(
+            f'{API}/available-donors/?compatible_with=A%2B&location=Mirpur'
+        ))
+
+
+class DonationUpdateTests(AccountsTestCase):
+    """Units and status only change through the donation actions"""
+
+    def setUp(self):
+        super().setUp()
+        self.requester = make_user('requester', roles=('recipient',))
+        self.donor = make_user('donor')
+        self.blood_request = make_request(self.requester, units_needed=2)
+        self.donor_client = api_client(self.donor)
+        response = self.donor_client.post(f'{API}/blood-requests/{self.blood_request.pk}/accept_request/')
+        self.donation = DonationHistory.objects.get(pk=response.data['donation_id'])
+
+    def test_patch_cannot_change_units(self):
+        response = self.donor_client.patch(
+            f'{API}/donation-history/{self.donation.pk}/', {'units_donated': 5}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.donation.refresh_from_db()
+        self.blood_request.refresh_from_db()
+        self.assertEqual(self.donation.units_donated, 1)
+        self.assertEqual(self.blood_request.units_pledged, 1)
+
+    def test_patch_cannot_change_status(self):
+        response = api_client(self.requester).patch(
+            f'{API}/donation-history/{self.donation.pk}/', {'status': 'confirmed'}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.donation.refresh_from_db()
+        self.assertEqual(self.donation.status, 'pending')
+        self.assertIsNone(Profile.objects.get(user=self.donor).last_donation_date)
+
+
+class BloodRequestUpdateTests(AccountsTestCase):
+    """Editing or canceling a request keeps its status and donations consistent"""
+
+    def setUp(self):
+        super().setUp()
+        self.requester = make_user('requester', roles=('recipient',))
+        self.requester_client = api_client(self.requester)
+        self.blood_request = make_request(self.requester, units_needed=1)
+        response = api_client(make_user('donor')).post(f'{API}/blood-requests/{self.blood_request.pk}/accept_request/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_raising_units_needed_reopens_request(self):
+        response = self.requester_client.patch(f'{API}/blood-requests/{self.blood_request.pk}/', {'units_needed': 2}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.blood_request.refresh_from_db()
+        self.assertEqual(self.blood_request.status, 'pending')
+        self.assertEqual(self.blood_request.units_pledged, 1)
+
+        response = api_client(make_user('second')).post(f'{API}/blood-requests/{self.blood_request.pk}/accept_request/')
+        self.assertEqual(response.status_code, 200)
+        self.blood_request.refresh_from_db()
+        self.assertEqual(self.blood_request.status, 'accepted')
+
+    def test_cannot_lower_units_needed_below_pledged(self):
+        self.requester_client.patch(f'{API}/blood-requests/{self.blood_request.pk}/', {'units_needed': 3}, format='json')
+        api_client(make_user('second')).post(f'{API}/blood-requests/{self.blood_request.pk}/accept_request/')
+        response = self.requester_client.patch(f'{API}/blood-requests/{self.blood_request.pk}/', {'units_needed': 1}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_lowering_units_needed_to_pledged_accepts_request(self):
+        self.requester_client.patch(f'{API}/blood-requests/{self.blood_request.pk}/', {'units_needed': 3}, format='json')
+        response = self.requester_client.patch(f'{API}/blood-requests/{self.blood_request.pk}/', {'units_needed': 1}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.blood_request.refresh_from_db()
+        self.assertEqual(self.blood_request.status, 'accepted')
+
+    def test_cancel_request_cancels_pending_donations(self):
+        response = self.requester_client.post(f'{API}/blood-requests/{self.blood_request.pk}/cancel_request/')
+        self.assertEqual(response.status_code, 200)
+        self.blood_request.refresh_from_db()
+        self.assertEqual(self.blood_request.status, 'canceled')
+        self.assertFalse(self.blood_request.donations.exclude(status='canceled').exists())
+
+    def test_cancel_request_hands_pending_units_back(self):
+        self.requester_client.patch(f'{API}/blood-requests/{self.blood_request.pk}/', {'units_needed': 4}, format='json')
+        donation_id = api_client(make_user('second')).post(
+            f'{API}/blood-requests/{self.blood_request.pk}/accept_request/', {'units': 2}, format='json'
+        ).data['donation_id']
+        self.requester_client.post(f'{API}/donation-history/{donation_id}/confirm_donation/')
+
+        response = self.requester_client.post(f'{API}/blood-requests/{self.blood_request.pk}/cancel_request/')
+        self.assertEqual(response.status_code, 200)
+        self.blood_request.refresh_from_db()
+        # The first donor's pending unit is released, the confirmed ones stay counted
+        self.assertEqual(self.blood_request.units_pledged, 2)
+        live = self.blood_request.donations.exclude(status='canceled').aggregate(total=Sum('units_donated'))['total']
+        self.assertEqual(self.blood_request.units_pledged, live)
+
+    def test_status_is_read_only(self):
+        for new_status in ('pending', 'completed', 'canceled'):
+            with self.subTest(status=new_status):
+                response = self.requester_client.patch(
+                    f'{API}/blood-requests/{self.blood_request.pk}/', {'status': new_status}, format='json'
+                )
+                self.assertEqual(response.status_code, 200)
+                self.blood_request.refresh_from_db()
+                self.assertEqual(self.blood_request.status, 'accepted')
+        self.assertTrue(self.blood_request.donations.filter(status='pending').exists())
+
+    def test_only_requester_can_cancel(self):
+        response = api_client(make_user('other')).post(f'{API}/blood-requests/{self.blood_request.pk}/cancel_request/')
+        self.assertEqual(response.status_code, 403)
+        self.blood_request.refresh_from_db()
+        self.assertEqual(self.blood_request.status, 'accepted')
+
+
+class MetricsTests(TestCase):
+    """Query counts are recorded under WSGI and ASGI alike"""
+
+    def setUp(self):
+        cache.clear()
+
+    def observed_queries(self):
+        """(observations, total queries) recorded for available_donors"""
+        counts = registry.snapshot().get('available_donors GET', {}).get('http_request_queries')
+        return (sum(counts[:-1]), counts[-1]) if counts else (0, 0)
+
+    def test_sync_request_records_queries(self):
+        before = self.observed_queries()
+        self.client.get(f'{API}/available-donors/')
+        after = self.observed_queries()
+        self.assertEqual(after[0] - before[0], 1)
+        self.assertEqual(after[1] - before[1], 1)
+
+    async def test_async_request_records_queries(self):
+        before = self.observed_queries()
+        await self.async_client.get(f'{API}/available-donors/')
+        after = self.observed_queries()
+        self.assertEqual(after[0] - before[0], 1)
+        self.assertEqual(after[1] - before[1], 1)
+
+
+class BulkImportTests(AccountsTestCase):
+    """bulk_import creates valid rows and reports the rest by line number"""
+
+    DONOR_HEADER = 'username,email,full_name,age,address,blood_group,roles\n'
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        return path
+
+    def run_import(self, *args):
+        """(stdout, {line: errors}) of a bulk_import run"""
+        errors_path = os.path.join(self.directory, 'errors.jsonl')
+        out = StringIO()
+        call_command('bulk_import', *args, '--errors', errors_path, stdout=out)
+        with open(errors_path, encoding='utf-8') as f:
+            failures = [json.loads(line) for line in f]
+        return out.getvalue(), {failure['line']: failure['errors'] for failure in failures}
+
+    def test_missing_file_is_a_command_error(self):
+        with self.assertRaisesMessage(CommandError, 'No such file'):
+            call_command('bulk_import', 'donors', '/nonexistent/donors.csv')
+
+    def test_donors_csv(self):
+        path = self.write('donors.csv', self.DONOR_HEADER + (
+            'rahim,rahim@example.com,Rahim Uddin,30,"Mirpur, Dhaka",A+,\n'
+            'karim,karim@example.com,Karim Ali,41,"Banani, Dhaka",O-,donor;recipient\n'
+        ))
+        out, failures = self.run_import('donors', path)
+        self.assertIn('Imported 2 donors', out)
+        self.assertEqual(failures, {})
+
+        rahim = User.objects.get(username='rahim')
+        self.assertTrue(rahim.is_active)
+        self.assertFalse(rahim.has_usable_password())
+        self.assertEqual((rahim.profile.full_name, rahim.profile.blood_group), ('Rahim Uddin', 'A+'))
+        self.assertIsNotNone(rahim.profile.grid_cell)
+        # --roles applies to rows without their own
+        self.assertEqual(list(rahim.groups.values_list('name', flat=True)), ['Donor'])
+        self.assertEqual(
+            sorted(User.objects.get(username='karim').groups.values_list('name', flat=True)),
+            ['Donor', 'Recipient'],
+        )
+
+    def test_default_roles_and_inactive(self):
+        path = self.write('donors.jsonl', json.dumps({
+            'username': 'rahim', 'email': 'rahim@example.com', 'password': 'a-long-password',
+            'full_name': 'Rahim Uddin', 'age': 30, 'address': 'Mirpur, Dhaka', 'blood_group': 'B+',
+        }) + '\n')
+        self.run_import('donors', path, '--roles', 'recipient', '--inactive')
+        rahim = User.objects.get(username='rahim')
+        self.assertFalse(rahim.is_active)
+        self.assertTrue(rahim.check_password('a-long-password'))
+        self.assertEqual(list(rahim.groups.values_list('name', flat=True)), ['Recipient'])
+
+    def test_invalid_rows_are_reported_by_line(self):
+        path = self.write('donors.csv', self.DONOR_HEADER + (
+            'rahim,rahim@example.com,Rahim Uddin,30,Dhaka,A+,\n'
+            'karim,not-an-email,Karim Ali,41,Dhaka,O-,\n'
+            'salma,salma@example.com,Salma Begum,29,Dhaka,C+,\n'
+            'nasir,nasir@example.com,Nasir Khan,35,Dhaka,AB+,admin\n'
+        ))
+        out, failures = self.run_import('donors', path)
+        self.assertIn('Imported 1 donors', out)
+        self.assertEqual(sorted(failures), [3, 4, 5])
+        self.assertIn('email', failures[3])
+        self.assertIn('blood_group', failures[4])
+        self.assertIn('roles', failures[5])
+        self.assertEqual(list(User.objects.values_list('username', flat=True)), ['rahim'])
+
+    def test_duplicates_in_file_and_database(self):
+        make_user('existing')
+        path = self.write('donors.csv', self.DONOR_HEADER + (
+            'rahim,rahim@example.com,Rahim Uddin,30,Dhaka,A+,\n'
+            'rahim,other@example.com,Rahim Again,31,Dhaka,A+,\n'
+            'karim,rahim@example.com,Karim Ali,41,Dhaka,O-,\n'
+            'existing,new@example.com,Existing,50,Dhaka,O+,\n'
+            'salma,existing@example.com,Salma Begum,29,Dhaka,B-,\n'
+        ))
+        out, failures = self.run_import('donors', path, '--chunk-size', '2')
+        self.assertIn('Imported 1 donors', out)
+        self.assertEqual(failures, {
+            3: {'username': ['A user with that username already exists.']},
+            4: {'email': ['A user with that email already exists.']},
+            5: {'username': ['A user with that username already exists.']},
+            6: {'email': ['A user with that email already exists.']},
+        })
+        self.assertEqual(sorted(User.objects.values_list('username', flat=True)), ['existing', 'rahim'])
+
+    def test_requests(self):
+        requester = make_user('requester', roles=('recipient',))
+        needed_by = (timezone.now() + timedelta(days=3)).isoformat()
+        row = {
+            'patient_name': 'Patient', 'blood_group': 'A+', 'units_needed': 2, 'urgency': 'high',
+            'hospital_name': 'Dhaka Medical', 'hospital_address': 'Secretariat Road, Dhaka',
+            'contact_phone': '01700000000', 'needed_by_date': needed_by,
+        }
+        path = self.write('requests.jsonl', '\n'.join([
+            json.dumps({**row, 'requester': 'requester'}),
+            json.dumps({**row, 'requester': 'requester@example.com'}),
+            json.dumps(row),
+            json.dumps({**row, 'requester': 'nobody'}),
+            json.dumps({**row, 'requester': 'requester', 'units_needed': 0}),
+            '{not json',
+        ]) + '\n')
+        out, failures = self.run_import('requests', path)
+        self.assertIn('Imported 2 requests', out)
+        self.assertEqual(sorted(failures), [3, 4, 5, 6])
+        self.assertEqual(failures[3], {'requester': ['This field is required.']})
+        self.assertEqual(failures[4], {'requester': ["Unknown user 'nobody'"]})
+        self.assertIn('units_needed', failures[5])
+        self.assertIn('Invalid JSON', failures[6]['row'][0])
+
+        self.assertEqual(BloodRequest.objects.filter(requester=requester, status='pending').count(), 2)
+        self.assertTrue(all(r.latitude is not None for r in BloodRequest.objects.all()))
+
+        # --requester fills in rows without one
+        _, failures = self.run_import('requests', self.write('more.jsonl', json.dumps(row) + '\n'), '--requester', 'requester')
+        self.assertEqual(failures, {})
+        self.assertEqual(BloodRequest.objects.count(), 3)
+
+
+class RoleCacheTests(AccountsTestCase):
+    """With the in-process cache, a role change made by another worker shows up within seconds"""
+
+    def test_role_added_elsewhere_is_seen_after_local_timeout(self):
+        requester = make_user('requester', roles=('recipient',))
+        blood_request = make_request(requester)
+        user = make_user('newdonor', roles=('recipient',))
+        client = api_client(user)
+        url = f'{API}/blood-requests/{blood_request.pk}/accept_request/'
+        self.assertEqual(client.post(url).status_code, 403)
+
+        # Written the way another worker would, without bumping this process's version
+        User.groups.through.objects.create(user=user, group=Group.objects.get(name='Donor'))
+        self.assertEqual(client.post(url).status_code, 403)
+
+        later = time.time() + LOCAL_ROLES_CACHE_TIMEOUT + 1
+        with mock.patch('time.time', return_value=later):
+            self.assertEqual(client.post(url).status_code, 200)
+
+
+class SeedingTests(AccountsTestCase):
+    """Synthetic data keeps the invariants the API maintains"""
+
+    def test_donations_agree_with_their_requests(self):
+        rng = random.Random(7)
+        donor_ids = seed_donors(20, prefix='seed-d-', rng=rng)
+        requester_ids = seed_donors(5, prefix='seed-r-', rng=rng, roles=('Donor', 'Recipient'))
+        request_ids = seed_requests(requester_ids, 300, rng=rng)
+        created = seed_donations(donor_ids + requester_ids, request_ids, 10_000, rng=rng)
+        self.assertEqual(created, DonationHistory.objects.count())
+
+        self.assertFalse(DonationHistory.objects.filter(donor=F('recipient')).exists())
+        requests = BloodRequest.objects.annotate(
+            live=Sum('donations__units_donated', filter=~Q(donations__status='canceled'), default=0),
+            confirmed=Sum('donations__units_donated', filter=Q(donations__status='confirmed'), default=0),
+            pending=Count('donations', filter=Q(donations__status='pending')),
+        )
+        for blood_request in requests:
+            with self.subTest(status=blood_request.status, id=blood_request.pk):
+                self.assertEqual(blood_request.units_pledged, blood_request.live)
+                self.assertLessEqual(blood_request.live, blood_request.units_needed)
+                if blood_request.status == 'pending':
+                    self.assertLess(blood_request.live, blood_request.units_needed)
+                    self.assertEqual(blood_request.confirmed, 0)
+                elif blood_request.status == 'accepted':
+                    self.assertEqual(blood_request.live, blood_request.units_needed)
+                    self.assertLess(blood_request.confirmed, blood_request.units_needed)
+                elif blood_request.status == 'completed':
+                    self.assertEqual(blood_request.confirmed, blood_request.units_needed)
+                else:
+                    self.assertEqual(blood_request.live, 0)
+
+
+class CompatibilityTests(TestCase):
+    """ABO/Rh red cell compatibility"""
+
+    # Recipient -> donor groups it can take blood from
+    MATRIX = {
+        'O-': {'O-'},
+        'O+': {'O-', 'O+'},
+        'A-': {'O-', 'A-'},
+        'A+': {'O-', 'O+', 'A-', 'A+'},
+        'B-': {'O-', 'B-'},
+        'B+': {'O-', 'O+', 'B-', 'B+'},
+        'AB-': {'O-', 'A-', 'B-', 'AB-'},
+        'AB+': set(BLOOD_GROUPS),
+    }
+
+    def test_donors_for_recipient(self):
+        self.assertEqual(set(DONORS_FOR_RECIPIENT), set(BLOOD_GROUPS))
+        for recipient, donors in self.MATRIX.items():
+            with self.subTest(recipient=recipient):
+                self.assertEqual(set(DONORS_FOR_RECIPIENT[recipient]), donors)
+                self.assertEqual(len(DONORS_FOR_RECIPIENT[recipient]), len(donors))
+
+    def test_recipients_for_donor_is_the_inverse(self):
+        for donor in BLOOD_GROUPS:
+            with self.subTest(donor=donor):
+                expected = {recipient for recipient, donors in self.MATRIX.items() if donor in donors}
+                self.assertEqual(set(RECIPIENTS_FOR_DONOR[donor]), expected)
+
+    def test_exact_match_first_universal_donor_last(self):
+        for recipient, donors in DONORS_FOR_RECIPIENT.items():
+            with self.subTest(recipient=recipient):
+                self.assertEqual(donors[0], recipient)
+                if recipient != 'O-':
+                    self.assertEqual(donors[-1], 'O-')
+
+    def test_normalize_blood_group(self):
+        # '+' arrives as a space in unencoded query strings
+        self.assertEqual(normalize_blood_group('a '), 'A+')
+        self.assertEqual(normalize_blood_group('ab'), 'AB+')
+        self.assertEqual(normalize_blood_group(' o-'), 'O-')
+        self.assertIsNone(normalize_blood_group(''))
+
+
+class AddressSearchTests(AccountsTestCase):
+    """Every word of the query must start a word of the address, on every backend"""
+
+    ADDRESSES = ['Mirpur 10, Dhaka', 'Banani, Dhaka', 'Agrabad, Chattogram', 'Road 5, Dhanmondi']
+
+    def setUp(self):
+        super().setUp()
+        for n, address in enumerate(self.ADDRESSES):
+            Profile.objects.filter(user=make_user(f'donor{n}')).update(address=address)
+
+    def search(self, location):
+        return sorted(search_address(Profile.objects.all(), location).values_list('address', flat=True))
+
+    def scan(self, location):
+        condition = word_prefix_condition(address_tokens(location))
+        return sorted(Profile.objects.filter(condition).values_list('address', flat=True))
+
+    def test_word_prefix_semantics(self):
+        cases = {
+            'mirp dhak': ['Mirpur 10, Dhaka'],
+            'DHA': ['Banani, Dhaka', 'Mirpur 10, Dhaka', 'Road 5, Dhanmondi'],
+            'dhaka banani': ['Banani, Dhaka'],
+            # Inside a word, not at its start
+            'ana': [],
+            'haka': [],
+            '10': ['Mirpur 10, Dhaka'],
+            '': sorted(self.ADDRESSES),
+        }
+        for location, expected in cases.items():
+            with self.subTest(location=location):
+                self.assertEqual(self.search(location), expected)
+                # The fallback for backends without an index agrees with the indexed search
+                self.assertEqual(self.scan(location), expected)
+
+    def test_postgres_prefix_query(self):
+        self.assertEqual(postgres_prefix_query(address_tokens('Mirp, dhak!')), "'mirp':* & 'dhak':*")
+
+    def test_available_donors_location(self):
+        response = APIClient().get(f'{API}/available-donors/?location=dhan')
+        self.assertEqual([donor['address'] for donor in response.data['donors']], ['Road 5, Dhanmondi'])
+
+
+class CompatibleDonorSearchTests(AccountsTestCase):
+
+    def test_available_donors_compatible_with(self):
+        for group in BLOOD_GROUPS:
+            make_user(f'donor{group}', blood_group=group)
+        response = APIClient().get(f'{API}/available-donors/?compatible_with=A-')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([donor['blood_group'] for donor in response.data['donors']], ['A-', 'O-'])
+
+    def test_unknown_group_is_rejected(self):
+        response = APIClient().get(f'{API}/available-donors/?compatible_with=C%2B')
+        self.assertEqual(response.status_code, 400)
+
+
+class PledgeTests(AccountsTestCase):
+    """units_pledged always equals the live donations' units and never exceeds units_needed"""
+
+    def setUp(self):
+        super().setUp()
+        self.requester = make_user('requester', roles=('recipient',))
+        self.blood_request = make_request(self.requester, units_needed=3)
+        self.url = f'{API}/blood-requests/{self.blood_request.pk}/accept_request/'
+
+    def pledge(self, user, units=1):
+        return api_client(user).post(self.url, {'units': units}, format='json')
+
+    def assertUnitsConsistent(self):
+        self.blood_request.refresh_from_db()
+        live = self.blood_request.donations.exclude(status='canceled').aggregate(total=Sum('units_donated'))['total'] or 0
+        self.assertEqual(self.blood_request.units_pledged, live)
+        self.assertLessEqual(live, self.blood_request.units_needed)
+
+    def test_pledges_fill_the_request(self):
+        response = self.pledge(make_user('first'), units=2)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['units_pledged'], 2)
+        self.blood_request.refresh_from_db()
+        self.assertEqual((self.blood_request.status, self.blood_request.units_pledged), ('pending', 2))
+
+        response = self.pledge(make_user('second'), units=2)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Only 1 unit(s)', response.data['error'])
+
+        self.assertEqual(self.pledge(make_user('third')).status_code, 200)
+        self.blood_request.refresh_from_db()
+        self.assertEqual((self.blood_request.status, self.blood_request.units_pledged), ('accepted', 3))
+
+        response = self.pledge(make_user('fourth'))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error'], 'This request is no longer available')
+        self.assertUnitsConsistent()
+
+    def test_one_live_pledge_per_donor(self):
+        donor = make_user('donor')
+        self.assertEqual(self.pledge(donor).status_code, 200)
+        response = self.pledge(donor)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error'], 'You have already accepted this request')
+        self.assertUnitsConsistent()
+        self.assertEqual(self.blood_request.units_pledged, 1)
+
+    def test_invalid_units(self):
+        for units in (0, -1, 'many'):
+            with self.subTest(units=units):
+                self.assertEqual(self.pledge(make_user(f'donor{units}'), units=units).status_code, 400)
+        self.assertUnitsConsistent()
+        self.assertEqual(self.blood_request.units_pledged, 0)
+
+    def test_only_donors_can_pledge(self):
+        self.assertEqual(self.pledge(make_user('recipient', roles=('recipient',))).status_code, 403)
+
+    def test_cancel_hands_units_back(self):
+        donor = make_user('donor')
+        donation_id = self.pledge(donor, units=3).data['donation_id']
+        self.blood_request.refresh_from_db()
+        self.assertEqual(self.blood_request.status, 'accepted')
+
+        response = api_client(donor).post(f'{API}/donation-history/{donation_id}/cancel_donation/')
+        self.assertEqual(response.status_code, 200)
+        self.blood_request.refresh_from_db()
+        self.assertEqual((self.blood_request.status, self.blood_request.units_pledged), ('pending', 0))
+        # The units can be pledged again, by the same donor too
+        self.assertEqual(self.pledge(donor, units=3).status_code, 200)
+        self.assertUnitsConsistent()
+
+    def test_confirming_every_unit_completes_the_request(self):
+        first, second = make_user('first'), make_user('second')
+        donations = [self.pledge(first, units=2).data['donation_id'], self.pledge(second).data['donation_id']]
+        client = api_client(self.requester)
+        self.assertEqual(client.post(f'{API}/donation-history/{donations[0]}/confirm_donation/').status_code, 200)
+        self.blood_request.refresh_from_db()
+        self.assertEqual(self.blood_request.status, 'accepted')
+        self.assertEqual(client.post(f'{API}/donation-history/{donations[1]}/confirm_donation/').status_code, 200)
+        self.blood_request.refresh_from_db()
+        self.assertEqual(self.blood_request.status, 'completed')
+        # A double submit confirms only once
+        self.assertEqual(client.post(f'{API}/donation-history/{donations[1]}/confirm_donation/').status_code, 400)
+        self.assertUnitsConsistent()
+
+    def test_random_pledges_and_cancels_never_over_allocate(self):
+        rng = random.Random(3)
+        donors = [make_user(f'donor{n}') for n in range(6)]
+        clients = {donor.pk: api_client(donor) for donor in donors}
+        for _ in range(60):
+            donor = rng.choice(donors)
+            live = self.blood_request.donations.filter(donor=donor).exclude(status='canceled').first()
+            if live and rng.random() < 0.5:
+                clients[donor.pk].post(f'{API}/donation-history/{live.pk}/cancel_donation/')
+            else:
+                clients[donor.pk].post(self.url, {'units': rng.randint(1, 3)}, format='json')
+            self.assertUnitsConsistent()
+            expected = 'accepted' if self.blood_request.units_pledged == self.blood_request.units_needed else 'pending'
+            self.assertEqual(self.blood_request.status, expected)
+
+
+class EligibilityTests(AccountsTestCase):
+    """next_eligible_date follows the last donation and gates pledges"""
+
+    def test_next_eligible_date_is_derived_on_save(self):
+        donor = make_user('donor')
+        profile = donor.profile
+        self.assertIsNone(profile.next_eligible_date)
+        profile.last_donation_date = timezone.localdate() - timedelta(days=10)
+        profile.save()
+        profile.refresh_from_db()
+        self.assertEqual(profile.next_eligible_date, profile.last_donation_date + Profile.DONATION_INTERVAL)
+        self.assertFalse(Profile.objects.eligible().filter(pk=profile.pk).exists())
+        self.assertTrue(Profile.objects.eligible(today=profile.next_eligible_date).filter(pk=profile.pk).exists())
+
+    def test_confirmed_donation_starts_the_waiting_period(self):
+        requester = make_user('requester', roles=('recipient',))
+        donor = make_user('donor')
+        first, second = make_request(requester), make_request(requester)
+        donation_id = api_client(donor).post(f'{API}/blood-requests/{first.pk}/accept_request/').data['donation_id']
+        api_client(requester).post(f'{API}/donation-history/{donation_id}/confirm_donation/')
+
+        profile = Profile.objects.get(user=donor)
+        self.assertEqual(profile.next_eligible_date, timezone.localdate() + Profile.DONATION_INTERVAL)
+        response = api_client(donor).post(f'{API}/blood-requests/{second.pk}/accept_request/')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('56 days', response.data['error'])
+
+    def test_failed_confirmation_leaves_nothing_behind(self):
+        requester = make_user('requester', roles=('recipient',))
+        donor = make_user('donor')
+        blood_request = make_request(requester)
+        donation_id = api_client(donor).post(f'{API}/blood-requests/{blood_request.pk}/accept_request/').data['donation_id']
+        with mock.patch.object(Profile, 'save', side_effect=RuntimeError('disk full')):
+            with self.assertRaises(RuntimeError):
+                api_client(requester).post(f'{API}/donation-history/{donation_id}/confirm_donation/')
+
+        self.assertEqual(DonationHistory.objects.get(pk=donation_id).status, 'pending')
+        blood_request.refresh_from_db()
+        self.assertEqual(blood_request.status, 'accepted')
+
+
+class KeysetPaginationTests(AccountsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.requester = make_user('requester', roles=('recipient',))
+        self.client = api_client(self.requester)
+        self.requests = [make_request(self.requester) for _ in range(7)]
+        # Ties on created_at are broken by id
+        tie = timezone.now() - timedelta(hours=1)
+        BloodRequest.objects.filter(pk__in=[r.pk for r in self.requests[2:5]]).update(created_at=tie)
+
+    def walk(self, url, before_each_page=None):
+        ids = []
+        while url:
+            if before_each_page:
+                before_each_page()
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids.extend(row['id'] for row in response.data['results'])
+            url = response.data['next']
+        return ids
+
+    def test_pages_cover_every_row_once_in_order(self):
+        expected = list(
+            BloodRequest.objects.order_by('-created_at', '-id').values_list('id', flat=True)
+        )
+        self.assertEqual(self.walk(f'{API}/blood-requests/?page_size=2'), expected)
+
+    def test_new_rows_do_not_shift_later_pages(self):
+        expected = list(BloodRequest.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        ids = self.walk(f'{API}/blood-requests/?page_size=2', lambda: make_request(self.requester))
+        # Rows created after the first page sort before the cursor and are not repeated or skipped over
+        self.assertEqual([pk for pk in ids if pk in expected], expected)
+        self.assertEqual(len(ids), len(set(ids)))
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get(f'{API}/blood-requests/?cursor=not-a-cursor').status_code, 404)
+
+
+class ConditionalGetTests(AccountsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.requester = make_user('requester', roles=('recipient',))
+        self.client = api_client(self.requester)
+        self.blood_request = make_request(self.requester)
+        self.url = f'{API}/blood-requests/{self.blood_request.pk}/'
+
+    def test_unchanged_resource_is_not_modified(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_change_gives_a_new_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        self.client.patch(self.url, {'additional_notes': 'Ward 3'}, format='json')
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_list_and_profile(self):
+        for url in (f'{API}/blood-requests/', f'{API}/blood-requests/?page_size=5', f'{API}/profile/', f'{API}/me/'):
+            with self.subTest(url=url):
+                etag = self.client.get(url)['ETag']
+                self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+
+class BatchTests(AccountsTestCase):
+    """Batch actions apply the valid items and report the rest one by one"""
+
+    def setUp(self):
+        super().setUp()
+        self.requester = make_user('requester', roles=('recipient',))
+        self.client = api_client(self.requester)
+
+    def test_batch_create_partial_failure(self):
+        item = {
+            'patient_name': 'Patient', 'blood_group': 'A+', 'units_needed': 1, 'urgency': 'low',
+            'hospital_name': 'Dhaka Medical', 'hospital_address': 'Dhaka Medical, Dhaka',
+            'contact_phone': '01700000000', 'needed_by_date': (timezone.now() + timedelta(days=3)).isoformat(),
+        }
+        response = self.client.post(f'{API}/blood-requests/batch_create/', {
+            'requests': [item, {**item, 'units_needed': 0}, item],
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([created['index'] for created in response.data['created']], [0, 2])
+        self.assertEqual([error['index'] for error in response.data['errors']], [1])
+        self.assertIn('units_needed', response.data['errors'][0]['errors'])
+        self.assertEqual(BloodRequest.objects.filter(requester=self.requester).count(), 2)
+
+    def test_batch_cancel_partial_failure(self):
+        own = make_request(self.requester)
+        completed = make_request(self.requester, status='completed')
+        other = make_request(make_user('other', roles=('recipient',)))
+        response = self.client.post(f'{API}/blood-requests/batch_cancel/', {
+            'ids': [own.pk, completed.pk, other.pk, 999999],
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['canceled'], [own.pk])
+        self.assertEqual(
+            {error['id']: error['error'] for error in response.data['errors']},
+            {
+                completed.pk: 'Cannot cancel completed requests',
+                other.pk: 'You can only cancel your own requests',
+                999999: 'Not found',
+            },
+        )
+        statuses = dict(BloodRequest.objects.values_list('pk', 'status'))
+        self.assertEqual((statuses[own.pk], statuses[completed.pk], statuses[other.pk]), ('canceled', 'completed', 'pending'))
+
+    def test_batch_confirm_partial_failure(self):
+        blood_request = make_request(self.requester, units_needed=2)
+        donations = [
+            api_client(make_user(f'donor{n}')).post(
+                f'{API}/blood-requests/{blood_request.pk}/accept_request/'
+            ).data['donation_id']
+            for n in range(2)
+        ]
+        self.client.post(f'{API}/donation-history/{donations[1]}/cancel_donation/')
+        response = self.client.post(f'{API}/donation-history/batch_confirm/', {'ids': donations}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['confirmed'], [donations[0]])
+        self.assertEqual(response.data['errors'], [{'id': donations[1], 'error': 'This donation cannot be confirmed'}])
+
+    def test_invalid_ids(self):
+        for ids in ([], 'all', [1, 'x'], list(range(501))):
+            with self.subTest(ids=str(ids)[:20]):
+                response = self.client.post(f'{API}/blood-requests/batch_cancel/', {'ids': ids}, format='json')
+                self.assertEqual(response.status_code, 400)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class LoginTests(AccountsTestCase):
+    """Login throttling and refresh token blacklisting"""
+
+    def setUp(self):
+        super().setUp()
+        blacklist_filter.reset()
+        self.user = User.objects.create_user(username='donor', email='donor@example.com', password='a-long-password')
+
+    def login(self, password='a-long-password', **extra):
+        return self.client.post(f'{API}/login/', {'email': 'donor@example.com', 'password': password}, **extra)
+
+    def test_account_bucket_throttles_failed_logins(self):
+        # login_account is 5/min, the other IPs keep the per-IP bucket out of it
+        for n in range(5):
+            self.assertEqual(self.login('wrong', REMOTE_ADDR=f'10.0.0.{n}').status_code, 400)
+        response = self.login(REMOTE_ADDR='10.0.0.9')
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+
+    def test_ip_bucket_throttles_logins_across_accounts(self):
+        # login_ip is 20/min
+        statuses = [
+            self.client.post(f'{API}/login/', {'email': f'user{n}@example.com', 'password': 'x'}).status_code
+            for n in range(21)
+        ]
+        self.assertEqual(statuses[:20], [400] * 20)
+        self.assertEqual(statuses[20], 429)
+
+    def test_rotated_refresh_token_is_rejected(self):
+        refresh = self.login().data['refresh']
+        response = self.client.post('/api/token/refresh/', {'refresh': refresh})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.post('/api/token/refresh/', {'refresh': refresh}).status_code, 401)
+        self.assertEqual(self.client.post('/api/token/refresh/', {'refresh': response.data['refresh']}).status_code, 200)
+
+    def test_logged_out_refresh_token_is_rejected(self):
+        tokens = self.login().data
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens['access']}")
+        self.assertEqual(client.post(f'{API}/logout/', {'refresh': tokens['refresh']}).status_code, 205)
+        self.assertEqual(self.client.post('/api/token/refresh/', {'refresh': tokens['refresh']}).status_code, 401)
+
+    def test_blacklist_survives_a_filter_rebuild(self):
+        refresh = self.login().data['refresh']
+        self.client.post('/api/token/refresh/', {'refresh': refresh})
+        # Another process starts with an empty filter and rebuilds it from the table
+        blacklist_filter.reset()
+        self.assertEqual(self.client.post('/api/token/refresh/', {'refresh': refresh}).status_code, 401)
+
+
+class BloomFilterTests(TestCase):
+
+    def test_no_false_negatives_and_few_false_positives(self):
+        bloom = BloomFilter(1000, false_positive_rate=0.01)
+        added = [f'jti-{n}' for n in range(1000)]
+        for value in added:
+            bloom.add(value)
+        self.assertTrue(all(value in bloom for value in added))
+        self.assertEqual(bloom.count, 1000)
+        false_positives = sum(f'other-{n}' in bloom for n in range(10_000))
+        self.assertLess(false_positives, 300)
+
+    def test_re_adding_does_not_count_twice(self):
+        bloom = BloomFilter(10)
+        bloom.add('a')
+        bloom.add('a')
+        self.assertEqual(bloom.count, 1)
+
+
+class FailingEmailBackend(EmailBackend):
+    """An SMTP server that is down"""
+
+    def send_messages(self, messages):
+        raise ConnectionRefusedError('Connection refused')
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class OutboxTests(AccountsTestCase):
+    """Emails are queued with the change and delivered, retried or given up on by the worker"""
+
+    def queue(self, recipient='donor@example.com'):
+        return queue_email('Subject', 'Body', recipient, from_email='bank@example.com')
+
+    def test_register_queues_the_verification_email(self):
+        response = self.client.post(f'{API}/register/', {
+            'username': 'donor', 'email': 'donor@example.com', 'password': 'a-long-password',
+        })
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(mail.outbox, [])
+        email = OutboxEmail.objects.get()
+        self.assertEqual((email.recipient, email.status), ('donor@example.com', 'pending'))
+        self.assertIn('/verify/', email.body)
+
+    def test_delivery_marks_the_row_sent(self):
+        email = self.queue()
+        self.assertEqual(deliver_batch(), (1, 0))
+        self.assertEqual([message.to for message in mail.outbox], [['donor@example.com']])
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts, email.last_error), ('sent', 1, ''))
+        self.assertIsNotNone(email.sent_at)
+        # Drained
+        self.assertEqual(deliver_batch(), (0, 0))
+
+    def test_failure_retries_with_backoff(self):
+        email = self.queue()
+        for attempts, delay in ((1, 30), (2, 60), (3, 120)):
+            before = timezone.now()
+            self.assertEqual(deliver_batch(connection=FailingEmailBackend()), (0, 1))
+            email.refresh_from_db()
+            self.assertEqual((email.status, email.attempts), ('pending', attempts))
+            self.assertIn('ConnectionRefusedError', email.last_error)
+            self.assertGreaterEqual(email.next_attempt_at, before + timedelta(seconds=delay))
+            self.assertLess(email.next_attempt_at, timezone.now() + timedelta(seconds=delay))
+            # Not due yet
+            self.assertEqual(deliver_batch(), (0, 0))
+            OutboxEmail.objects.filter(pk=email.pk).update(next_attempt_at=timezone.now())
+        self.assertEqual(mail.outbox, [])
+
+    def test_gives_up_after_max_attempts(self):
+        email = self.queue()
+        OutboxEmail.objects.filter(pk=email.pk).update(attempts=2)
+        self.assertEqual(deliver_batch(max_attempts=3, connection=FailingEmailBackend()), (0, 1))
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), ('failed', 3))
+        OutboxEmail.objects.filter(pk=email.pk).update(next_attempt_at=timezone.now())
+        self.assertEqual(deliver_batch(), (0, 0))
+
+    def test_claimed_rows_are_not_claimed_twice(self):
+        first, second = self.queue('first@example.com'), self.queue('second@example.com')
+        before = timezone.now()
+        self.assertEqual([email.pk for email in claim_batch(1)], [first.pk])
+        self.assertEqual([email.pk for email in claim_batch(10)], [second.pk])
+        self.assertEqual(claim_batch(10), [])
+        first.refresh_from_db()
+        self.assertGreaterEqual(first.next_attempt_at, before + CLAIM_LEASE)
+
+    def test_command_drains_the_queue(self):
+        for n in range(3):
+            self.queue(f'donor{n}@example.com')
+        out = StringIO()
+        call_command('send_outbox_emails', '--once', '--batch-size', '2', stdout=out)
+        self.assertEqual(out.getvalue().splitlines(), ['Sent 2, failed 0', 'Sent 1, failed 0'])
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertFalse(OutboxEmail.objects.filter(status='pending').exists())
+
+
+class ExportTests(AccountsTestCase):
+    """Admin-only streaming exports, whole or narrowed by status and creation day"""
+
+    def setUp(self):
+        super().setUp()
+        self.admin = api_client(make_user('admin', roles=('admin',)))
+        requester = make_user('requester', roles=('recipient',))
+        self.pending = make_request(requester)
+        self.canceled = make_request(requester, status='canceled')
+        self.old = make_request(requester)
+        BloodRequest.objects.filter(pk=self.old.pk).update(created_at=timezone.now() - timedelta(days=30))
+        self.donation = DonationHistory.objects.create(
+            donor=make_user('donor'), recipient=requester, blood_request=self.pending, units_donated=1,
+        )
+
+    def fetch(self, url):
+        response = self.admin.get(url)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv(self):
+        rows = list(csv.DictReader(StringIO(self.fetch(f'{API}/export/blood-requests/'))))
+        self.assertEqual([int(row['id']) for row in rows], [self.pending.pk, self.canceled.pk, self.old.pk])
+        self.assertEqual(rows[0]['requester__username'], 'requester')
+        self.assertEqual(rows[1]['status'], 'canceled')
+
+    def test_ndjson(self):
+        response = self.admin.get(f'{API}/export/donation-history/?output=ndjson')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertIn('attachment; filename="donations-', response['Content-Disposition'])
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(
+            (rows[0]['id'], rows[0]['donor__username'], rows[0]['blood_request_id'], rows[0]['status']),
+            (self.donation.pk, 'donor', self.pending.pk, 'pending'),
+        )
+
+    def test_filters(self):
+        def ids(query):
+            rows = csv.DictReader(StringIO(self.fetch(f'{API}/export/blood-requests/?{query}')))
+            return [int(row['id']) for row in rows]
+
+        today = timezone.localdate()
+        self.assertEqual(ids('status=canceled'), [self.canceled.pk])
+        self.assertEqual(ids(f'since={today}'), [self.pending.pk, self.canceled.pk])
+        self.assertEqual(ids(f'until={today - timedelta(days=1)}'), [self.old.pk])
+        self.assertEqual(ids(f'status=pending&since={today}&until={today}'), [self.pending.pk])
+
+    def test_invalid_filters(self):
+        for query in ('status=lost', 'since=yesterday', 'output=xml'):
+            with self.subTest(query=query):
+                self.assertEqual(self.admin.get(f'{API}/export/blood-requests/?{query}').status_code, 400)
+
+    def test_admins_only(self):
+        for url in (f'{API}/export/blood-requests/', f'{API}/export/donation-history/'):
+            with self.subTest(url=url):
+                self.assertEqual(api_client(self.pending.requester).get(url).status_code, 403)
+                self.assertEqual(APIClient().get(url).status_code, 401)
+
+    def test_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'requests.csv')
+            call_command('export_records', 'requests', '--output', path, '--status', 'pending', stderr=StringIO())
+            with open(path, encoding='utf-8') as f:
+                rows = list(csv.DictReader(f))
+        self.assertEqual([int(row['id']) for row in rows], [self.pending.pk, self.old.pk])
+
+        with self.assertRaisesMessage(CommandError, 'since must be a date'):
+            call_command('export_records', 'requests', '--since', '2026-13-01')
+
+
+class EventTests(AccountsTestCase):
+    """Request changes reach subscribed event streams once they commit"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.requester = make_user('requester', roles=('recipient',))
+        cls.blood_request = make_request(cls.requester, blood_group='A+')
+        cls.token = str(add_token_claims(FilteredRefreshToken.for_user(cls.requester), cls.requester).access_token)
+
+    async def test_local_broker_delivers_to_subscribers(self):
+        broker = LocalBroker()
+        first, second = broker.subscribe(), broker.subscribe()
+        broker.publish({'type': 'request.created'})
+        # Publishers may run in another thread, as sync views do under ASGI
+        publisher = threading.Thread(target=broker.publish, args=({'type': 'request.reopened'},))
+        publisher.start()
+        publisher.join()
+        for subscription in (first, second):
+            self.assertEqual(await asyncio.wait_for(subscription.get(), 1), {'type': 'request.created'})
+            self.assertEqual(await asyncio.wait_for(subscription.get(), 1), {'type': 'request.reopened'})
+
+        second.close()
+        broker.publish({'type': 'request.canceled'})
+        self.assertEqual(await asyncio.wait_for(first.get(), 1), {'type': 'request.canceled'})
+        await asyncio.sleep(0)
+        self.assertTrue(second.queue.empty())
+
+    def test_published_on_commit_only(self):
+        with mock.patch.object(get_broker(), 'publish') as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                publish_request_event('created', self.blood_request)
+            try:
+                with transaction.atomic():
+                    publish_request_event('canceled', self.blood_request)
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        self.assertEqual([c.args[0]['type'] for c in publish.call_args_list], ['request.created'])
+        self.assertEqual(publish.call_args.args[0]['request']['id'], self.blood_request.pk)
+
+    def test_views_publish_created_and_reopened(self):
+        item = {
+            'patient_name': 'Patient', 'blood_group': 'B+', 'units_needed': 1, 'urgency': 'low',
+            'hospital_name': 'Dhaka Medical', 'hospital_address': 'Dhaka Medical, Dhaka',
+            'contact_phone': '01700000000', 'needed_by_date': (timezone.now() + timedelta(days=3)).isoformat(),
+        }
+        donor = api_client(make_user('donor'))
+        with mock.patch.object(get_broker(), 'publish') as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                api_client(self.requester).post(f'{API}/blood-requests/', item, format='json')
+            with self.captureOnCommitCallbacks(execute=True):
+                donation_id = donor.post(
+                    f'{API}/blood-requests/{self.blood_request.pk}/accept_request/'
+                ).data['donation_id']
+            with self.captureOnCommitCallbacks(execute=True):
+                donor.post(f'{API}/donation-history/{donation_id}/cancel_donation/')
+        events = [(c.args[0]['type'], c.args[0]['request']['blood_group']) for c in publish.call_args_list]
+        self.assertEqual(events, [('request.created', 'B+'), ('request.accepted', 'A+'), ('request.reopened', 'A+')])
+
+    async def test_stream_requires_authentication(self):
+        for query in ('', '?token=not-a-token'):
+            with self.subTest(query=query):
+                response = await self.async_client.get(f'{API}/events/{query}')
+                self.assertEqual(response.status_code, 401)
+
+    async def test_stream_sends_wanted_events(self):
+        # An A- donor can give to A-, A+, AB- and AB+
+        response = await self.async_client.get(f'{API}/events/', {'token': self.token, 'blood_group': 'A-'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        chunks = aiter(response.streaming_content)
+        self.assertEqual(await anext(chunks), b'retry: 5000\n\n')
+
+        stranger = {'id': 1, 'requester_id': 0, 'urgency': 'low'}
+        own = {'id': 2, 'requester_id': self.requester.pk, 'blood_group': 'O-', 'urgency': 'low'}
+        for kind, blood_request in (
+            ('created', {**stranger, 'blood_group': 'B+'}),
+            ('created', {**stranger, 'blood_group': 'AB+'}),
+            ('reopened', own),
+        ):
+            get_broker().publish({'type': f'request.{kind}', 'request': blood_request})
+        received = [await asyncio.wait_for(anext(chunks), 1) for _ in range(2)]
+        self.assertEqual(received, [
+            f"event: request.created\ndata: {json.dumps({**stranger, 'blood_group': 'AB+'})}\n\n".encode(),
+            f"event: request.reopened\ndata: {json.dumps(own)}\n\n".encode(),
+        ])
+
+        # The server cancels the pending read when the client goes away, which unsubscribes
+        subscribers = len(get_broker()._subscribers)
+        pending = asyncio.ensure_future(anext(chunks))
+        await asyncio.sleep(0)
+        pending.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await pending
+        self.assertEqual(len(get_broker()._subscribers), subscribers - 1)
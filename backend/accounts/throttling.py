@@ -0,0 +1,68 @@
+"""
+Token-bucket throttles for the login and register endpoints.
+
+A bucket holds up to N tokens for a rate of "N/period" and refills at
+N per period, so short bursts get through while sustained guessing is held
+to the rate. Buckets live in the default cache as (tokens, timestamp), one
+small value per IP or account instead of DRF's list of request times.
+
+Read-modify-write on the cache is not atomic, so concurrent requests can
+occasionally share a token, the same trade-off DRF's own throttles make.
+"""
+import hashlib
+import math
+from rest_framework.throttling import SimpleRateThrottle
+
+
+class TokenBucketThrottle(SimpleRateThrottle):
+    """SimpleRateThrottle with the sliding window swapped for a token bucket"""
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        self.now = self.timer()
+        refill_rate = self.num_requests / self.duration
+        tokens, updated = self.cache.get(self.key, (self.num_requests, self.now))
+        tokens = min(self.num_requests, tokens + (self.now - updated) * refill_rate)
+        if tokens < 1:
+            self.wait_seconds = (1 - tokens) / refill_rate
+            return False
+
+        # Kept until the bucket would be full again, after that it is as good as new
+        self.cache.set(self.key, (tokens - 1, self.now), math.ceil(self.duration))
+        return True
+
+    def wait(self):
+        return getattr(self, 'wait_seconds', None)
+
+
+class LoginIPThrottle(TokenBucketThrottle):
+    scope = 'login_ip'
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {'scope': self.scope, 'ident': self.get_ident(request)}
+
+
+class LoginAccountThrottle(TokenBucketThrottle):
+    """Per email or username tried, so spreading guesses over many IPs does not help"""
+    scope = 'login_account'
+
+    def get_cache_key(self, request, view):
+        # The login form sends email or username in ``email``; no lookup before the throttle
+        identifier = request.data.get('email') if hasattr(request.data, 'get') else None
+        if not identifier or not isinstance(identifier, str):
+            return None
+        ident = hashlib.md5(identifier.strip().lower().encode(), usedforsecurity=False).hexdigest()
+        return self.cache_format % {'scope': self.scope, 'ident': ident}
+
+
+class RegisterIPThrottle(TokenBucketThrottle):
+    scope = 'register_ip'
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {'scope': self.scope, 'ident': self.get_ident(request)}
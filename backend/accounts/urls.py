@@ -19,11 +19,19 @@ urlpatterns = [
     
     # Profile endpoints --let's see
     path('profile/', views.ProfileView.as_view(), name='profile'),
+    path('me/', views.CurrentUserView.as_view(), name='current_user'),
     
     # Dashboard and stats endpoints (function-based views don’t need .as_view())
     path('dashboard-stats/', views.dashboard_stats, name='dashboard_stats'),
     path('available-donors/', views.available_donors, name='available_donors'),
     
+    # Streaming exports for auditors (?output=csv|ndjson)
+    path('export/donation-history/', views.export_donation_history, name='export_donation_history'),
+    path('export/blood-requests/', views.export_blood_requests, name='export_blood_requests'),
+    
+    # Live blood request events (Server-Sent Events, served under ASGI)
+    path('events/', views.request_events, name='request_events'),
+    
     # Include router URLs (blood-requests/ and donation-history/)
     path('', include(router.urls)),
 ]
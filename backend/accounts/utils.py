@@ -1,7 +1,20 @@
+import uuid
+from django.conf import settings
 from django.contrib.auth.models import Group, Permission
 from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
 from .models import User, BloodRequest, DonationHistory
 
+# Role lookups are cached per user under a version that changes whenever the
+# user's groups do, so stale entries are never read and simply expire
+ROLES_VERSION_KEY = 'accounts:roles_version:{user_id}'
+ROLES_CACHE_KEY = 'accounts:roles:{user_id}:{version}'
+ROLES_CACHE_TIMEOUT = 60 * 60
+# A process-local cache only sees the bumps made in its own worker, so there
+# roles (and the versions token claims are checked against) live a few seconds
+LOCAL_ROLES_CACHE_TIMEOUT = 5
+LOCAL_CACHE_BACKENDS = {'django.core.cache.backends.locmem.LocMemCache'}
+
 def setup_user_groups():
     """Create user groups with appropriate permissions"""
     
@@ -37,28 +50,66 @@ def setup_user_groups():
 
 def assign_user_roles(user, roles):
     """Assign roles to a user. Roles can be: 'admin', 'donor', 'recipient'"""
-    user.groups.clear()  # Clear existing groups
-    
     role_mapping = {
         'admin': 'Admin',
         'donor': 'Donor',
         'recipient': 'Recipient',
     }
     
-    for role in roles:
-        if role in role_mapping:
-            group = Group.objects.get(name=role_mapping[role])
-            user.groups.add(group)
+    group_names = [role_mapping[role] for role in roles if role in role_mapping]
+    user.groups.set(Group.objects.filter(name__in=group_names))
+    bump_roles_version(user.pk)
+    user.__dict__.pop('_group_names', None)
+
+def _is_local_cache():
+    return settings.CACHES['default']['BACKEND'] in LOCAL_CACHE_BACKENDS
+
+def _version_timeout():
+    return LOCAL_ROLES_CACHE_TIMEOUT if _is_local_cache() else None
+
+def _roles_timeout():
+    return LOCAL_ROLES_CACHE_TIMEOUT if _is_local_cache() else ROLES_CACHE_TIMEOUT
+
+def get_roles_version(user_id):
+    """Current roles version for a user, created on first use"""
+    key = ROLES_VERSION_KEY.format(user_id=user_id)
+    version = cache.get(key)
+    if version is None:
+        # A fresh random version, so entries from before a cache flush never match
+        cache.add(key, uuid.uuid4().hex, _version_timeout())
+        version = cache.get(key)
+    return version
+
+def bump_roles_version(user_id):
+    cache.set(ROLES_VERSION_KEY.format(user_id=user_id), uuid.uuid4().hex, _version_timeout())
+
+def get_group_names(user):
+    """Names of the user's groups: one cache lookup per request, a query only on a miss"""
+    names = user.__dict__.get('_group_names')
+    if names is None:
+        key = ROLES_CACHE_KEY.format(user_id=user.pk, version=get_roles_version(user.pk))
+        names = cache.get(key)
+        if names is None:
+            names = tuple(
+                Group.objects.filter(user__id=user.pk).order_by('id').values_list('name', flat=True)
+            )
+            cache.set(key, names, _roles_timeout())
+        user.__dict__['_group_names'] = names
+    return names
+
+def remember_group_names(user, names):
+    """Seed the per-request cache with names the caller already has (e.g. token claims)"""
+    user.__dict__['_group_names'] = tuple(names)
 
 def get_user_roles(user):
     """Get user's current roles"""
-    return [group.name.lower() for group in user.groups.all()]
+    return [name.lower() for name in get_group_names(user)]
 
 def is_donor(user):
-    return user.groups.filter(name='Donor').exists()
+    return 'Donor' in get_group_names(user)
 
 def is_recipient(user):
-    return user.groups.filter(name='Recipient').exists()
+    return 'Recipient' in get_group_names(user)
 
 def is_admin(user):
-    return user.groups.filter(name='Admin').exists() or user.is_superuser
\ No newline at end of file
+    return 'Admin' in get_group_names(user) or user.is_superuser
@@ -1,7 +1,10 @@
+import asyncio
+import hmac
+import json
 from django.contrib.auth.tokens import default_token_generator
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.utils.encoding import force_bytes, force_str
-from django.core.mail import send_mail
+from django.db import transaction
 from django.conf import settings
 from rest_framework.views import APIView
 from rest_framework.response import Response
@@ -12,6 +15,9 @@ from rest_framework_simplejwt.tokens import RefreshToken
 from .models import User, Profile
 from .serializers import UserRegisterSerializer, UserSerializer, ProfileSerializer
 from django.shortcuts import redirect
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from rest_framework.exceptions import AuthenticationFailed, ValidationError
+from rest_framework_simplejwt.exceptions import InvalidToken
 from accounts.models import User
 from rest_framework_simplejwt.views import TokenObtainPairView
 from .serializers import CustomTokenObtainPairSerializer,BloodRequestSerializer, DonationHistorySerializer
@@ -21,39 +27,91 @@ from rest_framework.viewsets import ModelViewSet
 from django.contrib.auth.models import Group
 from django.db.models import Q
 from datetime import date, timedelta
-from .utils import get_user_roles
+from django.utils import timezone
+from .utils import get_user_roles, is_donor, is_admin
+from .pagination import KeysetPagination, TriagePagination
+from .stats import get_user_stats, get_global_stats, invalidate_global_stats
+from .search import search_address
+from .geo import nearest
+from .outbox import queue_email
+from .compatibility import BLOOD_GROUPS, DONORS_FOR_RECIPIENT, RECIPIENTS_FOR_DONOR, compatible_donors, normalize_blood_group
+from .authentication import StatelessJWTAuthentication, get_full_user
+from .events import get_broker, publish_request_event
+from .blacklist import FilteredRefreshToken
+from .throttling import LoginIPThrottle, LoginAccountThrottle, RegisterIPThrottle
+from .donor_cache import get_available_donors
+from .metrics import collect, render_prometheus
+from .projections import BLOOD_REQUEST_PROJECTION, SparseFieldsMixin
+from .conditional import ConditionalGetMixin, make_etag, not_modified, set_validators
+from .donations import (
+    PledgeError, pledge_units, release_units, complete_if_fulfilled,
+    cancel_requests, confirm_donations, release_donations,
+)
+from .exporting import CONTENT_TYPES, export_filters, stream_export
 
 
 
 User = get_user_model()
 
+# Donor fields that are safe to show publicly
+DONOR_PUBLIC_FIELDS = (
+    'id',
+    'full_name',
+    'blood_group',
+    'address',
+    'user__username',
+    'last_donation_date'
+)
+
+# Most items one batch call may carry
+MAX_BATCH_SIZE = 500
+
+
+def _batch_ids(request):
+    """Deduplicated ``ids`` from a batch request body, None if missing or invalid"""
+    ids = request.data.get('ids') if hasattr(request.data, 'get') else None
+    if not isinstance(ids, list) or not 0 < len(ids) <= MAX_BATCH_SIZE:
+        return None
+    try:
+        return list(dict.fromkeys(int(pk) for pk in ids))
+    except (TypeError, ValueError):
+        return None
+
+
+def _invalid_batch():
+    return Response(
+        {'error': f'ids must be a list of 1 to {MAX_BATCH_SIZE} ids'},
+        status=status.HTTP_400_BAD_REQUEST
+    )
+
 
 
 class RegisterView(APIView):
+    throttle_classes = [RegisterIPThrottle]
+    
     def post(self, request):
         serializer = UserRegisterSerializer(data=request.data)
         if serializer.is_valid():
-            user = serializer.save()
-
-            # Generate token + uid
-            token = default_token_generator.make_token(user)
-            uid = urlsafe_base64_encode(force_bytes(user.pk))
+            # The user row and its verification email commit together
+            with transaction.atomic():
+                user = serializer.save()
 
-            # Build verification URL (one correct way)
+                # Generate token + uid
+                token = default_token_generator.make_token(user)
+                uid = urlsafe_base64_encode(force_bytes(user.pk))
 
-            FRONTEND_URL = getattr(settings, "FRONTEND_URL")
-            verification_link = f"{FRONTEND_URL}/verify/{uid}/{token}"
-                        
+                # Build verification URL (one correct way)
 
+                FRONTEND_URL = getattr(settings, "FRONTEND_URL")
+                verification_link = f"{FRONTEND_URL}/verify/{uid}/{token}"
 
-            # Send email
-            send_mail(
-                subject="Verify your Blood Bank account",
-                message=f"Hi {user.username},\n\nClick the link below to verify your account:\n{verification_link}",
-                from_email=settings.EMAIL_HOST_USER,
-                recipient_list=[user.email],
-                fail_silently=False,
-            )
+                # Queue the email, send_outbox_emails delivers it
+                queue_email(
+                    subject="Verify your Blood Bank account",
+                    message=f"Hi {user.username},\n\nClick the link below to verify your account:\n{verification_link}",
+                    recipient=user.email,
+                    from_email=settings.EMAIL_HOST_USER,
+                )
 
             return Response(
                 {"message": "User registered. Please check your email to verify your account."},
@@ -86,8 +144,17 @@ class CurrentUserView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        serializer = UserSerializer(request.user)
-        return Response(serializer.data)
+        user = get_full_user(request.user)
+        # No timestamp on users; the ETag covers the serialized fields and roles
+        etag = make_etag(
+            'me', user.pk, user.username, user.email, user.first_name, user.last_name,
+            user.date_joined, get_user_roles(user),
+        )
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+        serializer = UserSerializer(user)
+        return set_validators(Response(serializer.data), etag)
 
 
 class LogoutView(APIView):
@@ -96,7 +163,7 @@ class LogoutView(APIView):
     def post(self, request):
         try:
             refresh_token = request.data["refresh"]
-            token = RefreshToken(refresh_token)
+            token = FilteredRefreshToken(refresh_token)
             token.blacklist()
             return Response({"detail": "Successfully logged out."}, status=status.HTTP_205_RESET_CONTENT)
         except Exception as e:
@@ -106,6 +173,7 @@ class LogoutView(APIView):
 # Custom Token Obtain Pair View to handle email/username login
 class CustomTokenObtainPairView(TokenObtainPairView):
     serializer_class = CustomTokenObtainPairSerializer
+    throttle_classes = [LoginIPThrottle, LoginAccountThrottle]
 
 
 
@@ -115,9 +183,17 @@ class ProfileView(APIView):
     def get(self, request):
         """Get current user's profile"""
         try:
-            profile = request.user.profile
+            profile = Profile.objects.select_related('user').get(user_id=request.user.pk)
+            user = profile.user
+            etag = make_etag(
+                'profile', profile.pk, profile.updated_at,
+                user.username, user.email, user.first_name, user.last_name, get_user_roles(user),
+            )
+            response = not_modified(request, etag, profile.updated_at)
+            if response is not None:
+                return response
             serializer = ProfileSerializer(profile)
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            return set_validators(Response(serializer.data, status=status.HTTP_200_OK), etag, profile.updated_at)
         except Profile.DoesNotExist:
             return Response(
                 {"message": "Profile not found. Please create your profile."},
@@ -128,7 +204,7 @@ class ProfileView(APIView):
         """Create user profile"""
         try:
             # Check if profile already exists
-            if hasattr(request.user, 'profile'):
+            if Profile.objects.filter(user_id=request.user.pk).exists():
                 return Response(
                     {"message": "Profile already exists. Use PUT to update."},
                     status=status.HTTP_400_BAD_REQUEST
@@ -136,7 +212,7 @@ class ProfileView(APIView):
             
             serializer = ProfileSerializer(data=request.data)
             if serializer.is_valid():
-                serializer.save(user=request.user)
+                serializer.save(user_id=request.user.pk)
                 return Response(serializer.data, status=status.HTTP_201_CREATED)
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
@@ -148,7 +224,7 @@ class ProfileView(APIView):
     def put(self, request):
         """Update user profile"""
         try:
-            profile = request.user.profile
+            profile = Profile.objects.select_related('user').get(user_id=request.user.pk)
             serializer = ProfileSerializer(profile, data=request.data, partial=True)
             if serializer.is_valid():
                 serializer.save()
@@ -163,17 +239,22 @@ class ProfileView(APIView):
 
 
 
-class BloodRequestViewSet(ModelViewSet):
+class BloodRequestViewSet(SparseFieldsMixin, ConditionalGetMixin, ModelViewSet):
     """
     ViewSet for managing blood requests
     """
     serializer_class = BloodRequestSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
+    # requester_name comes from the requester's profile
+    version_fields = ('updated_at', 'requester__profile__updated_at')
+    # List rows are rendered from values(), see accounts/projections.py
+    projection = BLOOD_REQUEST_PROJECTION
     
     def get_queryset(self):
         """Filter queryset based on user role and query params"""
         user = self.request.user
-        queryset = BloodRequest.objects.all()
+        queryset = BloodRequest.objects.select_related('requester__profile')
         
         # Filter by status if provided
         status_filter = self.request.query_params.get('status', None)
@@ -193,22 +274,44 @@ class BloodRequestViewSet(ModelViewSet):
         # If user is requesting their own requests
         my_requests = self.request.query_params.get('my_requests', None)
         if my_requests:
-            queryset = queryset.filter(requester=user)
+            queryset = queryset.filter(requester_id=user.pk)
+        
+        # Writes read the row locked, so a concurrent pledge cannot slip in between
+        if self.action in ('update', 'partial_update', 'cancel_request'):
+            queryset = queryset.select_for_update(of=('self',))
         
-        return queryset.order_by('-created_at')
+        return queryset.order_by('-created_at', '-id')
     
     def perform_create(self, serializer):
         """Set requester to current user when creating"""
-        serializer.save(requester=self.request.user)
+        blood_request = serializer.save(requester_id=self.request.user.pk)
+        publish_request_event('created', blood_request)
+    
+    def update(self, request, *args, **kwargs):
+        with transaction.atomic():
+            return super().update(request, *args, **kwargs)
+    
+    def perform_update(self, serializer):
+        """Keep the status in step with units_needed: reopen a request that has free units again"""
+        instance = serializer.instance
+        units_needed = serializer.validated_data.get('units_needed', instance.units_needed)
+        extra = {}
+        if instance.status == 'accepted' and units_needed > instance.units_pledged:
+            extra['status'] = 'pending'
+        elif instance.status == 'pending' and units_needed <= instance.units_pledged:
+            extra['status'] = 'accepted'
+        blood_request = serializer.save(**extra)
+        if extra.get('status') == 'pending':
+            publish_request_event('reopened', blood_request)
     
     @action(detail=True, methods=['post'])
     def accept_request(self, request, pk=None):
-        """Accept a blood donation request"""
+        """Pledge units (default 1) of a blood donation request"""
         blood_request = self.get_object()
         user = request.user
         
         # Check if user is a donor
-        if not user.groups.filter(name='Donor').exists():
+        if not is_donor(user):
             return Response(
                 {
                     'error': 'You need to be a blood donor to accept requests',
@@ -220,8 +323,8 @@ class BloodRequestViewSet(ModelViewSet):
         
         # Check if user has a profile and is available
         try:
-            profile = user.profile
-            if not profile.is_available_for_donation:
+            profile = Profile.objects.get(user_id=user.pk)
+            if not profile.is_eligible():
                 return Response(
                     {'error': 'You can only donate once every 56 days'}, 
                     status=status.HTTP_400_BAD_REQUEST
@@ -232,113 +335,239 @@ class BloodRequestViewSet(ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Check if request is still pending
-        if blood_request.status != 'pending':
+        try:
+            units = int(request.data.get('units', 1))
+        except (TypeError, ValueError):
+            units = 0
+        if units < 1:
             return Response(
-                {'error': 'This request is no longer available'}, 
+                {'error': 'units must be a positive number'},
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Create donation history entry
-        donation_history = DonationHistory.objects.create(
-            donor=user,
-            recipient=blood_request.requester,
-            blood_request=blood_request,
-            units_donated=blood_request.units_needed,
-            status='pending'
-        )
+        # Conditional update, so concurrent donors can never over-allocate the request
+        try:
+            donation_history = pledge_units(blood_request, user.pk, units)
+        except PledgeError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Update blood request status
-        blood_request.status = 'accepted'
-        blood_request.save()
+        blood_request.refresh_from_db(fields=['status', 'units_pledged'])
+        publish_request_event('accepted', blood_request)
         
         return Response({
             'message': 'Blood request accepted successfully',
-            'donation_id': donation_history.id
+            'donation_id': donation_history.id,
+            'units_pledged': donation_history.units_donated
         }, status=status.HTTP_200_OK)
     
     @action(detail=True, methods=['post'])
     def cancel_request(self, request, pk=None):
         """Cancel a blood request (only by requester)"""
-        blood_request = self.get_object()
+        with transaction.atomic():
+            blood_request = self.get_object()
+            
+            if blood_request.requester_id != request.user.pk:
+                return Response(
+                    {'error': 'You can only cancel your own requests'}, 
+                    status=status.HTTP_403_FORBIDDEN
+                )
+            
+            if blood_request.status == 'completed':
+                return Response(
+                    {'error': 'Cannot cancel completed requests'}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            # The request and its pending donations together, as batch_cancel does
+            cancel_requests([blood_request])
+            publish_request_event('canceled', blood_request)
         
-        if blood_request.requester != request.user:
+        return Response({'message': 'Request canceled successfully'})
+    
+    @action(detail=False, methods=['post'])
+    def batch_create(self, request):
+        """Create many requests in one transaction, reporting errors per item"""
+        items = request.data.get('requests') if hasattr(request.data, 'get') else request.data
+        if not isinstance(items, list) or not 0 < len(items) <= MAX_BATCH_SIZE:
             return Response(
-                {'error': 'You can only cancel your own requests'}, 
-                status=status.HTTP_403_FORBIDDEN
+                {'error': f'requests must be a list of 1 to {MAX_BATCH_SIZE} blood requests'},
+                status=status.HTTP_400_BAD_REQUEST
             )
         
-        if blood_request.status == 'completed':
+        # One serializer validates every item, the same rules as a single create
+        serializer = self.get_serializer()
+        blood_requests, indexes, errors = [], [], []
+        for index, item in enumerate(items):
+            try:
+                data = serializer.run_validation(item)
+            except ValidationError as e:
+                errors.append({'index': index, 'errors': e.detail})
+                continue
+            blood_request = BloodRequest(requester_id=request.user.pk, **data)
+            blood_request.update_derived_fields()
+            blood_requests.append(blood_request)
+            indexes.append(index)
+        
+        if blood_requests:
+            with transaction.atomic():
+                BloodRequest.objects.bulk_create(blood_requests)
+                # bulk_create sends no post_save, so nothing else clears the dashboard numbers
+                transaction.on_commit(invalidate_global_stats)
+                for blood_request in blood_requests:
+                    publish_request_event('created', blood_request)
+        
+        return Response(
+            {
+                'created': [{'index': index, 'id': br.id} for index, br in zip(indexes, blood_requests)],
+                'errors': errors,
+            },
+            status=status.HTTP_201_CREATED if blood_requests else status.HTTP_400_BAD_REQUEST
+        )
+    
+    @action(detail=False, methods=['post'])
+    def batch_cancel(self, request):
+        """Cancel many of your own requests, body ``{"ids": [...]}``"""
+        ids = _batch_ids(request)
+        if ids is None:
+            return _invalid_batch()
+        
+        errors = []
+        with transaction.atomic():
+            found = BloodRequest.objects.select_for_update().in_bulk(ids)
+            to_cancel = []
+            for pk in ids:
+                blood_request = found.get(pk)
+                if blood_request is None:
+                    errors.append({'id': pk, 'error': 'Not found'})
+                elif blood_request.requester_id != request.user.pk:
+                    errors.append({'id': pk, 'error': 'You can only cancel your own requests'})
+                elif blood_request.status == 'completed':
+                    errors.append({'id': pk, 'error': 'Cannot cancel completed requests'})
+                else:
+                    to_cancel.append(blood_request)
+            cancel_requests(to_cancel)
+            for blood_request in to_cancel:
+                publish_request_event('canceled', blood_request)
+        
+        return Response({'canceled': [br.pk for br in to_cancel], 'errors': errors})
+    
+    @action(detail=False, methods=['get'])
+    def triage(self, request):
+        """Pending requests in triage order, paged straight off the triage index"""
+        paginator = TriagePagination()
+        queryset = self.project(
+            BloodRequest.objects.filter(status='pending'),
+            extra=[name.lstrip('-') for name in paginator.ordering],
+        )
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        return paginator.get_paginated_response(self.render_rows(page))
+    
+    @action(detail=True, methods=['get'])
+    def matching_donors(self, request, pk=None):
+        """Available donors compatible with this request, best matches first"""
+        blood_request = self.get_object()
+        
+        queryset = compatible_donors(
+            Profile.objects.eligible(),
+            blood_request.blood_group
+        )
+        donors = queryset.select_related('user').values(*DONOR_PUBLIC_FIELDS)
+        
+        return Response({'donors': list(donors)})
+    
+    @action(detail=True, methods=['get'])
+    def nearest_donors(self, request, pk=None):
+        """The k nearest available compatible donors to the request's hospital"""
+        blood_request = self.get_object()
+        
+        if blood_request.latitude is None:
             return Response(
-                {'error': 'Cannot cancel completed requests'}, 
+                {'error': 'Could not determine the hospital location from its address'},
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        blood_request.status = 'canceled'
-        blood_request.save()
+        try:
+            k = min(max(int(request.query_params.get('k', 10)), 1), 100)
+        except ValueError:
+            return Response({'error': 'k must be a number'}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Cancel related donation histories
-        DonationHistory.objects.filter(
-            blood_request=blood_request,
-            status='pending'
-        ).update(status='canceled')
+        queryset = Profile.objects.eligible().filter(
+            blood_group__in=DONORS_FOR_RECIPIENT[blood_request.blood_group]
+        )
+        donors = nearest(
+            queryset, blood_request.latitude, blood_request.longitude, k, DONOR_PUBLIC_FIELDS
+        )
+        for donor in donors:
+            donor.pop('latitude')
+            donor.pop('longitude')
+            donor['distance_km'] = round(donor['distance_km'], 2)
         
-        return Response({'message': 'Request canceled successfully'})
+        return Response({'donors': donors})
 
-class DonationHistoryViewSet(ModelViewSet):
+class DonationHistoryViewSet(SparseFieldsMixin, ConditionalGetMixin, ModelViewSet):
     """
     ViewSet for managing donation history
     """
     serializer_class = DonationHistorySerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
     http_method_names = ['get', 'post', 'patch']  # No delete allowed
+    version_fields = (
+        'updated_at', 'blood_request__updated_at',
+        'donor__profile__updated_at', 'recipient__profile__updated_at',
+    )
     
     def get_queryset(self):
         """Filter donation history for current user"""
         user = self.request.user
         queryset = DonationHistory.objects.filter(
-            Q(donor=user) | Q(recipient=user)
-        ).select_related('donor', 'recipient', 'blood_request')
+            Q(donor_id=user.pk) | Q(recipient_id=user.pk)
+        ).select_related('donor__profile', 'recipient__profile', 'blood_request')
         
         # Filter by role
         role = self.request.query_params.get('role', None)
         if role == 'donor':
-            queryset = queryset.filter(donor=user)
+            queryset = queryset.filter(donor_id=user.pk)
         elif role == 'recipient':
-            queryset = queryset.filter(recipient=user)
+            queryset = queryset.filter(recipient_id=user.pk)
             
-        return queryset.order_by('-created_at')
+        return queryset.order_by('-created_at', '-id')
     
     @action(detail=True, methods=['post'])
     def confirm_donation(self, request, pk=None):
         """Confirm a donation (by recipient)"""
         donation = self.get_object()
         
-        if donation.recipient != request.user:
+        if donation.recipient_id != request.user.pk:
             return Response(
                 {'error': 'Only the recipient can confirm donations'}, 
                 status=status.HTTP_403_FORBIDDEN
             )
         
-        if donation.status != 'pending':
-            return Response(
-                {'error': 'This donation cannot be confirmed'}, 
-                status=status.HTTP_400_BAD_REQUEST
+        # The donation, its request and the donor's waiting period move together
+        with transaction.atomic():
+            # Conditional, so a double submit confirms only once
+            confirmed = DonationHistory.objects.filter(pk=donation.pk, status='pending').update(
+                status='confirmed',
+                donation_date=timezone.now(),
+                updated_at=timezone.now()
             )
-        
-        donation.status = 'confirmed'
-        donation.donation_date = date.today()
-        donation.save()
-        
-        # Update blood request status
-        donation.blood_request.status = 'completed'
-        donation.blood_request.save()
-        
-        # Update donor's last donation date and availability
-        donor_profile = donation.donor.profile
-        donor_profile.last_donation_date = date.today()
-        donor_profile.is_available_for_donation = False  # Will be available after 56 days
-        donor_profile.save()
+            if not confirmed:
+                return Response(
+                    {'error': 'This donation cannot be confirmed'}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            # The request is completed once confirmed donations cover every unit
+            if complete_if_fulfilled(donation.blood_request_id):
+                donation.blood_request.refresh_from_db(fields=['status', 'units_pledged'])
+                publish_request_event('completed', donation.blood_request)
+            
+            # Update donor's last donation date and availability
+            donor_profile = donation.donor.profile
+            donor_profile.last_donation_date = date.today()
+            donor_profile.is_available_for_donation = False  # refresh_donor_eligibility turns it back on after 56 days
+            donor_profile.save()
         
         return Response({'message': 'Donation confirmed successfully'})
     
@@ -348,32 +577,78 @@ class DonationHistoryViewSet(ModelViewSet):
         donation = self.get_object()
         
         # Only donor or recipient can cancel
-        if donation.donor != request.user and donation.recipient != request.user:
+        if request.user.pk not in (donation.donor_id, donation.recipient_id):
             return Response(
                 {'error': 'You cannot cancel this donation'}, 
                 status=status.HTTP_403_FORBIDDEN
             )
         
-        if donation.status not in ['pending', 'confirmed']:
+        # Hands the units back, the request goes back to pending for other donors
+        if donation.status not in ['pending', 'confirmed'] or not release_units(donation):
             return Response(
                 {'error': 'This donation cannot be canceled'}, 
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        donation.status = 'canceled'
-        donation.save()
+        donation.blood_request.refresh_from_db(fields=['status', 'units_pledged'])
+        if donation.blood_request.status == 'pending':
+            publish_request_event('reopened', donation.blood_request)
         
-        # Reset blood request to pending if no other accepted donations
-        other_donations = DonationHistory.objects.filter(
-            blood_request=donation.blood_request,
-            status__in=['pending', 'confirmed']
-        ).exclude(id=donation.id)
+        return Response({'message': 'Donation canceled successfully'})
+    
+    def _lock_batch(self, ids):
+        # Only donations this user can see, locked until the transaction ends
+        return self.get_queryset().order_by().select_for_update(of=('self',)).in_bulk(ids)
+    
+    @action(detail=False, methods=['post'])
+    def batch_confirm(self, request):
+        """Confirm many donations (by recipient), body ``{"ids": [...]}``"""
+        ids = _batch_ids(request)
+        if ids is None:
+            return _invalid_batch()
         
-        if not other_donations.exists():
-            donation.blood_request.status = 'pending'
-            donation.blood_request.save()
+        errors = []
+        with transaction.atomic():
+            found = self._lock_batch(ids)
+            to_confirm = []
+            for pk in ids:
+                donation = found.get(pk)
+                if donation is None:
+                    errors.append({'id': pk, 'error': 'Not found'})
+                elif donation.recipient_id != request.user.pk:
+                    errors.append({'id': pk, 'error': 'Only the recipient can confirm donations'})
+                elif donation.status != 'pending':
+                    errors.append({'id': pk, 'error': 'This donation cannot be confirmed'})
+                else:
+                    to_confirm.append(donation)
+            for blood_request in confirm_donations(to_confirm):
+                publish_request_event('completed', blood_request)
         
-        return Response({'message': 'Donation canceled successfully'})
+        return Response({'confirmed': [d.pk for d in to_confirm], 'errors': errors})
+    
+    @action(detail=False, methods=['post'])
+    def batch_cancel(self, request):
+        """Cancel many donations, body ``{"ids": [...]}``"""
+        ids = _batch_ids(request)
+        if ids is None:
+            return _invalid_batch()
+        
+        errors = []
+        with transaction.atomic():
+            found = self._lock_batch(ids)
+            to_cancel = []
+            for pk in ids:
+                donation = found.get(pk)
+                if donation is None:
+                    errors.append({'id': pk, 'error': 'Not found'})
+                elif donation.status not in ['pending', 'confirmed']:
+                    errors.append({'id': pk, 'error': 'This donation cannot be canceled'})
+                else:
+                    to_cancel.append(donation)
+            for blood_request in release_donations(to_cancel):
+                publish_request_event('reopened', blood_request)
+        
+        return Response({'canceled': [d.pk for d in to_cancel], 'errors': errors})
 
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
@@ -381,45 +656,21 @@ def dashboard_stats(request):
     """Get dashboard statistics for the current user"""
     user = request.user
     
-    stats = {
-        'total_requests': 0,
-        'pending_requests': 0,
-        'completed_requests': 0,
-        'total_donations': 0,
-        'pending_donations': 0,
-        'completed_donations': 0,
-        'available_donors_count': 0,
-        'urgent_requests_count': 0
-    }
-    
-    # User's blood requests statistics
-    user_requests = BloodRequest.objects.filter(requester=user)
-    stats['total_requests'] = user_requests.count()
-    stats['pending_requests'] = user_requests.filter(status='pending').count()
-    stats['completed_requests'] = user_requests.filter(status='completed').count()
-    
-    # User's donations statistics
-    user_donations = DonationHistory.objects.filter(donor=user)
-    stats['total_donations'] = user_donations.count()
-    stats['pending_donations'] = user_donations.filter(status='pending').count()
-    stats['completed_donations'] = user_donations.filter(status='confirmed').count()
-    
-    # Global statistics (for context)
-    stats['available_donors_count'] = Profile.objects.filter(is_available_for_donation=True).count()
-    stats['urgent_requests_count'] = BloodRequest.objects.filter(
-        status='pending',
-        urgency__in=['high', 'critical']
-    ).count()
+    stats = get_user_stats(user)
+    
+    # Global statistics (for context), shared through the cache
+    global_stats = get_global_stats()
+    stats['available_donors_count'] = global_stats['available_donors_count']
+    stats['urgent_requests_count'] = global_stats['urgent_requests_count']
     
     # Recent activity
-    recent_requests = BloodRequestSerializer(
-        BloodRequest.objects.filter(status='pending').order_by('-created_at')[:5],
-        many=True
-    ).data
+    recent_requests = global_stats['recent_requests']
     
     recent_donations = DonationHistorySerializer(
         DonationHistory.objects.filter(
-            Q(donor=user) | Q(recipient=user)
+            Q(donor_id=user.pk) | Q(recipient_id=user.pk)
+        ).select_related(
+            'donor__profile', 'recipient__profile', 'blood_request'
         ).order_by('-created_at')[:5],
         many=True
     ).data
@@ -435,27 +686,159 @@ def dashboard_stats(request):
 def available_donors(request):
     """Get list of available donors (public endpoint)"""
     blood_group = request.query_params.get('blood_group', None)
+    compatible_with = request.query_params.get('compatible_with', None)
     location = request.query_params.get('location', None)
     
-    # Base queryset - available donors
-    queryset = Profile.objects.filter(is_available_for_donation=True)
-    
-    # Filter by blood group
-    if blood_group:
-        queryset = queryset.filter(blood_group=blood_group)
-    
-    # Filter by location (contains search)
-    if location:
-        queryset = queryset.filter(address__icontains=location)
-    
-    # Select related user and limit fields for privacy
-    donors = queryset.select_related('user').values(
-        'id',
-        'full_name',
-        'blood_group',
-        'address',
-        'user__username',
-        'last_donation_date'
-    )
+    blood_group = normalize_blood_group(blood_group) if blood_group else None
+    recipient_group = normalize_blood_group(compatible_with) if compatible_with else None
+    if compatible_with and recipient_group not in DONORS_FOR_RECIPIENT:
+        return Response(
+            {'error': 'Invalid blood group'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    def build():
+        # Base queryset - available donors past their waiting period
+        queryset = Profile.objects.eligible()
+        
+        # Filter by blood group
+        if blood_group:
+            queryset = queryset.filter(blood_group=blood_group)
+        
+        # Every donor group that can give to the recipient, exact matches first
+        if recipient_group:
+            queryset = compatible_donors(queryset, recipient_group)
+        
+        # Filter by location (indexed word-prefix search)
+        if location:
+            queryset = search_address(queryset, location)
+        
+        # Select related user and limit fields for privacy
+        return list(queryset.select_related('user').values(*DONOR_PUBLIC_FIELDS))
+    
+    # Served from the cache until a donor these filters could return changes
+    donors = get_available_donors(build, blood_group, recipient_group, location)
+    return Response({'donors': donors})
+
+
+def _export_response(request, name):
+    """Stream an export as CSV (default) or NDJSON, admins only. ?status=, ?since= and ?until= narrow it"""
+    if not is_admin(request.user):
+        return Response(
+            {'error': 'Only admins can export data'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+    
+    # Not ?format=, DRF keeps that one for content negotiation
+    output = request.query_params.get('output', 'csv')
+    if output not in CONTENT_TYPES:
+        return Response(
+            {'error': f"output must be one of: {', '.join(CONTENT_TYPES)}"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    try:
+        filters = export_filters(
+            name,
+            status=request.query_params.get('status'),
+            since=request.query_params.get('since'),
+            until=request.query_params.get('until'),
+        )
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    response = StreamingHttpResponse(stream_export(name, output, filters=filters), content_type=CONTENT_TYPES[output])
+    response['Content-Disposition'] = f'attachment; filename="{name}-{date.today():%Y%m%d}.{output}"'
+    return response
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def export_donation_history(request):
+    """Full donation history export for auditors"""
+    return _export_response(request, 'donations')
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def export_blood_requests(request):
+    """Full blood request export for auditors"""
+    return _export_response(request, 'requests')
+
+
+# Seconds between comment lines that keep proxies from closing an idle stream
+EVENT_KEEPALIVE_SECONDS = 15
+
+def _authenticate_stream(request):
+    """User from ?token= (EventSource cannot send headers) or the Authorization header"""
+    raw_token = request.GET.get('token')
+    if not raw_token:
+        header = request.headers.get('Authorization', '').split()
+        if len(header) == 2 and header[0] == 'Bearer':
+            raw_token = header[1]
+    if not raw_token:
+        return None
+    
+    authentication = StatelessJWTAuthentication()
+    try:
+        return authentication.get_user(authentication.get_validated_token(raw_token))
+    except (InvalidToken, AuthenticationFailed):
+        return None
+
+async def request_events(request):
+    """
+    Server-Sent Events stream of blood request changes for the current user.
+    
+    Sends requests a donor of ``?blood_group=`` (default: the user's profile)
+    can give to, plus every change to the user's own requests. ``?urgent=1``
+    keeps only high and critical ones. Needs an ASGI server (backend.asgi).
+    """
+    user = _authenticate_stream(request)
+    if user is None:
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+    
+    blood_group = normalize_blood_group(request.GET.get('blood_group'))
+    if blood_group is None:
+        blood_group = await Profile.objects.filter(user_id=user.pk).values_list('blood_group', flat=True).afirst()
+    if blood_group is not None and blood_group not in RECIPIENTS_FOR_DONOR:
+        return JsonResponse({'error': 'Invalid blood group'}, status=400)
+    
+    # Users without a blood group see everything
+    groups = set(RECIPIENTS_FOR_DONOR[blood_group]) if blood_group else set(BLOOD_GROUPS)
+    urgencies = {'high', 'critical'} if request.GET.get('urgent') in ('1', 'true') else None
+    
+    def wanted(event):
+        blood_request = event['request']
+        if blood_request['requester_id'] == user.pk:
+            return True
+        return blood_request['blood_group'] in groups and (
+            urgencies is None or blood_request['urgency'] in urgencies
+        )
+    
+    subscription = get_broker().subscribe()
+    
+    async def stream():
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscription.get(), EVENT_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ': keepalive\n\n'
+                    continue
+                if wanted(event):
+                    yield f"event: {event['type']}\ndata: {json.dumps(event['request'])}\n\n"
+        finally:
+            # Also runs when the client disconnects and the server cancels us
+            subscription.close()
     
-    return Response({'donors': list(donors)})
\ No newline at end of file
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def metrics(request):
+    """Prometheus scrape endpoint, merged across worker processes"""
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if token and not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponse(status=401)
+    return HttpResponse(render_prometheus(collect()), content_type='text/plain; version=0.0.4; charset=utf-8')
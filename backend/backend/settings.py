@@ -56,6 +56,7 @@ INSTALLED_APPS = [
 
 # --- Middleware (corsheaders BEFORE CommonMiddleware) ---
 MIDDLEWARE = [
+    "accounts.metrics.MetricsMiddleware",  # first, so its timings cover everything below
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -91,9 +92,31 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        # WAL lets readers run during writes; IMMEDIATE takes the write lock at
+        # BEGIN so concurrent accepts queue up instead of failing to upgrade
+        "OPTIONS": {
+            "init_command": "PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;",
+            "transaction_mode": "IMMEDIATE",
+            "timeout": 20,
+        },
     }
 }
 
+# --- Cache: in-process by default, set CACHE_URL to share it between workers ---
+# With the in-process default, role lookups are only cached for a few seconds
+# (see accounts/utils.py), so role changes reach every worker quickly
+CACHES = {
+    "default": env.cache("CACHE_URL", default="locmemcache://"),
+}
+
+# --- Live request events: in-process pub/sub, swap for a shared broker with several workers ---
+EVENTS_BROKER = "accounts.events.LocalBroker"
+
+# Request metrics at /metrics. Multi-process servers need a shared METRICS_DIR
+# (cleared on deploy); METRICS_TOKEN makes the endpoint require a bearer token.
+METRICS_DIR = env("METRICS_DIR", default=None)
+METRICS_TOKEN = env("METRICS_TOKEN", default=None)
+
 # (Optional) MySQL config for later:
 # DATABASES = {
 #     "default": {
@@ -125,19 +148,24 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 # --- DRF + JWT ---
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "accounts.authentication.StatelessJWTAuthentication",  # user from token claims, no per-request SELECT
     ),
     "DEFAULT_PERMISSION_CLASSES": (
         "rest_framework.permissions.AllowAny",
     ),
+    # Token buckets on login / register, see accounts/throttling.py
+    "DEFAULT_THROTTLE_RATES": {
+        "login_ip": env("THROTTLE_LOGIN_IP", default="20/min"),
+        "login_account": env("THROTTLE_LOGIN_ACCOUNT", default="5/min"),
+        "register_ip": env("THROTTLE_REGISTER_IP", default="10/hour"),
+    },
 }
 
 # --- Custom User Model ---
 AUTH_USER_MODEL = "accounts.User"
 
 AUTHENTICATION_BACKENDS = [
-    "accounts.backends.EmailOrUsernameModelBackend",  # custom backend
-    "django.contrib.auth.backends.ModelBackend",      # default
+    "accounts.backends.EmailOrUsernameModelBackend",  # custom backend, handles email too so no ModelBackend fallback
 ]
 
 
@@ -149,6 +177,8 @@ SIMPLE_JWT = {
     "ROTATE_REFRESH_TOKENS": True,
     "BLACKLIST_AFTER_ROTATION": True,
     "UPDATE_LAST_LOGIN": True,
+    # Refresh checks the blacklist through an in-memory Bloom filter first
+    "TOKEN_REFRESH_SERIALIZER": "accounts.blacklist.FilteredTokenRefreshSerializer",
 }
 
 # --- CORS (frontend at Vite default port) ---